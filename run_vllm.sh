@@ -1,14 +1,30 @@
+# select_eeve.py 가 고른 compiled model과 vLLM 설정 (없으면 batch1_max4096)
+LAUNCH_ENV=${LAUNCH_ENV:-models/vllm_launch.env}
+[ -f "$LAUNCH_ENV" ] && . "$LAUNCH_ENV"
+VLLM_MODEL_DIR=${VLLM_MODEL_DIR:-models/rbln_vllm_EEVE-Korean-Instruct-10.8B-v1.0_npu8_batch1_max4096}
+VLLM_MAX_NUM_SEQS=${VLLM_MAX_NUM_SEQS:-1}
+VLLM_MAX_MODEL_LEN=${VLLM_MAX_MODEL_LEN:-4096}
+VLLM_MAX_NUM_BATCHED_TOKENS=${VLLM_MAX_NUM_BATCHED_TOKENS:-$VLLM_MAX_MODEL_LEN}
+VLLM_BLOCK_SIZE=${VLLM_BLOCK_SIZE:-$VLLM_MAX_MODEL_LEN}
+
+# --enable-prefix-caching: main.py의 prefix_stable prompt layout(기본값)으로 같은 대화의 이전 turn은
+# 매 요청 같은 prefix가 되어 KV cache가 재사용됨 (꽉 찬 block 단위로만 재사용되므로 compile_eeve.py --kvcache_partition_len 으로
+# 작은 block을 가진 compiled model에서만 효과가 있음)
+PREFIX_CACHING=""
+[ "${VLLM_PREFIX_CACHING:-1}" = "1" ] && PREFIX_CACHING="--enable-prefix-caching"
+
 nohup python -m vllm.entrypoints.openai.api_server \
-             --model models/rbln_vllm_EEVE-Korean-Instruct-10.8B-v1.0_npu8_batch1_max4096 \
-             --compiled-model-dir models/rbln_vllm_EEVE-Korean-Instruct-10.8B-v1.0_npu8_batch1_max4096 \
+             --model $VLLM_MODEL_DIR \
+             --compiled-model-dir $VLLM_MODEL_DIR \
              --dtype auto \
              --device rbln \
-             --max-num-seqs 1 \
-             --max-num-batched-tokens 4096 \
-             --max-model-len 4096 \
-             --block-size 4096 \
+             --max-num-seqs $VLLM_MAX_NUM_SEQS \
+             --max-num-batched-tokens $VLLM_MAX_NUM_BATCHED_TOKENS \
+             --max-model-len $VLLM_MAX_MODEL_LEN \
+             --block-size $VLLM_BLOCK_SIZE \
+             $PREFIX_CACHING \
              --api-key byeonhophd_backend_980518 \
              &
 
 
-python src/main.py
\ No newline at end of file
+python src/main.py --llm_model $VLLM_MODEL_DIR --max_concurrency $VLLM_MAX_NUM_SEQS
@@ -1,6 +1,19 @@
 import os
 import argparse
-from optimum.rbln import RBLNXLMRobertaModel
+import shutil
+from huggingface_hub import hf_hub_download
+from huggingface_hub.utils import EntryNotFoundError
+
+def compiled_model_dir(output_dir, model_id, batch_size, max_seq_len):
+    """
+    Directory a compiled variant is saved to, e.g. models/rbln_bge-m3_batch1_max8192
+    """
+    return os.path.join(
+        output_dir,
+        f"rbln_{os.path.basename(model_id)}"
+        f"_batch{batch_size}"
+        f"_max{max_seq_len}",
+    )
 
 def parse_arguments():
     """
@@ -36,16 +49,14 @@ def parse_arguments():
     return parser.parse_args()
 
 def main():
+    # Only needed to compile; compiled_model_dir is also used on machines without the NPU SDK
+    from optimum.rbln import RBLNXLMRobertaModel
+
     args = parse_arguments()
     model_id = args.model_id
 
     # Constructing the output directory name
-    model_save_dir = os.path.join(
-        args.output_dir,
-        f"rbln_{os.path.basename(model_id)}"
-        f"_batch{args.batch_size}"
-        f"_max{args.max_seq_len}",
-    )
+    model_save_dir = compiled_model_dir(args.output_dir, model_id, args.batch_size, args.max_seq_len)
     print(f"Saving compiled model to {model_save_dir}")
     os.makedirs(model_save_dir, exist_ok=True)
 
@@ -62,5 +73,13 @@ def main():
     print(f"Saving compiled model to {model_save_dir}")
     model.save_pretrained(model_save_dir)
 
+    # The sparse (lexical) head runs on CPU over the compiled model's hidden states
+    try:
+        sparse_linear_path = hf_hub_download(repo_id=model_id, filename="sparse_linear.pt")
+        shutil.copy(sparse_linear_path, os.path.join(model_save_dir, "sparse_linear.pt"))
+        print(f"Copied sparse_linear.pt to {model_save_dir}")
+    except EntryNotFoundError:
+        print(f"{model_id} has no sparse_linear.pt, sparse embeddings will not be available")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,6 +1,67 @@
 import os
 import argparse
-from optimum.rbln import RBLNLlamaForCausalLM
+import json
+import time
+import traceback
+
+# Written next to the compiled models, one entry per artifact (see select_eeve.py)
+MANIFEST_NAME = "rbln_vllm_manifest.json"
+
+
+def compiled_model_dir(output_dir, model_name, tensor_parallel_size, batch_size, max_seq_len, kvcache_partition_len=None):
+    """
+    Directory a compiled variant is saved to, e.g. models/rbln_vllm_EEVE-Korean-Instruct-10.8B-v1.0_npu8_batch1_max4096,
+    with a _part<N> suffix for flash attention over KV cache partitions of N tokens
+    """
+    return os.path.join(
+        output_dir,
+        f"rbln_vllm_{model_name}"
+        f"_npu{tensor_parallel_size}"
+        f"_batch{batch_size}"
+        f"_max{max_seq_len}"
+        + (f"_part{kvcache_partition_len}" if kvcache_partition_len else ""),
+    )
+
+
+def kvcache_partition_error(max_seq_len, kvcache_partition_len):
+    """
+    Why a partition length cannot be compiled with max_seq_len, or None if it can.
+    Flash attention needs the context to be a whole number (>= 2) of partitions.
+    """
+    if kvcache_partition_len is None:
+        return None
+    if kvcache_partition_len >= max_seq_len:
+        return f"partition {kvcache_partition_len} is not smaller than max_seq_len {max_seq_len}"
+    if max_seq_len % kvcache_partition_len:
+        return f"max_seq_len {max_seq_len} is not a multiple of partition {kvcache_partition_len}"
+    return None
+
+
+def load_manifest(output_dir):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"artifacts": []}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(output_dir, manifest):
+    # 중간에 중단되어도 manifest가 깨지지 않도록 임시 파일에 쓴 뒤 교체
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def update_manifest(output_dir, entry):
+    """
+    Adds or replaces the manifest entry of entry["model_dir"].
+    """
+    manifest = load_manifest(output_dir)
+    manifest["artifacts"] = [
+        artifact for artifact in manifest["artifacts"] if artifact["model_dir"] != entry["model_dir"]
+    ] + [entry]
+    save_manifest(output_dir, manifest)
 
 
 def parsing_argument():
@@ -25,14 +86,24 @@ def parsing_argument():
     parser.add_argument(
         "--batch_size",
         type=int,
-        default=1,
-        help="(int) batch size for model export, default: 1",
+        nargs="+",
+        default=[1],
+        help="(int) batch sizes for model export, one artifact per batch size and sequence length, default: 1",
     )
     parser.add_argument(
         "--max_seq_len",
         type=int,
-        default=4096,
-        help="(int) maximum sequence length for model export, default: 4096",
+        nargs="+",
+        default=[4096],
+        help="(int) maximum sequence lengths for model export, default: 4096",
+    )
+    parser.add_argument(
+        "--kvcache_partition_len",
+        type=int,
+        nargs="+",
+        default=[0],
+        help="(int) KV cache partition lengths for flash attention, also the vLLM block size and so the unit "
+             "prefix caching reuses; 0 compiles without partitions (one block per context), default: 0",
     )
     parser.add_argument(
         "--output_dir",
@@ -40,38 +111,95 @@ def parsing_argument():
         default="models",
         help="(str) directory to save the compiled model, default: 'models'",
     )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="(bool) recompile artifacts already in the manifest",
+    )
     return parser.parse_args()
 
 
-def main():
-    args = parsing_argument()
-    model_id = f"yanolja/{args.model_name}"
+def compile_variant(args, model_id, batch_size, max_seq_len, kvcache_partition_len):
+    """
+    Compiles one batch size / context / KV partition combination and records it in the manifest.
+    """
+    # Only needed to compile; the manifest helpers are also used by select_eeve.py
+    import optimum.rbln
+    from optimum.rbln import RBLNLlamaForCausalLM
 
-    # Constructing the output directory name
-    model_save_dir = os.path.join(
-        args.output_dir,
-        f"rbln_vllm_{os.path.basename(model_id)}"
-        f"_npu{args.tensor_parallel_size}"
-        f"_batch{args.batch_size}"
-        f"_max{args.max_seq_len}",
+    model_save_dir = compiled_model_dir(
+        args.output_dir, args.model_name, args.tensor_parallel_size, batch_size, max_seq_len, kvcache_partition_len,
     )
-    print(f"Saving compiled model to {model_save_dir}")
-    os.makedirs(model_save_dir, exist_ok=True)
+    entry = {
+        "model_id": model_id,
+        "model_dir": model_save_dir,
+        "tensor_parallel_size": args.tensor_parallel_size,
+        "batch_size": batch_size,
+        "max_seq_len": max_seq_len,
+        "kvcache_partition_len": kvcache_partition_len,
+        # vLLM --block-size: flash attention이면 KV cache partition, 아니면 전체 context
+        "block_size": kvcache_partition_len or max_seq_len,
+        "optimum_rbln_version": getattr(optimum.rbln, "__version__", None),
+    }
+    rbln_kwargs = {}
+    if kvcache_partition_len:
+        rbln_kwargs = {"rbln_attn_impl": "flash_attn", "rbln_kvcache_partition_len": kvcache_partition_len}
 
     # Compile and export
-    print(f"Loading model: {model_id}")
-    model = RBLNLlamaForCausalLM.from_pretrained(
-        model_id=model_id,
-        export=True,  # export a PyTorch model to RBLN model with optimum
-        rbln_batch_size=args.batch_size,
-        rbln_max_seq_len=args.max_seq_len,
-        rbln_tensor_parallel_size=args.tensor_parallel_size,
-    )
+    print(f"Loading model: {model_id} (batch {batch_size}, max {max_seq_len}, block {entry['block_size']})")
+    start = time.perf_counter()
+    try:
+        model = RBLNLlamaForCausalLM.from_pretrained(
+            model_id=model_id,
+            export=True,  # export a PyTorch model to RBLN model with optimum
+            rbln_batch_size=batch_size,
+            rbln_max_seq_len=max_seq_len,
+            rbln_tensor_parallel_size=args.tensor_parallel_size,
+            **rbln_kwargs,
+        )
+
+        # Save compiled results to disk
+        print(f"Saving compiled model to {model_save_dir}")
+        os.makedirs(model_save_dir, exist_ok=True)
+        model.save_pretrained(model_save_dir)
+        del model
+        entry["status"] = "ok"
+    except Exception as e:
+        # 예: device memory에 들어가지 않는 batch/길이 조합, 나머지 조합은 계속 컴파일
+        traceback.print_exc()
+        entry["status"] = "failed"
+        entry["error"] = f"{type(e).__name__}: {e}"
+    entry["compile_seconds"] = time.perf_counter() - start
+    entry["compiled_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    update_manifest(args.output_dir, entry)
+    print(f"{model_save_dir}: {entry['status']} in {entry['compile_seconds']:.0f}s")
+
+
+def main():
+    args = parsing_argument()
+    model_id = f"yanolja/{args.model_name}"
+    os.makedirs(args.output_dir, exist_ok=True)
+    compiled = {
+        artifact["model_dir"] for artifact in load_manifest(args.output_dir)["artifacts"]
+        if artifact.get("status") == "ok"
+    }
 
-    # Save compiled results to disk
-    print(f"Saving compiled model to {model_save_dir}")
-    model.save_pretrained(model_save_dir)
+    for max_seq_len in args.max_seq_len:
+        for kvcache_partition_len in [length or None for length in args.kvcache_partition_len]:
+            error = kvcache_partition_error(max_seq_len, kvcache_partition_len)
+            if error is not None:
+                print(f"Skipping max {max_seq_len} with partition {kvcache_partition_len}: {error}")
+                continue
+            for batch_size in args.batch_size:
+                model_save_dir = compiled_model_dir(
+                    args.output_dir, args.model_name, args.tensor_parallel_size,
+                    batch_size, max_seq_len, kvcache_partition_len,
+                )
+                if model_save_dir in compiled and os.path.isdir(model_save_dir) and not args.overwrite:
+                    print(f"Skipping {model_save_dir}, already compiled")
+                    continue
+                compile_variant(args, model_id, batch_size, max_seq_len, kvcache_partition_len)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,16 +1,23 @@
 from llama_index.core import (
     SimpleDirectoryReader,
-    VectorStoreIndex,
     StorageContext
 )
 from llama_index.vector_stores.faiss import FaissVectorStore
 from llama_index.core.storage.index_store.simple_index_store import SimpleIndexStore
 from llama_index.core.storage.docstore.simple_docstore import SimpleDocumentStore
 from utils import RBLNBGEM3Embeddings
+from legal_chunker import LegalStructureSplitter
+from sparse_index import SparseInvertedIndex, SparseVectorStoreIndex
+from vector_quantization import VECTOR_DTYPES, create_faiss_index, persist_quantized
+from sharded_retriever import building_dir, publish_shard, shard_dir
+from incremental_index import IncrementalVectorStoreIndex, PreviousIndex, new_storage_context
+from preprocess.corpus_store import load_documents
+from preprocess.crawl_manifest import load_applied_changes, read_changes, save_applied_changes
 
 from absl import app, flags, logging
-import faiss
+from transformers import AutoTokenizer
 import os
+import shutil
 
 FLAGS = flags.FLAGS
 
@@ -21,15 +28,50 @@ flags.DEFINE_string("vector_store_dir", "data/rag", "Directory to the vector sto
 flags.DEFINE_string("compiled_embedding_model", "models/rbln_bge-m3_batch1_max8192", "Directory to compiled HuggingFace embedding model")
 flags.DEFINE_bool("debug", True, "Enable debug level logging")
 flags.DEFINE_bool("load_from_storage", False, "Load storage context from the storage")
-flags.DEFINE_integer("chunk_size", 600, "Text chunk size")
-flags.DEFINE_integer("chunk_overlap_size", 200, "Text chunk overlap size")
+flags.DEFINE_integer("chunk_size", 600, "Token budget of a chunk; statutes and cases are split on their structure and packed up to it")
+flags.DEFINE_integer("chunk_overlap_size", 200, "Token overlap, only used when a single sentence exceeds chunk_size")
+flags.DEFINE_string("corpus_dir", "", "Root of the columnar corpus; when set, documents are read from it instead of json_merge")
+flags.DEFINE_list("corpus_sources", ["law", "case"], "Corpus sources to index")
+flags.DEFINE_bool("sparse", False, "Also persist BGE-M3 lexical (sparse) weights as an inverted index, from the same forward pass")
+flags.DEFINE_string("shard", "", "Build only this shard (e.g. law, case, case-2010-2019) into vector_store_dir/shards/<shard>; requires corpus_dir")
+flags.DEFINE_string("corpus_year_range", "", "Inclusive year range START-END of the corpus documents to index, e.g. 2010-2019")
+flags.DEFINE_list("changes", [], "changes.json logs of the crawlers; with --corpus_dir and --load_from_storage, only the laws/cases changed since the runs this index has applied are re-embedded and every other node keeps its stored vector")
+flags.DEFINE_enum("vector_dtype", "float32", VECTOR_DTYPES, "Persisted vector precision; float16/int8 are scalar-quantized codes that FAISS searches directly")
 
-def process_subfolder(subfolder_path, storage_context, embedding_model):
+HNSW_M = 32
+
+def process_subfolder(subfolder_path, storage_context, embedding_model, text_splitter, persist_dir, sparse_index=None):
     documents = SimpleDirectoryReader(subfolder_path).load_data()
-    index = VectorStoreIndex.from_documents(documents, storage_context=storage_context, embed_model=embedding_model, show_progress=True, insert_batch_size=65536)
-    index.storage_context.persist(persist_dir=FLAGS.vector_store_dir)
+    index = SparseVectorStoreIndex.from_documents(documents, storage_context=storage_context, embed_model=embedding_model, transformations=[text_splitter], show_progress=True, insert_batch_size=65536, sparse_index=sparse_index)
+    index.storage_context.persist(persist_dir=persist_dir)
     return storage_context
 
+def load_sparse_index(load_dir):
+    # Sparse weights are added under each node's id while its insert batch is embedded
+    if not FLAGS.sparse:
+        return None
+    if FLAGS.load_from_storage and SparseInvertedIndex.exists(load_dir):
+        return SparseInvertedIndex.from_persist_dir(load_dir)
+    return SparseInvertedIndex()
+
+def persist_sparse_index(sparse_index, persist_dir):
+    if sparse_index is None:
+        return
+    sparse_index.save(persist_dir)
+    logging.info(f"Saved sparse weights of {len(sparse_index)} nodes")
+
+def persist_vector_dtype(storage_context, M, persist_dir):
+    # float16 is stored as such from the start; int8 codes are trained on the finished index
+    if FLAGS.vector_dtype != "float32":
+        persist_quantized(storage_context.vector_store.client, persist_dir, FLAGS.vector_dtype, M)
+        logging.info(f"Persisted {FLAGS.vector_dtype} vectors")
+
+def parse_year_range(year_range):
+    if not year_range:
+        return None
+    start, end = year_range.split("-")
+    return list(range(int(start), int(end) + 1))
+
 def main(argv):
     del argv
 
@@ -38,26 +80,80 @@ def main(argv):
     else:
         logging.set_verbosity(logging.INFO)
 
-    embedding_model = RBLNBGEM3Embeddings(rbln_compiled_model_name=FLAGS.compiled_embedding_model)
+    embedding_model = RBLNBGEM3Embeddings(rbln_compiled_model_name=FLAGS.compiled_embedding_model, return_sparse=FLAGS.sparse)
 
     # Determine the embedding dimension
     embedding_test = embedding_model._get_text_embedding("This is a sample text.")
 
-    faiss_index = faiss.IndexHNSWFlat(len(embedding_test), 32)
+    faiss_index = create_faiss_index(len(embedding_test), HNSW_M, FLAGS.vector_dtype)
+
+    # A shard is built next to the one being served and swapped in once complete
+    load_dir = persist_dir = FLAGS.vector_store_dir
+    if FLAGS.shard:
+        if not FLAGS.corpus_dir:
+            raise app.UsageError("--shard selects its documents from --corpus_dir")
+        load_dir = shard_dir(FLAGS.vector_store_dir, FLAGS.shard)
+        persist_dir = building_dir(FLAGS.vector_store_dir, FLAGS.shard)
+        shutil.rmtree(persist_dir, ignore_errors=True)
 
     if FLAGS.load_from_storage:
         logging.debug('Loading from existing storage context...')
         # Should load all vector store, docstore, and index store
         # storage_context = StorageContext.from_defaults(persist_dir=FLAGS.vector_store_dir)
-        vector_store = FaissVectorStore.from_persist_dir(FLAGS.vector_store_dir)
-        doc_store = SimpleDocumentStore.from_persist_dir(FLAGS.vector_store_dir)
-        index_store = SimpleIndexStore.from_persist_dir(FLAGS.vector_store_dir)
+        vector_store = FaissVectorStore.from_persist_dir(load_dir)
+        doc_store = SimpleDocumentStore.from_persist_dir(load_dir)
+        index_store = SimpleIndexStore.from_persist_dir(load_dir)
         storage_context = StorageContext.from_defaults(vector_store=vector_store, docstore=doc_store, index_store=index_store)
     else:
         logging.debug('Creating new storage context...')
         vector_store = FaissVectorStore(faiss_index=faiss_index)
         storage_context = StorageContext.from_defaults(vector_store=vector_store)
 
+    # FAISS HNSW는 삭제가 안 되므로, 바뀌지 않은 node의 vector로 새 index를 만들고 바뀐 항목만 다시 임베딩
+    # 변경 로그는 여러 index/shard가 같이 읽으므로, 각 index가 반영한 마지막 run을 자기 디렉토리에 기록
+    previous = None
+    applied = None
+    if FLAGS.changes:
+        if not FLAGS.corpus_dir:
+            raise app.UsageError("--changes follows the crawlers' change logs for an index built from --corpus_dir")
+        # 전체 빌드는 현재 corpus를 모두 담으므로 로그의 마지막 run까지 반영한 것으로 기록
+        updated, removed, applied = read_changes(FLAGS.changes, load_applied_changes(load_dir) if FLAGS.load_from_storage else None)
+        if FLAGS.load_from_storage:
+            if not updated and not removed:
+                logging.info(f"{load_dir} already includes every change in {', '.join(FLAGS.changes)}")
+                return
+            logging.info(f"{len(updated)} laws/cases updated, {len(removed)} removed since the last applied run")
+            previous = PreviousIndex.from_storage_context(storage_context, updated | removed)
+            storage_context = new_storage_context(faiss_index)
+
+    # 조/항/호, 판례 섹션 단위로 나눈 뒤 임베딩 모델 토큰 기준으로 chunk_size까지 묶음
+    text_splitter = LegalStructureSplitter(
+        chunk_size=FLAGS.chunk_size,
+        chunk_overlap=FLAGS.chunk_overlap_size,
+        tokenizer=AutoTokenizer.from_pretrained(FLAGS.compiled_embedding_model).tokenize,
+    )
+
+    sparse_index = load_sparse_index(load_dir)
+    if previous is not None and sparse_index is not None:
+        sparse_index = sparse_index.select(previous.rows)
+
+    if FLAGS.corpus_dir:
+        logging.info(f"Loading corpus {FLAGS.corpus_dir} ({', '.join(FLAGS.corpus_sources)})")
+        if previous is not None:
+            documents = load_documents(FLAGS.corpus_dir, sources=FLAGS.corpus_sources, years=parse_year_range(FLAGS.corpus_year_range), items=updated)
+            index = IncrementalVectorStoreIndex.from_changes(documents, previous, [text_splitter], storage_context=storage_context, embed_model=embedding_model, show_progress=True, insert_batch_size=65536, sparse_index=sparse_index)
+        else:
+            documents = load_documents(FLAGS.corpus_dir, sources=FLAGS.corpus_sources, years=parse_year_range(FLAGS.corpus_year_range))
+            index = SparseVectorStoreIndex.from_documents(documents, storage_context=storage_context, embed_model=embedding_model, transformations=[text_splitter], show_progress=True, insert_batch_size=65536, sparse_index=sparse_index)
+        index.storage_context.persist(persist_dir=persist_dir)
+        persist_sparse_index(sparse_index, persist_dir)
+        persist_vector_dtype(storage_context, HNSW_M, persist_dir)
+        if applied is not None:
+            save_applied_changes(persist_dir, applied)
+        if FLAGS.shard:
+            logging.info(f"Published shard {FLAGS.shard} at {publish_shard(FLAGS.vector_store_dir, FLAGS.shard)}")
+        return
+
     # Process each subfolder
     data_dir = os.path.join(FLAGS.vector_store_dir, "json_merge")
     logging.debug(f'Opening directory {data_dir}')
@@ -65,7 +161,9 @@ def main(argv):
         subfolder_path = os.path.join(data_dir, subfolder)
         if os.path.isdir(subfolder_path):
             logging.info(f"Processing subfolder {subfolder}")
-            vector_store = process_subfolder(subfolder_path, storage_context, embedding_model)
+            vector_store = process_subfolder(subfolder_path, storage_context, embedding_model, text_splitter, persist_dir, sparse_index)
+    persist_sparse_index(sparse_index, persist_dir)
+    persist_vector_dtype(storage_context, HNSW_M, persist_dir)
 
 if __name__ == "__main__":
     app.run(main)
\ No newline at end of file
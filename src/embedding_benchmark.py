@@ -0,0 +1,180 @@
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+from transformers import AutoTokenizer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from src.compile_bge import compiled_model_dir
+from src.utils import RBLNBGEM3Embeddings
+
+
+# RBLNBGEM3Embeddings._encode_batch, one step each
+STAGES = ("tokenize", "stage_inputs", "device", "to_host", "tolist")
+
+
+def load_texts(args):
+    """
+    Texts to embed: a JSONL file (its "text" or "content" field) or plain text file
+    with one text per line, or the columnar corpus. With chunk_size, texts are
+    split into the chunks the index builders would embed.
+    """
+    texts = []
+    if args.corpus_dir:
+        from src.preprocess.corpus_store import iter_corpus_batches
+        for batch in iter_corpus_batches(args.corpus_dir, sources=args.corpus_sources, columns=('content',)):
+            texts.extend(batch.column('content').to_pylist())
+    else:
+        with open(args.texts, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                if args.texts.endswith(".jsonl"):
+                    record = json.loads(line)
+                    line = record.get("text") or record.get("content")
+                texts.append(line)
+
+    random.Random(args.seed).shuffle(texts)
+    if args.chunk_size:
+        from src.legal_chunker import LegalStructureSplitter
+        tokenizer = AutoTokenizer.from_pretrained(args.model_id)
+        splitter = LegalStructureSplitter(chunk_size=args.chunk_size, chunk_overlap=0, tokenizer=tokenizer.tokenize)
+        chunks = []
+        for text in texts:
+            chunks.extend(splitter.split_text(text))
+            if len(chunks) >= args.num_texts:
+                break
+        texts = chunks
+    return texts[:args.num_texts]
+
+
+def load_model(args, batch_size, max_seq_len):
+    if args.device == "cpu":
+        return RBLNBGEM3Embeddings(
+            rbln_compiled_model_name=args.model_id, device="cpu", batch_size=batch_size, max_seq_len=max_seq_len,
+            tokenizer_workers=args.tokenizer_workers,
+        )
+    model_dir = compiled_model_dir(args.compiled_model_dir, args.model_id, batch_size, max_seq_len)
+    if not os.path.isdir(model_dir):
+        return None
+    return RBLNBGEM3Embeddings(
+        rbln_compiled_model_name=model_dir, batch_size=batch_size, max_seq_len=max_seq_len,
+        tokenizer_workers=args.tokenizer_workers,
+    )
+
+
+def profile(embed_model, texts, batch_size, max_seq_len, token_lengths):
+    """
+    Embeds the texts batch by batch and times each step of _encode_batch.
+    """
+    batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+    # Warm up (first call allocates buffers and loads the runtime)
+    embed_model._encode_batch(batches[0])
+
+    seconds = dict.fromkeys(STAGES, 0.0)
+    for batch in batches:
+        start = time.perf_counter()
+        encoded = embed_model._tokenize(batch)
+        tokenized = time.perf_counter()
+        input_ids, attention_mask = embed_model._stage_inputs(encoded)
+        staged = time.perf_counter()
+        hidden_states = embed_model._forward(input_ids, attention_mask)
+        forwarded = time.perf_counter()
+        dense = embed_model._dense_to_host(hidden_states, len(batch))
+        copied = time.perf_counter()
+        dense.tolist()
+        listed = time.perf_counter()
+        for stage, begin, end in zip(STAGES, (start, tokenized, staged, forwarded, copied),
+                                     (tokenized, staged, forwarded, copied, listed)):
+            seconds[stage] += end - begin
+
+    total = sum(seconds.values())
+    # The same texts end to end, tokenizing the next batch while the device runs this one
+    start = time.perf_counter()
+    embed_model.get_text_embedding_array(texts)
+    pipelined = time.perf_counter() - start
+    real_tokens = int(np.minimum(token_lengths, max_seq_len).sum())
+    # Every batch runs at the compiled shape, including the empty rows of the last one
+    padded_tokens = len(batches) * batch_size * max_seq_len
+    return {
+        "batch_size": batch_size,
+        "max_seq_len": max_seq_len,
+        "texts": len(texts),
+        "texts_per_second": len(texts) / total,
+        "pipelined_texts_per_second": len(texts) / pipelined,
+        "tokens_per_second": real_tokens / total,
+        "padded_tokens_per_second": padded_tokens / total,
+        "padding_waste": 1 - real_tokens / padded_tokens,
+        "truncated": float(np.mean(token_lengths > max_seq_len)),
+        **{f"{stage}_ms_per_batch": seconds[stage] / len(batches) * 1000 for stage in STAGES},
+        **{f"{stage}_share": seconds[stage] / total for stage in STAGES},
+    }
+
+
+def print_row(row):
+    stages = "  ".join(f"{stage} {row[f'{stage}_ms_per_batch']:.1f}ms ({row[f'{stage}_share']:.0%})" for stage in STAGES)
+    print(f"batch {row['batch_size']:>3} max {row['max_seq_len']:>5}: "
+          f"{row['texts_per_second']:8.2f} texts/s ({row['pipelined_texts_per_second']:.2f} pipelined) "
+          f"{row['tokens_per_second']:10.1f} tokens/s  "
+          f"padding {row['padding_waste']:.1%}  truncated {row['truncated']:.1%}")
+    print(f"    {stages}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Embedding throughput of batch size / max length variants, step by step")
+    parser.add_argument("--texts", type=str, default="", help="JSONL (text/content field) or text file with one text per line")
+    parser.add_argument("--corpus_dir", type=str, default="", help="Read texts from the columnar corpus instead")
+    parser.add_argument("--corpus_sources", type=str, nargs="+", default=["law", "case"], help="Corpus sources to read")
+    parser.add_argument("--chunk_size", type=int, default=600,
+                        help="Split texts into chunks of this many tokens like the index builders (0 to embed them whole)")
+    parser.add_argument("--num_texts", type=int, default=256, help="Number of texts (or chunks) to embed per variant")
+    parser.add_argument("--device", type=str, choices=["rbln", "cpu"], default="rbln",
+                        help="rbln: compiled variants from compile_bge.py; cpu: the HuggingFace model with transformers")
+    parser.add_argument("--model_id", type=str, default="dragonkue/BGE-m3-ko", help="Model the variants were compiled from")
+    parser.add_argument("--compiled_model_dir", type=str, default="models", help="--output_dir of compile_bge.py")
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1], help="Batch sizes to sweep")
+    parser.add_argument("--max_seq_lens", type=int, nargs="+", default=[8192], help="Sequence lengths to sweep")
+    parser.add_argument("--tokenizer_workers", type=int, default=1,
+                        help="Tokenizer threads preparing the next batches during the device call (0 for serial)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the text sample")
+    parser.add_argument("--output", type=str, default="", help="Write the results to this JSON file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not args.texts and not args.corpus_dir:
+        raise SystemExit("Either --texts or --corpus_dir is required")
+    texts = load_texts(args)
+    # Untruncated lengths, to report truncation and padding per max_seq_len
+    tokenizer = AutoTokenizer.from_pretrained(args.model_id)
+    token_lengths = np.array([len(ids) for ids in tokenizer(texts, add_special_tokens=True)["input_ids"]])
+    print(f"{len(texts)} texts, {token_lengths.mean():.0f} tokens on average (max {token_lengths.max()})")
+
+    rows = []
+    for max_seq_len in args.max_seq_lens:
+        for batch_size in args.batch_sizes:
+            embed_model = load_model(args, batch_size, max_seq_len)
+            if embed_model is None:
+                print(f"batch {batch_size:>3} max {max_seq_len:>5}: not compiled, run "
+                      f"compile_bge.py --batch_size {batch_size} --max_seq_len {max_seq_len}")
+                continue
+            row = profile(embed_model, texts, batch_size, max_seq_len, token_lengths)
+            print_row(row)
+            rows.append(row)
+            del embed_model
+            gc.collect()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"args": vars(args), "results": rows}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import logging
+
+from llama_index.core import StorageContext
+from llama_index.core.ingestion import run_transformations
+from llama_index.vector_stores.faiss import FaissVectorStore
+
+from sparse_index import SparseVectorStoreIndex
+from preprocess.corpus_store import crawl_item
+
+
+logger = logging.getLogger(__name__)
+
+
+class PreviousIndex:
+    """
+    The nodes of a persisted index whose law/case did not change since it was built,
+    with their row in its FAISS index so their vectors are reused instead of re-embedded.
+    """
+    def __init__(self, faiss_index, nodes, rows):
+        self.faiss_index = faiss_index
+        self.nodes = nodes
+        self.rows = rows
+
+    @classmethod
+    def from_storage_context(cls, storage_context, changed):
+        """
+        Keeps the nodes whose crawled law/case (see crawl_item) is not in `changed`.
+        """
+        # FaissVectorStore의 node id는 FAISS row 번호 (storage의 모든 index가 같은 FAISS index를 공유)
+        rows_by_node = {
+            node_id: int(row)
+            for index_struct in storage_context.index_store.index_structs()
+            for row, node_id in index_struct.nodes_dict.items()
+        }
+        nodes, rows = [], {}
+        for node_id, row in rows_by_node.items():
+            node = storage_context.docstore.get_node(node_id)
+            item = crawl_item(node.ref_doc_id or "")
+            if item is None:
+                raise ValueError(f"Node {node_id} has no corpus record id ({node.ref_doc_id}); "
+                                 f"the index predates --changes, rebuild it once without")
+            if item not in changed:
+                nodes.append(node)
+                rows[node_id] = row
+        return cls(storage_context.vector_store.client, nodes, rows)
+
+
+def new_storage_context(faiss_index):
+    return StorageContext.from_defaults(vector_store=FaissVectorStore(faiss_index=faiss_index))
+
+
+class IncrementalVectorStoreIndex(SparseVectorStoreIndex):
+    """
+    SparseVectorStoreIndex that takes the vectors of previous.nodes from the previous
+    FAISS index and only embeds the other nodes. FAISS HNSW cannot delete, so an
+    update builds a fresh index out of the reused vectors and the re-embedded items.
+    """
+    def __init__(self, *args, previous=None, **kwargs):
+        self._previous = previous
+        super().__init__(*args, **kwargs)
+
+    @classmethod
+    def from_changes(cls, documents, previous, transformations, **kwargs):
+        nodes = run_transformations(documents, transformations, show_progress=kwargs.get("show_progress", False))
+        logger.info(f"Reusing {len(previous.nodes)} node vectors, embedding {len(nodes)} nodes of {len(documents)} updated documents")
+        return cls(nodes=previous.nodes + nodes, previous=previous, **kwargs)
+
+    def _get_node_with_embedding(self, nodes, show_progress=False):
+        reused = [node for node in nodes if node.node_id in self._previous.rows]
+        embedded = [node for node in nodes if node.node_id not in self._previous.rows]
+        results = super()._get_node_with_embedding(embedded, show_progress) if embedded else []
+        for node in reused:
+            result = node.model_copy()
+            result.embedding = self._previous.faiss_index.reconstruct(self._previous.rows[node.node_id]).tolist()
+            results.append(result)
+        return results
@@ -0,0 +1,240 @@
+import gc
+import logging
+import os
+import threading
+import time
+from typing import Any
+
+from llama_index.core import StorageContext, load_index_from_storage
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.embeddings import BaseEmbedding
+
+from src.prompt_layout import PrefixStableChatEngine
+from src.sharded_retriever import list_shards, load_sharded_retriever
+from src.telemetry import InstrumentedChatEngine, TimedDocumentStore, TimedFaissVectorStore
+
+
+logger = logging.getLogger(__name__)
+
+# Files persisted by StorageContext.persist; a change to any of them is a new index version
+INDEX_FILES = ("default__vector_store.json", "docstore.json", "index_store.json")
+
+
+def index_signature(path):
+    signature = []
+    for filename in INDEX_FILES:
+        try:
+            stat = os.stat(os.path.join(path, filename))
+            signature.append((filename, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            pass
+    return tuple(signature)
+
+
+class DeferredEmbedding(BaseEmbedding):
+    """
+    Stands in for an embed model that is still loading, so that the index can be
+    loaded at the same time (it only keeps a reference). Calls wait for the model.
+    """
+    _resolve: Any = PrivateAttr()
+
+    def __init__(self, resolve, **kwargs):
+        super().__init__(**kwargs)
+        self._resolve = resolve
+
+    @classmethod
+    def class_name(cls):
+        return "deferred_embedding"
+
+    def _get_query_embedding(self, query):
+        return self._resolve()._get_query_embedding(query)
+
+    def _get_text_embedding(self, text):
+        return self._resolve()._get_text_embedding(text)
+
+    def _get_text_embeddings(self, texts):
+        return self._resolve()._get_text_embeddings(texts)
+
+    async def _aget_query_embedding(self, query):
+        return await self._resolve()._aget_query_embedding(query)
+
+    async def _aget_text_embedding(self, text):
+        return await self._resolve()._aget_text_embedding(text)
+
+
+class IndexVersion:
+    """
+    One loaded index (a single FAISS index or a set of shards) and the number of
+    requests currently using it.
+    """
+    def __init__(self, path, index=None, retriever=None, stop_watcher=None):
+        self.path = path
+        self.index = index
+        self.retriever = retriever
+        self.loaded_at = time.time()
+        self._stop_watcher = stop_watcher
+        self._inflight = 0
+        self._condition = threading.Condition()
+
+    @property
+    def inflight(self):
+        return self._inflight
+
+    def acquire(self):
+        with self._condition:
+            self._inflight += 1
+
+    def release(self):
+        with self._condition:
+            self._inflight -= 1
+            if self._inflight == 0:
+                self._condition.notify_all()
+
+    def drain(self, timeout=None):
+        """
+        Waits until no request uses this version. Returns False on timeout.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._inflight == 0, timeout=timeout)
+
+    def close(self):
+        if self._stop_watcher is not None:
+            self._stop_watcher.set()
+        self.index = None
+        self.retriever = None
+
+    def chat_engine(self, memory, context_prompt, sources=None, system_prompt=None):
+        """
+        Builds a chat engine on this version around a conversation's memory, so that
+        conversations survive an index swap and never pin an old version.
+        With a system prompt, the documents and question go after the conversation
+        (PrefixStableChatEngine) and context_prompt needs {context_str} and {query_str}.
+        """
+        if self.retriever is not None:
+            retriever = self.retriever.restrict(sources) if sources else self.retriever
+        else:
+            retriever = self.index.as_retriever()
+        if system_prompt is not None:
+            return PrefixStableChatEngine.from_defaults(
+                retriever=retriever, memory=memory, system_prompt=system_prompt, context_prompt=context_prompt,
+            )
+        return InstrumentedChatEngine.from_defaults(
+            retriever=retriever, memory=memory, context_prompt=context_prompt,
+        )
+
+
+def load_index_version(path, shard_poll_interval=0):
+    # create_vector_store.py --shard 로 만든 shard가 있으면 source별 shard를 병렬로 검색
+    if list_shards(path):
+        retriever = load_sharded_retriever(
+            path, vector_store_cls=TimedFaissVectorStore, docstore_cls=TimedDocumentStore,
+        )
+        stop_watcher = retriever.start_watcher(shard_poll_interval) if shard_poll_interval > 0 else None
+        logger.info(f"Loaded shards {', '.join(retriever.shard_names())} from {path}")
+        return IndexVersion(path, retriever=retriever, stop_watcher=stop_watcher)
+
+    vector_store = TimedFaissVectorStore.from_persist_dir(path)
+    storage_context = StorageContext.from_defaults(
+        vector_store=vector_store,
+        docstore=TimedDocumentStore.from_persist_dir(path),
+        persist_dir=path
+    )
+    index = load_index_from_storage(storage_context=storage_context)
+    logger.info(f"Loaded index from {path}")
+    return IndexVersion(path, index=index)
+
+
+class IndexManager:
+    """
+    Serves the current IndexVersion and replaces it without downtime.
+
+    A new version is loaded in a background thread while the old one keeps serving.
+    The reference is then swapped under a lock, so every request sees exactly one
+    version from start to end. The old version is freed once its in-flight
+    requests have finished.
+    """
+    def __init__(self, loader, path, drain_timeout=600):
+        self._loader = loader
+        self.path = path
+        self.drain_timeout = drain_timeout
+        self._lock = threading.Lock()
+        self._loading = threading.Lock()
+        self._current = loader(path)
+        self._signature = index_signature(path)
+        self.last_error = None
+
+    def acquire(self):
+        """
+        Returns the current version, counted as in use until its release() is called.
+        """
+        with self._lock:
+            version = self._current
+            version.acquire()
+        return version
+
+    def status(self):
+        version = self._current
+        status = {
+            "path": version.path,
+            "loaded_at": version.loaded_at,
+            "inflight": version.inflight,
+            "loading": self._loading.locked(),
+            "last_error": self.last_error,
+        }
+        if version.retriever is not None:
+            status.update(version.retriever.status())
+        return status
+
+    def reload(self, path=None):
+        """
+        Starts loading `path` (default: the served directory) in the background.
+        Returns False if a reload is already running.
+        """
+        if not self._loading.acquire(blocking=False):
+            return False
+        thread = threading.Thread(target=self._reload, args=(path or self.path,), name="index-reload", daemon=True)
+        thread.start()
+        return True
+
+    def _reload(self, path):
+        try:
+            signature = index_signature(path)
+            new_version = self._loader(path)
+            with self._lock:
+                old_version, self._current = self._current, new_version
+                self.path, self._signature = path, signature
+            self.last_error = None
+            logger.info(f"Swapped index to {path}, draining {old_version.inflight} requests on the old version")
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            logger.exception(f"Failed to load index from {path}, keeping {self._current.path}")
+            return
+        finally:
+            self._loading.release()
+
+        if not old_version.drain(self.drain_timeout):
+            logger.warning(f"Old index version still had {old_version.inflight} requests after {self.drain_timeout}s")
+        old_version.close()
+        del old_version
+        gc.collect()
+
+    def start_watcher(self, interval):
+        """
+        Reloads the served directory when its persisted files change, once they have
+        stayed unchanged for one interval (i.e. the writer has finished).
+        """
+        def watch():
+            pending = None
+            while not stop.wait(interval):
+                signature = index_signature(self.path)
+                if signature == self._signature or not signature:
+                    pending = None
+                elif signature == pending:
+                    self.reload()
+                    pending = None
+                else:
+                    pending = signature
+
+        stop = threading.Event()
+        threading.Thread(target=watch, name="index-watcher", daemon=True).start()
+        return stop
@@ -0,0 +1,127 @@
+import re
+from typing import Any, Callable, List, Optional
+
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.node_parser.interface import MetadataAwareTextSplitter
+from llama_index.core.utils import get_tokenizer
+
+
+# 법령: 조 / 항(①) / 호(1.) / 목(가.) 경계, postprocess_law_data의 \t 구분자 포함 ('2023. 1. 1.' 같은 날짜는 제외)
+STATUTE_BOUNDARY = re.compile(r'(?<=\t)(?=[^\t])|(?m:^)(?=제\d+조(?:의\d+)?[ (])|(?=[①-⑳])|(?<=\s)(?<!\d\.\s)(?=\d{1,3}\.\s)|(?<=\s)(?=[가-하]\.\s)')
+# 판례: [판시사항]/[판결요지]/[참조조문]/[참조판례]/[주문]/[이유] 등의 섹션과 원문의 【】 섹션 경계
+CASE_BOUNDARY = re.compile(r'(?=\[\d+\]\s*\[[가-힣 ]{2,10}\])|(?<!\]\s)(?<!\])(?=\[[가-힣 ]{2,10}\])|(?=【)')
+CASE_MARKER = re.compile(r'\[(?:판시사항|판결요지|참조조문|참조판례|판례내용|주문|이유)\]|【')
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.?!])\s+|\n+')
+
+
+def split_at(text, pattern):
+    """
+    Splits text at the zero-width matches of pattern, keeping every character,
+    so that ''.join(split_at(text, pattern)) == text.
+    """
+    positions = sorted({m.start() for m in pattern.finditer(text)} - {0, len(text)})
+    return [text[start:end] for start, end in zip([0] + positions, positions + [len(text)])]
+
+
+def split_sentences(text):
+    segments = []
+    start = 0
+    for match in SENTENCE_BOUNDARY.finditer(text):
+        segments.append(text[start:match.end()])
+        start = match.end()
+    if start < len(text):
+        segments.append(text[start:])
+    return segments
+
+
+def structural_segments(text):
+    """
+    Splits a statute or case text into its structural units, in order.
+    """
+    pattern = CASE_BOUNDARY if CASE_MARKER.search(text) else STATUTE_BOUNDARY
+    return split_at(text, pattern)
+
+
+def window_split(text, num_tokens, budget, overlap):
+    """
+    Last resort for a single sentence over budget: fixed windows with overlap,
+    sized in characters from the segment's own chars-per-token ratio.
+    """
+    chars_per_token = len(text) / max(num_tokens, 1)
+    size = max(1, int(budget * chars_per_token))
+    step = max(1, int((budget - min(overlap, budget // 2)) * chars_per_token))
+    windows = []
+    start = 0
+    while True:
+        windows.append(text[start:start + size])
+        if start + size >= len(text):
+            return windows
+        start += step
+
+
+def pack_segments(segments, count_tokens, budget, overlap=0):
+    """
+    Greedily packs consecutive segments into chunks of at most `budget` tokens.
+    Chunks only break at segment boundaries and do not overlap; a segment over budget
+    is split into sentences first and into overlapping windows only as a last resort.
+    """
+    chunks = []
+    current, current_tokens = [], 0
+
+    def flush():
+        nonlocal current, current_tokens
+        chunk = ''.join(current).strip()
+        if chunk:
+            chunks.append(chunk)
+        current, current_tokens = [], 0
+
+    for segment in segments:
+        num_tokens = count_tokens(segment)
+        if num_tokens > budget:
+            flush()
+            sentences = split_sentences(segment)
+            if len(sentences) > 1:
+                chunks.extend(pack_segments(sentences, count_tokens, budget, overlap))
+            else:
+                chunks.extend(c.strip() for c in window_split(segment, num_tokens, budget, overlap) if c.strip())
+            continue
+        if current_tokens + num_tokens > budget:
+            flush()
+        current.append(segment)
+        current_tokens += num_tokens
+    flush()
+    return chunks
+
+
+class LegalStructureSplitter(MetadataAwareTextSplitter):
+    """
+    Splits statutes on 조/항/호/목 and precedents on their 판시사항/판결요지/판례내용 sections,
+    then packs the units up to a token budget, instead of cutting at fixed token offsets.
+    """
+    chunk_size: int = Field(default=600, description="Token budget of a chunk, including metadata", gt=0)
+    chunk_overlap: int = Field(default=0, description="Token overlap, used only when a single sentence is over budget", ge=0)
+
+    _count_tokens: Callable[[str], int] = PrivateAttr()
+
+    def __init__(self, chunk_size: int = 600, chunk_overlap: int = 0,
+                 tokenizer: Optional[Callable[[str], List]] = None, **kwargs: Any) -> None:
+        super().__init__(chunk_size=chunk_size, chunk_overlap=chunk_overlap, **kwargs)
+        tokenize = tokenizer or get_tokenizer()
+        self._count_tokens = lambda text: len(tokenize(text))
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LegalStructureSplitter"
+
+    def split_text_metadata_aware(self, text: str, metadata_str: str) -> List[str]:
+        # 제목 등 메타데이터도 임베딩 입력에 포함되므로 그만큼 예산에서 뺀다
+        budget = max(self.chunk_size - self._count_tokens(metadata_str), self.chunk_size // 2)
+        return self._split(text, budget)
+
+    def split_text(self, text: str) -> List[str]:
+        return self._split(text, self.chunk_size)
+
+    def _split(self, text: str, budget: int) -> List[str]:
+        if text == '':
+            return [text]
+        return pack_segments(structural_segments(text), self._count_tokens, budget, self.chunk_overlap)
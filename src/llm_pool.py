@@ -0,0 +1,343 @@
+import collections
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any
+
+import httpx
+import openai
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms import LLM
+from llama_index.llms.openai_like import OpenAILike
+
+
+logger = logging.getLogger(__name__)
+
+# 이 오류는 다른 endpoint로 다시 보냄 (연결 실패, timeout, 5xx)
+BACKEND_ERRORS = (openai.APIConnectionError, openai.InternalServerError)
+
+_conversation = contextvars.ContextVar("llm_pool_conversation", default=None)
+
+
+@contextmanager
+def conversation(conversation_id):
+    """
+    Routes the LLM calls made inside the block to the conversation's endpoint, so its
+    earlier turns are still in that endpoint's prefix cache.
+    """
+    token = _conversation.set(conversation_id)
+    try:
+        yield
+    finally:
+        _conversation.reset(token)
+
+
+def estimate_tokens(text):
+    # Only compared across endpoints, so a rough count is enough (EEVE's Korean vocabulary ~2 characters per token)
+    return len(text) // 2 + 1
+
+
+class Backend:
+    """
+    One vLLM endpoint: its client (which keeps its connections open) and current load.
+    """
+    def __init__(self, llm, cooldown=10.0):
+        self.llm = llm
+        self.api_base = llm.api_base
+        self.cooldown = cooldown
+        self.outstanding_tokens = 0
+        self.inflight = 0
+        self.requests = 0
+        self.failures = 0
+        self.last_error = None
+        self.down_until = 0.0
+
+    @property
+    def healthy(self):
+        return time.monotonic() >= self.down_until
+
+    def mark_down(self, error, seconds=None):
+        self.last_error = f"{type(error).__name__}: {error}" if isinstance(error, Exception) else str(error)
+        self.down_until = time.monotonic() + (self.cooldown if seconds is None else seconds)
+
+    def mark_up(self):
+        self.down_until = 0.0
+
+    def status(self):
+        return {
+            "api_base": self.api_base,
+            "healthy": self.healthy,
+            "outstanding_tokens": self.outstanding_tokens,
+            "inflight": self.inflight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+class Lease:
+    """
+    The tokens a request adds to its endpoint's load: the prompt until the first
+    token arrives, then the output it may still generate.
+    """
+    def __init__(self, pool, backend, prompt_tokens, max_tokens):
+        self._pool = pool
+        self.backend = backend
+        self._prompt_tokens = prompt_tokens
+        self._output_tokens = max_tokens
+        self._released = False
+
+    def consume(self, tokens=1):
+        with self._pool._lock:
+            if self._released:
+                return
+            delta = self._prompt_tokens + min(tokens, self._output_tokens)
+            self._prompt_tokens = 0
+            self._output_tokens -= min(tokens, self._output_tokens)
+            self.backend.outstanding_tokens -= delta
+
+    def release(self):
+        with self._pool._lock:
+            if self._released:
+                return
+            self._released = True
+            self.backend.outstanding_tokens -= self._prompt_tokens + self._output_tokens
+            self.backend.inflight -= 1
+
+
+class LLMPool(LLM):
+    """
+    Spreads LLM calls over several OpenAI-compatible endpoints (vLLM replicas).
+
+    Each call goes to the healthy endpoint with the fewest outstanding tokens, except
+    that a conversation stays on the endpoint of its earlier turns while that endpoint
+    is within sticky_slack tokens of the least loaded one. A call failing to connect
+    (or with a 5xx) before any output is retried on another endpoint and takes the
+    failed one out of rotation for its cooldown, or until a health check passes.
+    """
+    sticky_slack: int = 8192
+    max_conversations: int = 10000
+
+    _backends: list = PrivateAttr()
+    _lock: Any = PrivateAttr()
+    _sticky: Any = PrivateAttr()
+    _stop_health_checks: Any = PrivateAttr(default=None)
+
+    def __init__(self, llms, **kwargs):
+        super().__init__(**kwargs)
+        if not llms:
+            raise ValueError("LLMPool needs at least one endpoint")
+        self._backends = [Backend(llm) for llm in llms]
+        self._lock = threading.Lock()
+        self._sticky = collections.OrderedDict()
+
+    @classmethod
+    def class_name(cls):
+        return "LLMPool"
+
+    @property
+    def metadata(self):
+        return self._backends[0].llm.metadata
+
+    def status(self):
+        with self._lock:
+            return {"conversations": len(self._sticky), "backends": [backend.status() for backend in self._backends]}
+
+    def _acquire(self, prompt_tokens, conversation_id, exclude=()):
+        with self._lock:
+            candidates = [backend for backend in self._backends if backend not in exclude]
+            if not candidates:
+                raise RuntimeError("No LLM endpoint left to try")
+            # 모두 unhealthy면 그래도 하나는 시도
+            candidates = [backend for backend in candidates if backend.healthy] or candidates
+            least = min(candidates, key=lambda backend: (backend.outstanding_tokens, backend.inflight, backend.requests))
+            backend = least
+            sticky = self._sticky.get(conversation_id) if conversation_id is not None else None
+            if sticky in candidates and sticky.outstanding_tokens - least.outstanding_tokens <= self.sticky_slack:
+                backend = sticky
+            if conversation_id is not None:
+                self._sticky[conversation_id] = backend
+                self._sticky.move_to_end(conversation_id)
+                while len(self._sticky) > self.max_conversations:
+                    self._sticky.popitem(last=False)
+            max_tokens = backend.llm.max_tokens or 0
+            backend.outstanding_tokens += prompt_tokens + max_tokens
+            backend.inflight += 1
+            backend.requests += 1
+            return Lease(self, backend, prompt_tokens, max_tokens)
+
+    def _failed(self, backend, error, tried):
+        logger.warning(f"LLM endpoint {backend.api_base} failed, trying another: {type(error).__name__}: {error}")
+        with self._lock:
+            backend.failures += 1
+            backend.mark_down(error)
+        tried.append(backend)
+        return len(tried) < len(self._backends)
+
+    def _call(self, method, prompt_tokens, *args, **kwargs):
+        conversation_id = _conversation.get()
+        tried = []
+        while True:
+            lease = self._acquire(prompt_tokens, conversation_id, tried)
+            try:
+                return getattr(lease.backend.llm, method)(*args, **kwargs)
+            except BACKEND_ERRORS as e:
+                if not self._failed(lease.backend, e, tried):
+                    raise
+            finally:
+                lease.release()
+
+    def _stream(self, method, prompt_tokens, *args, **kwargs):
+        # 요청은 첫 next()에서 보내지므로, endpoint는 지금 정하고 실패 시 재시도는 generator 안에서
+        conversation_id = _conversation.get()
+        first_lease = self._acquire(prompt_tokens, conversation_id)
+
+        def relay():
+            lease = first_lease
+            tried = []
+            try:
+                while True:
+                    started = False
+                    try:
+                        for item in getattr(lease.backend.llm, method)(*args, **kwargs):
+                            started = True
+                            lease.consume()
+                            yield item
+                        return
+                    except BACKEND_ERRORS as e:
+                        # 이미 일부를 스트리밍했으면 다른 endpoint에서 다시 시작할 수 없음
+                        if not self._failed(lease.backend, e, tried) or started:
+                            raise
+                    lease.release()
+                    lease = self._acquire(prompt_tokens, conversation_id, tried)
+            finally:
+                lease.release()
+
+        return relay()
+
+    async def _acall(self, method, prompt_tokens, *args, **kwargs):
+        conversation_id = _conversation.get()
+        tried = []
+        while True:
+            lease = self._acquire(prompt_tokens, conversation_id, tried)
+            try:
+                return await getattr(lease.backend.llm, method)(*args, **kwargs)
+            except BACKEND_ERRORS as e:
+                if not self._failed(lease.backend, e, tried):
+                    raise
+            finally:
+                lease.release()
+
+    async def _astream(self, method, prompt_tokens, *args, **kwargs):
+        conversation_id = _conversation.get()
+        first_lease = self._acquire(prompt_tokens, conversation_id)
+
+        async def relay():
+            lease = first_lease
+            tried = []
+            try:
+                while True:
+                    started = False
+                    try:
+                        async for item in await getattr(lease.backend.llm, method)(*args, **kwargs):
+                            started = True
+                            lease.consume()
+                            yield item
+                        return
+                    except BACKEND_ERRORS as e:
+                        if not self._failed(lease.backend, e, tried) or started:
+                            raise
+                    lease.release()
+                    lease = self._acquire(prompt_tokens, conversation_id, tried)
+            finally:
+                lease.release()
+
+        return relay()
+
+    @staticmethod
+    def _message_tokens(messages):
+        return sum(estimate_tokens(str(message.content or "")) for message in messages)
+
+    def chat(self, messages, **kwargs):
+        return self._call("chat", self._message_tokens(messages), messages, **kwargs)
+
+    def complete(self, prompt, formatted=False, **kwargs):
+        return self._call("complete", estimate_tokens(prompt), prompt, formatted=formatted, **kwargs)
+
+    def stream_chat(self, messages, **kwargs):
+        return self._stream("stream_chat", self._message_tokens(messages), messages, **kwargs)
+
+    def stream_complete(self, prompt, formatted=False, **kwargs):
+        return self._stream("stream_complete", estimate_tokens(prompt), prompt, formatted=formatted, **kwargs)
+
+    async def achat(self, messages, **kwargs):
+        return await self._acall("achat", self._message_tokens(messages), messages, **kwargs)
+
+    async def acomplete(self, prompt, formatted=False, **kwargs):
+        return await self._acall("acomplete", estimate_tokens(prompt), prompt, formatted=formatted, **kwargs)
+
+    async def astream_chat(self, messages, **kwargs):
+        return await self._astream("astream_chat", self._message_tokens(messages), messages, **kwargs)
+
+    async def astream_complete(self, prompt, formatted=False, **kwargs):
+        return await self._astream("astream_complete", estimate_tokens(prompt), prompt, formatted=formatted, **kwargs)
+
+    def check_health(self, timeout=5.0):
+        """
+        Asks every endpoint for /models; endpoints that do not answer are taken out of rotation.
+        """
+        for backend in self._backends:
+            try:
+                response = httpx.get(
+                    f"{backend.api_base.rstrip('/')}/models",
+                    headers={"Authorization": f"Bearer {backend.llm.api_key}"}, timeout=timeout,
+                )
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                with self._lock:
+                    was_healthy = backend.healthy
+                    backend.mark_down(e, seconds=float("inf"))
+                if was_healthy:
+                    logger.warning(f"LLM endpoint {backend.api_base} is down: {type(e).__name__}: {e}")
+                continue
+            with self._lock:
+                was_healthy = backend.healthy
+                backend.mark_up()
+            if not was_healthy:
+                logger.info(f"LLM endpoint {backend.api_base} is back")
+
+    def start_health_checks(self, interval):
+        """
+        Checks the endpoints every `interval` seconds in a daemon thread. Returns an
+        Event which stops the checks when set.
+        """
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                self.check_health(timeout=min(interval, 5.0))
+
+        threading.Thread(target=run, name="llm-health-check", daemon=True).start()
+        self._stop_health_checks = stop
+        return stop
+
+    def close(self):
+        if self._stop_health_checks is not None:
+            self._stop_health_checks.set()
+
+
+def create_llm_pool(api_bases, health_interval=10, sticky_slack=8192, **llm_kwargs):
+    """
+    One OpenAILike per endpoint, each reusing its HTTP client (and connections).
+    Failed calls are retried on another endpoint instead of the same one.
+    """
+    llms = [
+        OpenAILike(api_base=api_base, reuse_client=True, max_retries=0, **llm_kwargs)
+        for api_base in api_bases
+    ]
+    pool = LLMPool(llms, sticky_slack=sticky_slack)
+    if health_interval > 0:
+        pool.start_health_checks(health_interval)
+    return pool
@@ -0,0 +1,223 @@
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+import uuid
+
+import aiohttp
+import numpy as np
+
+
+def load_conversations(path):
+    """
+    Reads a JSONL file with one conversation per line, either
+    {"question": "..."} or {"conversation": ["first question", "follow-up", ...]},
+    optionally with "sources" (e.g. ["law"]).
+    """
+    conversations = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            turns = record.get("conversation") or ([record["question"]] if "question" in record else None)
+            if not turns:
+                raise ValueError(f"{path}:{line_number} has neither 'question' nor 'conversation'")
+            conversations.append({"turns": turns, "sources": record.get("sources")})
+    if not conversations:
+        raise ValueError(f"No conversations in {path}")
+    return conversations
+
+
+async def send_query(session, url, question, conversation_id, sources, timeout):
+    """
+    Posts one question and reads the SSE stream to its end.
+    Each unnamed `data:` event is one streamed token of the answer; `event: queue`
+    reports the request's position while it waits for the LLM.
+    """
+    result = {"conversation_id": conversation_id, "ttft": None, "latency": None, "tokens": 0,
+              "queue_position": 0, "error": None}
+    payload = {"question": question, "conversation_id": conversation_id}
+    if sources:
+        payload["sources"] = sources
+    start = time.perf_counter()
+    try:
+        async with session.post(url, json=payload, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            if response.status != 200:
+                result["error"] = f"HTTP {response.status}: {(await response.text())[:200]}"
+                return result
+            done = False
+            event = None
+            async for raw_line in response.content:
+                line = raw_line.decode('utf-8', errors='replace').rstrip("\r\n")
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                    continue
+                if not line.startswith("data: "):
+                    if not line:
+                        event = None
+                    continue
+                if event == "queue":
+                    position = json.loads(line[len("data: "):])["position"]
+                    result["queue_position"] = max(result["queue_position"], position)
+                    continue
+                if event == "error":
+                    result["error"] = f"Stream error: {json.loads(line[len('data: '):])['error']}"
+                    break
+                if line == "data: [DONE]":
+                    done = True
+                    break
+                if result["ttft"] is None:
+                    result["ttft"] = time.perf_counter() - start
+                result["tokens"] += 1
+            if not done and not result["error"]:
+                result["error"] = "Stream ended without [DONE]"
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["latency"] = time.perf_counter() - start
+    return result
+
+
+async def run_conversation(session, url, conversation, timeout, results):
+    # 한 대화의 질문은 순서대로 보내서 서버의 대화 기록(condense)이 사용되도록 함
+    conversation_id = f"load-test-{uuid.uuid4()}"
+    for turn, question in enumerate(conversation["turns"]):
+        result = await send_query(session, url, question, conversation_id, conversation["sources"], timeout)
+        result["turn"] = turn
+        results.append(result)
+        if result["error"]:
+            break
+
+
+async def run_load(args, conversations):
+    url = args.url.rstrip("/") + "/query"
+    source = itertools.cycle(conversations) if args.num_conversations else iter(conversations)
+    if args.num_conversations:
+        source = itertools.islice(source, args.num_conversations)
+    deadline = time.perf_counter() + args.duration if args.duration else None
+    results = []
+
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        start = time.perf_counter()
+        if args.rate:
+            # Open loop: conversations arrive as a Poisson process, whatever the server's speed
+            semaphore = asyncio.Semaphore(args.concurrency) if args.concurrency else None
+
+            async def arrival(conversation):
+                if semaphore is None:
+                    return await run_conversation(session, url, conversation, args.timeout, results)
+                async with semaphore:
+                    return await run_conversation(session, url, conversation, args.timeout, results)
+
+            tasks = []
+            for conversation in source:
+                if deadline and time.perf_counter() >= deadline:
+                    break
+                tasks.append(asyncio.create_task(arrival(conversation)))
+                await asyncio.sleep(random.expovariate(args.rate))
+            await asyncio.gather(*tasks)
+        else:
+            # Closed loop: `concurrency` users, each starting a new conversation when one ends
+            async def user():
+                for conversation in source:
+                    if deadline and time.perf_counter() >= deadline:
+                        return
+                    await run_conversation(session, url, conversation, args.timeout, results)
+
+            await asyncio.gather(*(user() for _ in range(args.concurrency or 1)))
+        elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+def percentiles(values, points=(50, 95, 99)):
+    if not values:
+        return {f"p{point}": None for point in points}
+    return {f"p{point}": float(value) for point, value in zip(points, np.percentile(values, points))}
+
+
+def summarize(results, elapsed):
+    succeeded = [result for result in results if not result["error"]]
+    ttfts = [result["ttft"] for result in succeeded if result["ttft"] is not None]
+    latencies = [result["latency"] for result in succeeded]
+    # Decode speed of each stream, after its first token
+    tokens_per_second = [
+        (result["tokens"] - 1) / (result["latency"] - result["ttft"])
+        for result in succeeded
+        if result["tokens"] > 1 and result["latency"] > result["ttft"]
+    ]
+    errors = {}
+    for result in results:
+        if result["error"]:
+            kind = result["error"].split(":")[0]
+            errors[kind] = errors.get(kind, 0) + 1
+    total_tokens = sum(result["tokens"] for result in succeeded)
+    return {
+        "requests": len(results),
+        "errors": len(results) - len(succeeded),
+        "error_rate": (len(results) - len(succeeded)) / len(results) if results else 0.0,
+        "error_kinds": errors,
+        "elapsed": elapsed,
+        "requests_per_second": len(results) / elapsed if elapsed else 0.0,
+        "output_tokens_per_second": total_tokens / elapsed if elapsed else 0.0,
+        "queued": sum(1 for result in results if result["queue_position"]) / len(results) if results else 0.0,
+        "ttft": percentiles(ttfts),
+        "latency": percentiles(latencies),
+        "tokens_per_second": {"mean": float(np.mean(tokens_per_second)) if tokens_per_second else None,
+                              **percentiles(tokens_per_second, points=(5, 50))},
+    }
+
+
+def print_summary(summary):
+    def fmt(value, unit="s"):
+        return "-" if value is None else f"{value:.3f}{unit}"
+
+    print(f"requests      {summary['requests']} in {summary['elapsed']:.1f}s "
+          f"({summary['requests_per_second']:.2f} req/s, {summary['output_tokens_per_second']:.1f} tokens/s)")
+    print(f"errors        {summary['errors']} ({summary['error_rate']:.1%}) {summary['error_kinds'] or ''}")
+    print(f"queued        {summary['queued']:.1%} of requests waited for the LLM")
+    for name in ("ttft", "latency"):
+        stats = summary[name]
+        print(f"{name:<14}p50 {fmt(stats['p50'])}  p95 {fmt(stats['p95'])}  p99 {fmt(stats['p99'])}")
+    stats = summary["tokens_per_second"]
+    print(f"{'tokens/s':<14}mean {fmt(stats['mean'], '')}  p5 {fmt(stats['p5'], '')}  p50 {fmt(stats['p50'], '')}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay questions against the /query endpoint and report latency")
+    parser.add_argument("--input", type=str, required=True,
+                        help="JSONL of {\"question\": ...} or {\"conversation\": [...]} lines")
+    parser.add_argument("--url", type=str, default="http://127.0.0.1:5000", help="Base URL of the server")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Concurrent users (closed loop), or the cap on in-flight conversations with --rate (0 for none)")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="Arrival rate of conversations per second (open loop, Poisson); 0 for closed loop")
+    parser.add_argument("--num_conversations", type=int, default=0,
+                        help="Conversations to send, cycling through the input; 0 to send the input once")
+    parser.add_argument("--duration", type=float, default=0, help="Stop starting conversations after this many seconds")
+    parser.add_argument("--timeout", type=float, default=300, help="Timeout of one request in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the arrival process and the input shuffle")
+    parser.add_argument("--shuffle", action="store_true", help="Shuffle the conversations before replaying them")
+    parser.add_argument("--output", type=str, default="", help="Write the summary and every request's result to this JSON file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    random.seed(args.seed)
+    conversations = load_conversations(args.input)
+    if args.shuffle:
+        random.shuffle(conversations)
+
+    results, elapsed = asyncio.run(run_load(args, conversations))
+    summary = summarize(results, elapsed)
+    print_summary(summary)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"args": vars(args), "summary": summary, "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
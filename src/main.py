@@ -1,18 +1,20 @@
 import argparse
+import json
 import logging
+import math
 import os
 import sys
 import traceback
 import threading
+import time
 import uuid
 
 from flask import Flask, request, jsonify, Response, stream_with_context
-from llama_index.core import load_index_from_storage, StorageContext, Settings
-from llama_index.vector_stores.faiss import FaissVectorStore
-from llama_index.llms.openai_like import OpenAILike
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
-from src.utils import RBLNBGEM3Embeddings
+# llama-index, the models and the index are imported and loaded in the background, see create_app
+from src.scheduler import Overloaded, Scheduler
+from src.startup import Startup
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Flask API Backend")
@@ -39,6 +41,111 @@ def parse_args():
         default=5000,
         help="Port to run the Flask app"
     )
+    parser.add_argument(
+        "--shard_poll_interval",
+        type=float,
+        default=60,
+        help="Seconds between checks for rebuilt shards under vector_store_dir/shards (0 to disable)"
+    )
+    parser.add_argument(
+        "--index_poll_interval",
+        type=float,
+        default=60,
+        help="Seconds between checks for a rebuilt index in vector_store_dir, swapped in without downtime (0 to disable)"
+    )
+    parser.add_argument(
+        "--drain_timeout",
+        type=float,
+        default=600,
+        help="Seconds to wait for in-flight requests before freeing a replaced index"
+    )
+    parser.add_argument(
+        "--trace_file",
+        type=str,
+        default="",
+        help="Append per-request stage timings of /query to this JSONL file"
+    )
+    parser.add_argument(
+        "--langfuse",
+        action='store_true',
+        help="Send llama-index traces to Langfuse (configured by the LANGFUSE_* environment variables)"
+    )
+    parser.add_argument(
+        "--llm_api_base",
+        type=str,
+        nargs="+",
+        default=["http://0.0.0.0:8000/v1"],
+        help="OpenAI-compatible endpoints of the LLM (vLLM, or src/stubs.py for benchmarks); "
+             "with several, requests are balanced across them"
+    )
+    parser.add_argument(
+        "--llm_model",
+        type=str,
+        default="models/rbln_vllm_EEVE-Korean-Instruct-10.8B-v1.0_npu8_batch1_max4096",
+        help="Model name served by vLLM (its --model, see run_vllm.sh)"
+    )
+    parser.add_argument(
+        "--llm_health_interval",
+        type=float,
+        default=10,
+        help="Seconds between health checks of the LLM endpoints when there are several (0 to disable)"
+    )
+    parser.add_argument(
+        "--stub_embedding",
+        type=int,
+        default=0,
+        help="Embed queries with a CPU hashing stub of this dimension instead of the NPU model, for benchmarks (0 to disable)"
+    )
+    parser.add_argument(
+        "--background_startup",
+        action='store_true',
+        help="Accept connections (health checks) at once and load the models and index in the background"
+    )
+    parser.add_argument(
+        "--startup_timeout",
+        type=float,
+        default=60,
+        help="Seconds a request waits for the server to finish loading before it gets a 503"
+    )
+    parser.add_argument(
+        "--prompt_layout",
+        type=str,
+        choices=["prefix_stable", "legacy"],
+        default="prefix_stable",
+        help="prefix_stable: fixed instructions, then the conversation, then documents and question, "
+             "so vLLM's prefix cache is reused across turns; legacy: documents in the system prompt"
+    )
+    parser.add_argument(
+        "--max_concurrency",
+        type=int,
+        default=None,
+        help="Requests sent to the LLM at once, the rest wait in a queue "
+             "(match vLLM's --max-num-seqs times the endpoints; default: one per --llm_api_base)"
+    )
+    parser.add_argument(
+        "--max_queue",
+        type=int,
+        default=32,
+        help="Requests waiting for the LLM beyond which new ones get a 429"
+    )
+    parser.add_argument(
+        "--queue_deadline",
+        type=float,
+        default=120,
+        help="Seconds a request may wait for the LLM; requests estimated to wait longer get a 429"
+    )
+    parser.add_argument(
+        "--service_time",
+        type=float,
+        default=20,
+        help="Initial estimate of the seconds one request holds the LLM, updated as requests finish"
+    )
+    parser.add_argument(
+        "--queue_update_interval",
+        type=float,
+        default=2,
+        help="Seconds between queue position events sent to a waiting request"
+    )
     return parser.parse_args()
 
 def create_app(config):
@@ -50,29 +157,183 @@ def create_app(config):
     else:
         flask_app.logger.setLevel(logging.INFO)
 
+    # 모델, 인덱스 등은 각각 별도 스레드에서 동시에 로드되고, 요청은 필요한 컴포넌트를 기다림
+    startup = Startup(flask_app.logger)
+    flask_app.extensions['startup'] = startup
+
+    # llama-index's packages cannot be imported from several threads at once,
+    # so they are imported first; the components then load concurrently
+    def import_packages():
+        import llama_index.core
+        import llama_index.llms.openai_like
+        import src.index_manager
+        import src.llm_pool
+        import src.telemetry
+
     # Set up the model and the large language model settings
-    Settings.embed_model = RBLNBGEM3Embeddings(
-        rbln_compiled_model_name="models/rbln_bge-m3_batch1_max8192",
-    )
-    Settings.llm = OpenAILike(
-        model="models/rbln_vllm_EEVE-Korean-Instruct-10.8B-v1.0_npu8_batch1_max4096", 
-        api_base="http://0.0.0.0:8000/v1", 
-        api_key="byeonhophd_backend_980518", 
-        max_tokens=1024, 
-        is_chat_model=True  # Set this to apply chat template
-    )
+    def load_embed_model():
+        if config.stub_embedding > 0:
+            from src.stubs import StubEmbedding
+            return StubEmbedding(embed_dim=config.stub_embedding)
+        from src.utils import RBLNBGEM3Embeddings
+        return RBLNBGEM3Embeddings(
+            rbln_compiled_model_name="models/rbln_bge-m3_batch1_max8192",
+        )
+
+    def load_llm():
+        from llama_index.core import Settings
+        from llama_index.llms.openai_like import OpenAILike
+        from src.llm_pool import create_llm_pool
+        llm_kwargs = dict(
+            model=config.llm_model, 
+            api_key="byeonhophd_backend_980518", 
+            max_tokens=1024, 
+            is_chat_model=True  # Set this to apply chat template
+        )
+        if len(config.llm_api_base) == 1:
+            Settings.llm = OpenAILike(api_base=config.llm_api_base[0], **llm_kwargs)
+        else:
+            # vLLM replica 여러 개: 부하가 적은 쪽으로 보내고, 같은 대화는 같은 replica로 (prefix cache)
+            Settings.llm = create_llm_pool(
+                config.llm_api_base, health_interval=config.llm_health_interval, **llm_kwargs,
+            )
+        return Settings.llm
+
+    # /query 단계별 시간은 /metrics 로 노출하고, --trace_file 이 있으면 요청마다 기록
+    def load_telemetry():
+        from llama_index.core import set_global_handler
+        from src import telemetry
+        telemetry.install_embedding_timer()
+        if config.langfuse:
+            set_global_handler("langfuse")
+        return telemetry.TraceExporter(config.trace_file) if config.trace_file else None
 
     # Set up the vector store and index
-    vector_store = FaissVectorStore.from_persist_dir(config.vector_store_dir)
-    storage_context = StorageContext.from_defaults(
-        vector_store=vector_store, 
-        persist_dir=config.vector_store_dir
+    # 새 인덱스는 백그라운드에서 로드한 뒤 교체하고, 이전 인덱스는 처리 중인 요청이 끝나면 해제
+    def load_index():
+        from llama_index.core import Settings
+        from src.index_manager import DeferredEmbedding, IndexManager, load_index_version
+        # The index only keeps a reference to the embed model, so it need not wait for it
+        Settings.embed_model = DeferredEmbedding(lambda: startup.get("embed_model"))
+        index_manager = IndexManager(
+            lambda path: load_index_version(path, shard_poll_interval=config.shard_poll_interval),
+            config.vector_store_dir,
+            drain_timeout=config.drain_timeout,
+        )
+        if config.index_poll_interval > 0:
+            index_manager.start_watcher(config.index_poll_interval)
+        return index_manager
+
+    startup.submit("imports", import_packages)
+    startup.submit("embed_model", load_embed_model, "imports")
+    startup.submit("llm", load_llm, "imports")
+    startup.submit("telemetry", load_telemetry, "imports")
+    startup.submit("index", load_index, "imports")
+    startup.seal()
+
+    if config.prompt_layout == "prefix_stable":
+        # 고정 지시문은 system에, 참고 문서와 질문은 마지막 user 메시지에 두어
+        # 이전 대화까지의 prompt가 매 요청 동일하게 유지됨 (vLLM prefix caching)
+        system_prompt = (
+            "당신은 법률 관련 전문 지식을 보유한 대한민국의 법률 전문가이다."
+            "사용자가 제공한 질문을 바탕으로 핵심만 정확하게 답변하시오."
+            "참고 문서는 관련 없는 정보일 수 있다. 사용자의 질문에 벗어나는 법률이나 참고 문서는 반드시 제외하시오."
+        )
+        context_prompt = (
+            "참고 문서:\n{context_str}\n\n"
+            "질문: {query_str}"
+        )
+    else:
+        system_prompt = None
+        context_prompt = (
+            "당신은 법률 관련 전문 지식을 보유한 대한민국의 법률 전문가이다."
+            "사용자가 제공한 질문을 바탕으로 핵심만 정확하게 답변하시오."
+            "\n참고 문서:\n{context_str}"
+            "참고 문서는 관련 없는 정보일 수 있다. 사용자의 질문에 벗어나는 법률이나 참고 문서는 반드시 제외하시오."
+        )
+
+    # Global dictionary to maintain chat memory (and shard sources) per conversation_id.
+    # Chat engines are built per request on the current index version
+    conversation_dict = {}
+    conversation_lock = threading.Lock()
+
+    # vLLM은 --max-num-seqs 만큼만 동시에 처리하므로, 나머지 요청은 여기서 순서를 기다림
+    scheduler = Scheduler(
+        capacity=config.max_concurrency or len(config.llm_api_base), max_queue=config.max_queue,
+        deadline=config.queue_deadline, service_time=config.service_time,
     )
-    index = load_index_from_storage(storage_context=storage_context)
+    flask_app.extensions['scheduler'] = scheduler
+
+    def sse_event(event, data):
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    def is_admin_request():
+        return request.remote_addr in ('127.0.0.1', '::1')
+
+    def not_ready():
+        """
+        Waits up to startup_timeout for every component; returns a 503 response if the
+        server is still loading (or failed to load), None once it is ready.
+        """
+        if startup.wait(config.startup_timeout) and startup.ready():
+            return None
+        return jsonify({'error': 'Server is not ready', **startup.status()}), 503
+
+    @flask_app.route('/healthz', methods=['GET'])
+    def healthz():
+        return jsonify({'status': 'ok'})
+
+    @flask_app.route('/readyz', methods=['GET'])
+    def readyz():
+        return jsonify(startup.status()), 200 if startup.ready() else 503
+
+    @flask_app.route('/admin/reload', methods=['POST'])
+    def admin_reload():
+        if not is_admin_request():
+            return jsonify({'error': 'Forbidden'}), 403
+        response = not_ready()
+        if response is not None:
+            return response
+        index_manager = startup.get("index")
+        data = request.get_json(silent=True) or {}
+        path = data.get('vector_store_dir')
+        if path is not None and not os.path.isdir(path):
+            return jsonify({'error': f'No such directory: {path}'}), 400
+        started = index_manager.reload(path)
+        return jsonify({'started': started, **index_manager.status()}), 202 if started else 409
+
+    @flask_app.route('/admin/index', methods=['GET'])
+    def admin_index():
+        if not is_admin_request():
+            return jsonify({'error': 'Forbidden'}), 403
+        response = not_ready()
+        if response is not None:
+            return response
+        return jsonify(startup.get("index").status())
+
+    @flask_app.route('/admin/scheduler', methods=['GET'])
+    def admin_scheduler():
+        if not is_admin_request():
+            return jsonify({'error': 'Forbidden'}), 403
+        return jsonify(scheduler.status())
 
-    # Global dictionary to maintain chat engines per conversation_id
-    chat_engine_dict = {}
-    chat_engine_lock = threading.Lock()
+    @flask_app.route('/admin/llm', methods=['GET'])
+    def admin_llm():
+        if not is_admin_request():
+            return jsonify({'error': 'Forbidden'}), 403
+        response = not_ready()
+        if response is not None:
+            return response
+        from src.llm_pool import LLMPool
+        llm = startup.get("llm")
+        if isinstance(llm, LLMPool):
+            return jsonify(llm.status())
+        return jsonify({'backends': [{'api_base': llm.api_base}]})
+
+    @flask_app.route('/metrics', methods=['GET'])
+    def metrics():
+        from src import telemetry
+        return Response(telemetry.render_metrics(), content_type=telemetry.METRICS_CONTENT_TYPE)
 
     @flask_app.route('/query', methods=['POST'])
     def query():
@@ -83,43 +344,111 @@ def create_app(config):
 
         question = data.get('question')
         conversation_id = data.get('conversation_id')
+        # 검색할 shard 제한 (예: ["law"]), 대화를 처음 만들 때만 적용됨
+        sources = data.get('sources')
+        # 작을수록 먼저 처리됨
+        priority = data.get('priority', 0)
+        if not isinstance(priority, int):
+            return jsonify({'error': 'priority must be an integer'}), 400
 
         if not conversation_id:
             # Generate a new conversation_id
             conversation_id = str(uuid.uuid4())
 
+        response = not_ready()
+        if response is not None:
+            return response
+        from llama_index.core import Settings
+        from llama_index.core.memory import ChatMemoryBuffer
+        from src import llm_pool, telemetry
+        index_manager = startup.get("index")
+        trace_exporter = startup.get("telemetry")
+
         flask_app.logger.info(f"Received question: {question} for conversation_id: {conversation_id}")
 
+        trace = telemetry.RequestTrace(str(uuid.uuid4()), conversation_id=conversation_id)
+
+        def finish_request(status):
+            total = time.perf_counter() - trace.start
+            telemetry.observe("total", total, trace.start, trace)
+            telemetry.finish(trace, status)
+            if trace_exporter is not None:
+                try:
+                    trace_exporter.export(trace)
+                except OSError as e:
+                    flask_app.logger.warning(f"Failed to export trace {trace.request_id}: {e}")
+
         try:
-            with chat_engine_lock:
-                # Check if chat_engine exists for this conversation_id
-                if conversation_id in chat_engine_dict:
-                    chat_engine = chat_engine_dict[conversation_id]
+            ticket = scheduler.submit(conversation_id, priority)
+        except Overloaded as e:
+            finish_request("rejected")
+            flask_app.logger.warning(f"Rejected question for conversation_id: {conversation_id}: {e}")
+            response = jsonify({'error': str(e), 'retry_after': e.retry_after})
+            response.headers['Retry-After'] = str(math.ceil(e.retry_after))
+            return response, 429
+
+        # 이 요청은 시작부터 스트리밍이 끝날 때까지 같은 인덱스 버전을 사용
+        index_version = index_manager.acquire()
+        try:
+            with conversation_lock:
+                # Check if a conversation exists for this conversation_id
+                if conversation_id in conversation_dict:
+                    memory, sources = conversation_dict[conversation_id]
                 else:
-                    # Create a new chat_engine and store it
-                    chat_engine = index.as_chat_engine(
-                        chat_mode="condense_plus_context",
-                        context_prompt=(
-                            "당신은 법률 관련 전문 지식을 보유한 대한민국의 법률 전문가이다."
-                            "사용자가 제공한 질문을 바탕으로 핵심만 정확하게 답변하시오."
-                            "\n참고 문서:\n{context_str}"
-                            "참고 문서는 관련 없는 정보일 수 있다. 사용자의 질문에 벗어나는 법률이나 참고 문서는 반드시 제외하시오."
-                        ),
-                        streaming=True,
-                        use_async=True,
-                    )
-                    chat_engine_dict[conversation_id] = chat_engine
-
-            # Generate streaming response
-            streaming_response = chat_engine.stream_chat(question)
+                    # Create a new conversation memory and store it
+                    memory = ChatMemoryBuffer.from_defaults(token_limit=Settings.llm.metadata.context_window - 256)
+                    conversation_dict[conversation_id] = (memory, sources)
+            chat_engine = index_version.chat_engine(memory, context_prompt, sources, system_prompt)
 
             def generate():
-                for text in streaming_response.response_gen:
-                    yield f"data: {text}\n\n"
-                yield "data: [DONE]\n\n"
+                status = "error"
+                try:
+                    # LLM 차례가 올 때까지 대기열 위치를 event: queue 로 알림
+                    timeout = 0
+                    while not ticket.wait(timeout):
+                        if ticket.waited() > scheduler.deadline:
+                            status = "timeout"
+                            yield sse_event("error", {'error': f'Waited more than {scheduler.deadline:.0f}s for the LLM'})
+                            return
+                        yield sse_event("queue", {'position': ticket.position(), 'estimated_wait': round(ticket.estimated_wait(), 1)})
+                        timeout = config.queue_update_interval
+                    telemetry.observe("queue_wait", ticket.waited(), ticket.enqueued, trace)
+
+                    # Generate streaming response
+                    with telemetry.activate(trace), llm_pool.conversation(conversation_id):
+                        streaming_response = chat_engine.stream_chat(question)
+
+                    stream_start = time.perf_counter()
+                    first_token = None
+                    for text in streaming_response.response_gen:
+                        if first_token is None:
+                            first_token = time.perf_counter()
+                            telemetry.observe("time_to_first_token", first_token - trace.start, trace.start, trace)
+                        yield f"data: {text}\n\n"
+                    telemetry.observe("stream", time.perf_counter() - stream_start, stream_start, trace)
+                    status = "ok"
+                    yield "data: [DONE]\n\n"
+                except GeneratorExit:
+                    # 클라이언트가 스트림 도중 연결을 끊음
+                    status = "cancelled"
+                    raise
+                except Exception as e:
+                    # 응답(200)이 이미 시작되어 오류는 event: error 로 전달
+                    flask_app.logger.error(f"Error processing query: {str(e)}\n{traceback.format_exc()}")
+                    yield sse_event("error", {'error': str(e)})
+                finally:
+                    ticket.release()
+                    finish_request(status)
 
-            return Response(stream_with_context(generate()), content_type='text/event-stream')
+            response = Response(stream_with_context(generate()), content_type='text/event-stream')
+            response.call_on_close(index_version.release)
+            # 스트림이 시작되기 전에 연결이 끊겨도 대기열에서 빠지도록
+            response.call_on_close(ticket.release)
+            return response
         except Exception as e:
+            ticket.release()
+            index_version.release()
+            finish_request("error")
             error_trace = traceback.format_exc()
             flask_app.logger.error(f"Error processing query: {str(e)}\n{error_trace}")
             return jsonify({'error': str(e), 'trace': error_trace}), 500
@@ -129,6 +458,12 @@ def create_app(config):
 def main():
     config = parse_args()
     app = create_app(config)
+    if not config.background_startup:
+        # 모든 컴포넌트가 로드된 뒤에 요청을 받음 (로드 자체는 동시에 진행)
+        startup = app.extensions['startup']
+        startup.wait()
+        if not startup.ready():
+            raise SystemExit(f"Failed to start: {startup.errors()}")
     app.run(host=config.host, port=config.port, debug=config.debug, use_reloader=False)
 
 if __name__ == "__main__":
@@ -0,0 +1,102 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import time
+import types
+
+from bs4 import BeautifulSoup
+
+import law_list_crawling
+
+
+BODY_PATTERN = re.compile(r'^law_details_(.+)_body\.html$')
+
+
+def load_revision(rev):
+    """
+    Loads law_list_crawling.py as it was at a git revision, to benchmark against.
+    """
+    source = subprocess.check_output(
+        ['git', 'show', f'{rev}:./law_list_crawling.py'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    module = types.ModuleType(f'law_list_crawling@{rev}')
+    exec(compile(source, f'{rev}:law_list_crawling.py', 'exec'), module.__dict__)
+    return module
+
+
+def load_popup_text(raw_dir, file_idx):
+    """
+    Rebuilds the popup_text mapping from the saved law_details_{id}_popup_{idx}.html files.
+    """
+    popup_text = {}
+    prefix = f'law_details_{file_idx}_popup_'
+    for filename in os.listdir(raw_dir):
+        if filename.startswith(prefix) and filename.endswith('.html'):
+            with open(os.path.join(raw_dir, filename), 'r', encoding='utf-8') as f:
+                pgroup = BeautifulSoup(f.read(), 'html.parser').find('div', class_='pgroup')
+            if pgroup is not None:
+                popup_text[filename[len(prefix):-len('.html')]] = pgroup.decode_contents()
+    return popup_text
+
+
+def run(module, body_html, popup_text, repeat):
+    """
+    Times process_law_detail and postprocess_law_data of a module on one saved law page.
+    Soup construction is excluded since both stages mutate the tree.
+    Returns (best parse seconds, best dedup seconds, result).
+    """
+    best_parse = best_dedup = float('inf')
+    for _ in range(repeat):
+        content_body_div = BeautifulSoup(body_html, 'html.parser').find('div', id='contentBody')
+
+        start = time.perf_counter()
+        processed_law = module.process_law_detail(content_body_div, popup_text)
+        best_parse = min(best_parse, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        result = module.postprocess_law_data(processed_law)
+        best_dedup = min(best_dedup, time.perf_counter() - start)
+    return best_parse, best_dedup, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the HTML law parse-and-dedup path against a git revision.')
+    parser.add_argument('--raw_dir', default='data/jomun/law_details_raw', help='Directory of saved *_body.html files')
+    parser.add_argument('--baseline_rev', required=True,
+                        help='Git revision of law_list_crawling.py to compare against, '
+                             'e.g. the parent of the parse-and-dedup speedup commit (8ea0ea4^)')
+    parser.add_argument('--top', type=int, default=10, help='Benchmark the N largest pages')
+    parser.add_argument('--repeat', type=int, default=3, help='Timing repetitions per page (best is reported)')
+    args = parser.parse_args()
+
+    baseline = load_revision(args.baseline_rev)
+    bodies = [f for f in os.listdir(args.raw_dir) if BODY_PATTERN.match(f)]
+    bodies = sorted(bodies, key=lambda f: os.path.getsize(os.path.join(args.raw_dir, f)), reverse=True)[:args.top]
+
+    print(f"{'file':<36}{'size(KB)':>10}{'base parse':>12}{'parse':>9}{'base dedup':>12}{'dedup':>9}{'speedup':>9}{'same':>6}")
+    total_base = total_current = 0.0
+    for filename in bodies:
+        path = os.path.join(args.raw_dir, filename)
+        with open(path, 'r', encoding='utf-8') as f:
+            body_html = f.read()
+        popup_text = load_popup_text(args.raw_dir, BODY_PATTERN.match(filename).group(1))
+
+        base_parse, base_dedup, base_result = run(baseline, body_html, popup_text, args.repeat)
+        parse, dedup, result = run(law_list_crawling, body_html, popup_text, args.repeat)
+        total_base += base_parse + base_dedup
+        total_current += parse + dedup
+        same = json.dumps(base_result, ensure_ascii=False) == json.dumps(result, ensure_ascii=False)
+        print(f"{filename:<36}{os.path.getsize(path) / 1024:>10.0f}"
+              f"{base_parse * 1000:>10.1f}ms{parse * 1000:>7.1f}ms{base_dedup * 1000:>10.1f}ms{dedup * 1000:>7.1f}ms"
+              f"{(base_parse + base_dedup) / (parse + dedup):>8.2f}x{str(same):>6}")
+
+    if bodies:
+        print(f"total: {args.baseline_rev} {total_base:.2f}s, current {total_current:.2f}s "
+              f"({total_base / total_current:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import os
+import time
+import tracemalloc
+
+
+def load_parsers(kind):
+    """
+    Returns the raw file prefix and the (tree, iterparse) parser pair for the document kind.
+    """
+    if kind == 'law':
+        from law_list_crawling_xml import parse_law_detail, iterparse_law_detail
+
+        def tree_parser(path):
+            with open(path, 'rb') as f:
+                return parse_law_detail(f.read())
+        return 'law_text_', tree_parser, iterparse_law_detail
+
+    from law_case_crawling_xml import parse_case_detail, iterparse_case_detail
+
+    def tree_parser(path):
+        with open(path, 'rb') as f:
+            return parse_case_detail(f.read(), source=path)
+    return 'case_text_', tree_parser, iterparse_case_detail
+
+
+def measure(parse, path, repeat):
+    """
+    Returns (best wall time in seconds, peak traced memory in bytes, result).
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = parse(path)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    parse(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the tree and iterparse XML detail parsers.')
+    parser.add_argument('--kind', choices=['law', 'case'], default='law', help='Document kind')
+    parser.add_argument('--raw_dir', default='data/jomun_xml/law_details_raw', help='Directory of raw detail XML files')
+    parser.add_argument('--top', type=int, default=10, help='Benchmark the N largest files')
+    parser.add_argument('--repeat', type=int, default=3, help='Timing repetitions per file (best is reported)')
+    args = parser.parse_args()
+
+    prefix, tree_parser, stream_parser = load_parsers(args.kind)
+    paths = [
+        os.path.join(args.raw_dir, f) for f in os.listdir(args.raw_dir)
+        if f.startswith(prefix) and f.endswith('.xml')
+    ]
+    paths = sorted(paths, key=os.path.getsize, reverse=True)[:args.top]
+
+    print(f"{'file':<32}{'size(KB)':>10}{'tree(ms)':>11}{'iter(ms)':>11}{'speedup':>9}"
+          f"{'tree peak(MB)':>15}{'iter peak(MB)':>15}{'same':>6}")
+    total_tree = total_iter = 0.0
+    for path in paths:
+        tree_time, tree_peak, tree_result = measure(tree_parser, path, args.repeat)
+        iter_time, iter_peak, iter_result = measure(stream_parser, path, args.repeat)
+        total_tree += tree_time
+        total_iter += iter_time
+        print(f"{os.path.basename(path):<32}{os.path.getsize(path) / 1024:>10.0f}"
+              f"{tree_time * 1000:>11.1f}{iter_time * 1000:>11.1f}{tree_time / iter_time:>8.2f}x"
+              f"{tree_peak / 2**20:>15.1f}{iter_peak / 2**20:>15.1f}{str(tree_result == iter_result):>6}")
+
+    if paths:
+        print(f"total: tree {total_tree:.2f}s, iterparse {total_iter:.2f}s ({total_tree / total_iter:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+import os
+import re
+import shutil
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+
+# Canonical corpus record written by the postprocessors and read by the index builders
+CORPUS_SCHEMA = pa.schema([
+    ('id', pa.string()),
+    ('title', pa.string()),
+    ('content', pa.string()),
+    # 법령: postprocess_law_data의 filtered 항목 여부, 판례: 항상 True
+    ('filtered', pa.bool_()),
+])
+
+# <root>/source=<law|case>/year=<YYYY>/part-N.parquet
+PARTITIONING = ds.partitioning(pa.schema([('source', pa.string()), ('year', pa.int16())]), flavor='hive')
+YEAR_PARTITIONING = ds.partitioning(pa.schema([('year', pa.int16())]), flavor='hive')
+
+YEAR_PATTERN = re.compile(r'(\d{4})')
+
+
+def parse_year(date):
+    """
+    Returns the year of a 공포일자/선고일자 style date (e.g. '20240101', '2024.01.01'), or 0 if unknown.
+    """
+    match = YEAR_PATTERN.search(date or '')
+    return int(match.group(1)) if match else 0
+
+
+def to_batches(records, batch_size=8192):
+    """
+    Groups {id, title, content, filtered, year} dicts into record batches of CORPUS_SCHEMA plus year.
+    """
+    schema = CORPUS_SCHEMA.append(pa.field('year', pa.int16()))
+    columns = {name: [] for name in schema.names}
+    for record in records:
+        for name in schema.names:
+            columns[name].append(record.get(name, True if name == 'filtered' else None))
+        if len(columns['id']) >= batch_size:
+            yield pa.RecordBatch.from_pydict(columns, schema=schema)
+            columns = {name: [] for name in schema.names}
+    if columns['id']:
+        yield pa.RecordBatch.from_pydict(columns, schema=schema)
+
+
+def write_corpus(root, source, records, batch_size=8192, max_rows_per_file=1_000_000):
+    """
+    Streams records into the `source` partition of the corpus, partitioned by year.
+    The partition is written next to the old one and swapped in when complete,
+    so readers never see a half-written source. Raises ValueError, leaving the old
+    partition in place, if there are no records.
+    """
+    schema = CORPUS_SCHEMA.append(pa.field('year', pa.int16()))
+    target = os.path.join(root, f'source={source}')
+    # '_' 로 시작하는 디렉토리는 dataset 탐색에서 제외됨
+    tmp_target = os.path.join(root, f'_source={source}.part')
+    shutil.rmtree(tmp_target, ignore_errors=True)
+
+    ds.write_dataset(
+        to_batches(records, batch_size),
+        tmp_target,
+        schema=schema,
+        format='parquet',
+        partitioning=YEAR_PARTITIONING,
+        basename_template='part-{i}.parquet',
+        max_rows_per_file=max_rows_per_file,
+        max_rows_per_group=min(max_rows_per_file, 65536),
+    )
+
+    if not os.path.isdir(tmp_target):
+        # 레코드가 하나도 없으면 write_dataset이 디렉토리를 만들지 않음, 기존 partition은 그대로 둠
+        raise ValueError(f"No records to write for source={source}, keeping {target}")
+
+    old_target = os.path.join(root, f'_source={source}.old')
+    # 이전 실행이 교체 도중 중단되어 남은 .old가 있으면 os.replace가 실패함
+    shutil.rmtree(old_target, ignore_errors=True)
+    if os.path.exists(target):
+        os.replace(target, old_target)
+    os.replace(tmp_target, target)
+    shutil.rmtree(old_target, ignore_errors=True)
+    return target
+
+
+def open_corpus(root):
+    return ds.dataset(root, format='parquet', partitioning=PARTITIONING)
+
+
+def corpus_filter(sources=None, years=None, filtered_only=False):
+    expression = None
+    conditions = []
+    if sources:
+        conditions.append(ds.field('source').isin(list(sources)))
+    if years:
+        conditions.append(ds.field('year').isin([int(year) for year in years]))
+    if filtered_only:
+        conditions.append(ds.field('filtered'))
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def iter_corpus_batches(root, sources=None, years=None, filtered_only=False,
+                        columns=('title', 'content'), batch_size=65536):
+    """
+    Yields Arrow record batches of the corpus. Partitions outside `sources`/`years`
+    are pruned without being opened, and only the requested columns are read.
+    """
+    dataset = open_corpus(root)
+    yield from dataset.to_batches(
+        columns=list(columns),
+        filter=corpus_filter(sources, years, filtered_only),
+        batch_size=batch_size,
+    )
+
+
+def count_corpus(root, sources=None, years=None, filtered_only=False):
+    return open_corpus(root).count_rows(filter=corpus_filter(sources, years, filtered_only))
+
+
+def crawl_item(record_id):
+    """
+    The crawled (source, id) a corpus record was flattened from, as recorded in the
+    crawlers' changes.json: law records 'law_detail_<법령ID>/<n>' and case records
+    'case_detail_<판례일련번호>' map to ('law', 법령ID) and ('case', 판례일련번호).
+    Returns None for records not named after a crawled file.
+    """
+    name = record_id.split('/', 1)[0]
+    for source in ('law', 'case'):
+        prefix = f'{source}_detail_'
+        if name.startswith(prefix):
+            return source, name[len(prefix):]
+    return None
+
+
+def load_documents(root, sources=None, years=None, filtered_only=False, items=None):
+    """
+    Loads the corpus as llama-index Documents with the title as metadata and the
+    record id as doc id. With `items`, a set of crawl_item pairs, only the records
+    of those laws/cases are loaded.
+    """
+    from llama_index.core.schema import Document
+
+    documents = []
+    columns = ('id', 'title', 'content')
+    for batch in iter_corpus_batches(root, sources, years, filtered_only, columns=columns):
+        for record_id, title, content in zip(*(batch.column(name).to_pylist() for name in columns)):
+            if items is not None and crawl_item(record_id) not in items:
+                continue
+            documents.append(Document(id_=record_id, text=content, metadata={"title": title}))
+    return documents
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import math
+import os
+import time
+
+
+def content_hash(data):
+    """
+    Returns the sha256 hex digest of raw bytes.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def normalize_field(value):
+    """
+    Normalizes list fields so that values read back from CSV compare equal to freshly crawled ones.
+    """
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+class CrawlManifest:
+    """
+    Records, per crawled item, the version key taken from the list endpoint
+    (e.g. 법령일련번호/공포일자/시행일자) and the hash of the raw detail document.
+    A fresh list fetch is diffed against it so only new or amended items are re-crawled.
+    """
+    def __init__(self, path, id_field, key_fields, items=None):
+        self.path = path
+        self.id_field = id_field
+        self.key_fields = key_fields
+        self.items = items if items is not None else {}
+
+    @classmethod
+    def load(cls, path, id_field, key_fields):
+        items = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                items = json.load(f).get('items', {})
+        return cls(path, id_field, key_fields, items)
+
+    def item_id(self, row):
+        return normalize_field(row[self.id_field])
+
+    def version_key(self, row):
+        return '|'.join(normalize_field(row.get(field)) for field in self.key_fields)
+
+    def diff(self, rows):
+        """
+        Compares list rows against the manifest.
+        Returns (scheduled, removed): the rows that are new or whose version key changed,
+        and the ids recorded in the manifest that no longer appear in the list.
+        """
+        scheduled = []
+        seen = set()
+        for row in rows:
+            item_id = self.item_id(row)
+            seen.add(item_id)
+            entry = self.items.get(item_id)
+            if entry is None or entry.get('version') != self.version_key(row):
+                scheduled.append(row)
+        removed = [item_id for item_id in self.items if item_id not in seen]
+        return scheduled, removed
+
+    def is_stale(self, row):
+        """
+        Whether the item is known but recorded under a different version key.
+        """
+        entry = self.items.get(self.item_id(row))
+        return entry is not None and entry.get('version') != self.version_key(row)
+
+    def has_content(self, item_id, digest):
+        entry = self.items.get(item_id)
+        return entry is not None and entry.get('hash') == digest
+
+    def update(self, row, digest):
+        self.items[self.item_id(row)] = {
+            'version': self.version_key(row),
+            'hash': digest,
+            'crawled_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+
+    def remove(self, item_id):
+        self.items.pop(item_id, None)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.part"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'id_field': self.id_field, 'key_fields': self.key_fields, 'items': self.items},
+                      f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+# Written by the index builders next to each index: the last changes.json run applied per source
+APPLIED_CHANGES_FILE = 'applied_changes.json'
+
+
+def write_changes(path, source, updated, removed):
+    """
+    Appends the ids touched by this run to the crawler's change log. The log is never
+    consumed: every index built from the corpus records the last run it applied in its
+    own directory (see read_changes), so several indexes and shards can follow it.
+    """
+    log = read_change_file(path) if os.path.exists(path) else {'source': source, 'runs': []}
+    runs = log['runs']
+    runs.append({
+        'run': runs[-1]['run'] + 1 if runs else 1,
+        'updated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'updated': sorted(set(updated)),
+        'removed': sorted(set(removed)),
+    })
+    tmp_path = f"{path}.part"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'source': source, 'runs': runs}, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, path)
+
+
+def read_change_file(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def read_changes(paths, applied=None):
+    """
+    Merges the runs of the crawlers' change logs that come after `applied`
+    ({source: last applied run}); an id keeps only its latest change.
+    Returns (updated, removed, latest): sets of (source, id) pairs, e.g. ('law', '001234'),
+    and `applied` advanced to the last run of every log.
+    """
+    applied = dict(applied or {})
+    updated, removed = set(), set()
+    latest = dict(applied)
+    for path in paths:
+        log = read_change_file(path)
+        source = log.get('source')
+        if source is None or 'runs' not in log:
+            raise ValueError(f"{path} is not a change log of law_list_crawling_xml.py/law_case_crawling_xml.py")
+        for run in log['runs']:
+            if run['run'] <= applied.get(source, 0):
+                continue
+            for item_id in run['updated']:
+                updated.add((source, item_id))
+                removed.discard((source, item_id))
+            for item_id in run['removed']:
+                removed.add((source, item_id))
+                updated.discard((source, item_id))
+            latest[source] = max(latest.get(source, 0), run['run'])
+    return updated, removed, latest
+
+
+def load_applied_changes(index_dir):
+    path = os.path.join(index_dir, APPLIED_CHANGES_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_applied_changes(index_dir, applied):
+    with open(os.path.join(index_dir, APPLIED_CHANGES_FILE), 'w', encoding='utf-8') as f:
+        json.dump(applied, f, ensure_ascii=False, indent=4)
@@ -0,0 +1,151 @@
+import asyncio
+import os
+import random
+from urllib.parse import urlsplit
+
+import aiohttp
+from tqdm import tqdm
+
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class HostRateLimiter:
+    """
+    Spaces out request starts so that each host sees at most `rate` requests per second.
+    """
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._next_slot = {}
+        self._locks = {}
+
+    async def acquire(self, host):
+        if not self.interval:
+            return
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class AsyncFetcher:
+    """
+    Concurrent HTTP fetcher shared by the law.go.kr crawlers.
+
+    Keeps a pool of keep-alive connections, bounds the number of in-flight requests,
+    rate limits per host and retries failures with exponential backoff.
+    Use as `async with AsyncFetcher(...) as fetcher:`.
+    """
+    def __init__(self, concurrency=8, rate_limit=10.0, max_retries=5,
+                 backoff_base=1.0, backoff_max=60.0, timeout=60.0):
+        if max_retries < 0:
+            raise ValueError(f"max_retries must be >= 0, got {max_retries}")
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self._rate_limiter = HostRateLimiter(rate_limit)
+        self._session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency,
+            limit_per_host=self.concurrency,
+            keepalive_timeout=30,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._session.close()
+        self._session = None
+
+    def _backoff(self, attempt):
+        # Full jitter keeps retries from many workers from hitting the host in lockstep
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(delay / 2, delay)
+
+    async def fetch(self, url):
+        """
+        Fetches the url and returns the response body as bytes. A failed request is
+        retried up to max_retries times (0: a single attempt); raises the last error
+        once they are exhausted.
+        """
+        host = urlsplit(url).netloc
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            async with self._semaphore:
+                await self._rate_limiter.acquire(host)
+                try:
+                    async with self._session.get(url) as response:
+                        if response.status in RETRYABLE_STATUS:
+                            raise aiohttp.ClientResponseError(
+                                response.request_info, response.history,
+                                status=response.status, message=response.reason,
+                            )
+                        response.raise_for_status()
+                        return await response.read()
+                except aiohttp.ClientResponseError as e:
+                    if e.status not in RETRYABLE_STATUS:
+                        raise
+                    last_error = e
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    last_error = e
+            if attempt < self.max_retries:
+                await asyncio.sleep(self._backoff(attempt))
+        raise last_error
+
+    async def download(self, url, path):
+        """
+        Fetches the url into `path`. The file is written atomically, so a partially
+        written file is never mistaken for a cached response.
+        """
+        response = await self.fetch(url)
+        tmp_path = f"{path}.part"
+        with open(tmp_path, 'wb') as f:
+            f.write(response)
+        os.replace(tmp_path, path)
+        return path
+
+    async def download_all(self, jobs, desc=None):
+        """
+        Downloads every (url, path) pair concurrently.
+        Returns a list of (url, path, error) for the jobs that failed.
+        """
+        async def run(url, path):
+            try:
+                await self.download(url, path)
+                return None
+            except Exception as e:
+                return url, path, e
+
+        tasks = [asyncio.ensure_future(run(url, path)) for url, path in jobs]
+        failed = []
+        for task in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc=desc):
+            result = await task
+            if result is not None:
+                failed.append(result)
+        return failed
+
+
+def download_all(jobs, concurrency=8, rate_limit=10.0, max_retries=5, desc=None):
+    """
+    Synchronous entry point for the crawler scripts.
+    Downloads every (url, path) pair and returns the failed jobs.
+    """
+    async def run():
+        async with AsyncFetcher(concurrency=concurrency, rate_limit=rate_limit,
+                                max_retries=max_retries) as fetcher:
+            return await fetcher.download_all(jobs, desc=desc)
+
+    return asyncio.run(run())
@@ -2,13 +2,17 @@ import argparse
 import os
 import re
 import json
-import time
 import pandas as pd
+from functools import partial
+from multiprocessing import Pool
 
-from tqdm import tqdm, trange
+from tqdm import tqdm
 from urllib.request import urlopen
 import xml.etree.ElementTree as ET
 
+from crawl_manifest import CrawlManifest, content_hash, normalize_field, write_changes
+from fetcher import download_all
+
 
 def check_total_count(url_link):
     """
@@ -29,6 +33,13 @@ def crawl_case_list(url_link, page_num):
     os.makedirs(os.path.join(args.data_dir, 'case_list_raw'), exist_ok=True)
     with open(os.path.join(args.data_dir, 'case_list_raw', f'case_list_{page_num}.xml'), 'wb') as f:
         f.write(response)
+    return parse_case_list(response)
+
+
+def parse_case_list(response):
+    """
+    Parses a raw case list page and returns a list of case information.
+    """
     xtree = ET.fromstring(response)
     
     try:
@@ -96,21 +107,31 @@ def crawl_case_detail(url_link, info, args):
         except Exception as e:
             print(f"Error downloading URL '{url_link}': {e}")
             return {}
-    
+
+    return parse_case_detail(response, source=url_link)
+
+
+CASE_FIELDS = ['판례정보일련번호', '사건명', '사건번호', '선고일자', '선고',
+               '법원명', '법원종류코드', '사건종류명', '사건종류코드',
+               '판결유형', '판시사항', '판결요지', '참조조문', '참조판례', '판례내용']
+
+CASE_SECTION_PATTERN = re.compile(r'【(.*?)】\s*(.*?)(?=【|$)', re.DOTALL)
+
+
+def parse_case_detail(response, source=None):
+    """
+    Parses a raw case detail XML and returns a dictionary of case information.
+    """
     try:
         xtree = ET.fromstring(response)
     except ET.ParseError as e:
-        print(f"Error parsing XML for '{url_link}': {e}")
+        print(f"Error parsing XML for '{source}': {e}")
         return {}
     
     panre_data = {}
     
     # 기본 정보 추출
-    fields = ['판례정보일련번호', '사건명', '사건번호', '선고일자', '선고',
-              '법원명', '법원종류코드', '사건종류명', '사건종류코드',
-              '판결유형', '판시사항', '판결요지', '참조조문', '참조판례', '판례내용']
-    
-    for field in fields:
+    for field in CASE_FIELDS:
         try:
             element = xtree.find(field)
             if element is not None and element.text is not None:
@@ -120,7 +141,42 @@ def crawl_case_detail(url_link, info, args):
         except Exception as e:
             print(f"Error parsing field '{field}': {e}")
             panre_data[field] = None
-    
+
+    return split_case_sections(panre_data)
+
+
+def iterparse_case_detail(source):
+    """
+    Streaming, single-pass variant of parse_case_detail.
+    `source` is a file path or a binary file object.
+    """
+    fields = set(CASE_FIELDS)
+    panre_data = dict.fromkeys(CASE_FIELDS)
+    seen = set()
+    depth = 0
+    try:
+        for event, elem in ET.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                depth += 1
+                continue
+            depth -= 1
+            # only direct children of the root, as xtree.find(field) would see
+            if depth == 1:
+                if elem.tag in fields and elem.tag not in seen:
+                    seen.add(elem.tag)
+                    panre_data[elem.tag] = elem.text
+                elem.clear()
+    except ET.ParseError as e:
+        print(f"Error parsing XML for '{source}': {e}")
+        return {}
+
+    return split_case_sections(panre_data)
+
+
+def split_case_sections(panre_data):
+    """
+    Splits the numbered summary fields into lists and 판례내용 into its 【】 sections.
+    """
     for field in ['판시사항', '판결요지', '참조조문', '참조판례']:
         if field in panre_data:
             panre_data[field] = split_numbered_items(panre_data[field])
@@ -135,8 +191,7 @@ def crawl_case_detail(url_link, info, args):
             text = ""
 
         # 정규 표현식을 사용하여 【키】와 그에 해당하는 값을 추출
-        pattern = re.compile(r'【(.*?)】\s*(.*?)(?=【|$)', re.DOTALL)
-        matches = pattern.findall(text)
+        matches = CASE_SECTION_PATTERN.findall(text)
 
         case_data = {}
         for key, value in matches:
@@ -176,48 +231,173 @@ def postprocess_crawl_case_detail(json_file):
     return ret
 
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description='Retrieve case information.')
-    parser.add_argument('--id', required=True, help='API Key ID')
-    parser.add_argument('--base', default='https://www.law.go.kr', help='Base URL')
-    parser.add_argument('--data_dir', default='data/case_xml', help='Data directory')
-    args = parser.parse_args()
+def parse_case_file(raw_path, detail_dir, postprocessed_dir, parser='iterparse'):
+    """
+    Parses one cached raw case XML into case_details and case_details_postprocessed.
+    Runs inside the parse worker pool.
+    """
+    case_id = os.path.basename(raw_path)[len('case_text_'):-len('.xml')]
+    try:
+        if parser == 'iterparse':
+            processed_case_detail = iterparse_case_detail(raw_path)
+        else:
+            with open(raw_path, 'rb') as f:
+                processed_case_detail = parse_case_detail(f.read(), source=raw_path)
+        with open(os.path.join(detail_dir, f'case_detail_{case_id}.json'), 'w') as f:
+            json.dump(processed_case_detail, f, ensure_ascii=False, indent=4)
+        postprocess = postprocess_crawl_case_detail(processed_case_detail)
+        with open(os.path.join(postprocessed_dir, f'case_detail_{case_id}.json'), 'w') as f:
+            json.dump(postprocess, f, ensure_ascii=False, indent=4)
+        return case_id, None
+    except Exception as e:
+        return case_id, str(e)
+
+
+def parse_raw_details(data_dir, workers=None, chunksize=16, parser='iterparse'):
+    """
+    Re-parses every cached case_details_raw XML with a process pool.
+    """
+    raw_dir = os.path.join(data_dir, 'case_details_raw')
+    detail_dir = os.path.join(data_dir, 'case_details')
+    postprocessed_dir = os.path.join(data_dir, 'case_details_postprocessed')
+    os.makedirs(detail_dir, exist_ok=True)
+    os.makedirs(postprocessed_dir, exist_ok=True)
+    raw_paths = sorted(
+        os.path.join(raw_dir, f) for f in os.listdir(raw_dir)
+        if f.startswith('case_text_') and f.endswith('.xml')
+    )
+    worker = partial(parse_case_file, detail_dir=detail_dir, postprocessed_dir=postprocessed_dir, parser=parser)
+    with Pool(processes=workers) as pool:
+        for case_id, error in tqdm(pool.imap_unordered(worker, raw_paths, chunksize=chunksize), total=len(raw_paths)):
+            if error:
+                print(f"Error parsing case {case_id}: {error}")
+
+
+def crawl(args):
+    """
+    Fetches the case list and every new or amended case detail, then parses them.
+    """
+    fetch_kwargs = dict(concurrency=args.concurrency, rate_limit=args.rate_limit, max_retries=args.max_retries)
 
     total_count = check_total_count(f"{args.base}/DRF/lawSearch.do?OC={args.id}&target=prec&type=XML&display=100&page=1")
 
     # check if law_list.csv exists
-    try:
-        case_list_df = pd.read_csv(os.path.join(args.data_dir, 'case_list.csv'))
+    list_path = os.path.join(args.data_dir, 'case_list.csv')
+    if os.path.exists(list_path) and not args.sync:
+        case_list_df = pd.read_csv(list_path, dtype=str)
         print("Loaded law_list.csv")
-    except FileNotFoundError:
+    else:
+        list_dir = os.path.join(args.data_dir, 'case_list_raw')
+        os.makedirs(list_dir, exist_ok=True)
+        pages = range(1, total_count // 100 + 2)
+        jobs = [
+            (f"{args.base}/DRF/lawSearch.do?OC={args.id}&target=prec&type=XML&display=100&page={page}",
+             os.path.join(list_dir, f'case_list_{page}.xml'))
+            for page in pages
+        ]
+        failed = download_all(jobs, desc='case list', **fetch_kwargs)
+        if failed:
+            raise Exception(f"Failed to fetch {len(failed)} case list pages: {failed[0][2]}")
         law_list = []
-        for page in trange(1, total_count // 100 + 2):
-            url_link = f"{args.base}/DRF/lawSearch.do?OC={args.id}&target=prec&type=XML&display=100&page={page}"
-            law_list.extend(crawl_case_list(url_link, page))
+        for page in pages:
+            with open(os.path.join(list_dir, f'case_list_{page}.xml'), 'rb') as f:
+                law_list.extend(parse_case_list(f.read()))
         # save law_list
-        case_list_df = pd.DataFrame(law_list)
-        case_list_df.to_csv(os.path.join(args.data_dir, 'case_list.csv'), index=False)
-    
-    # check if law_detail.json exists
-    for idx, row in tqdm(case_list_df.iterrows(), total=case_list_df.shape[0]):
-        max_retries = 5
-        retry_count = 0
-        while retry_count < max_retries:
-            try:
-                xml_url = f"{args.base}{row['판례상세링크'].replace('HTML', 'XML')}"
-                processed_case_detail = crawl_case_detail(xml_url, row, args)
+        case_list_df = pd.DataFrame(law_list, dtype=str)
+        case_list_df.to_csv(list_path, index=False)
+
+    # only new or amended cases are scheduled for detail fetch and parse
+    manifest = CrawlManifest.load(os.path.join(args.data_dir, 'manifest.json'),
+                                  id_field='판례일련번호', key_fields=['사건번호', '선고일자', '판결유형'])
+    scheduled, removed = manifest.diff([row for _, row in case_list_df.iterrows()])
+    print(f"{len(scheduled)} new or amended cases, {len(removed)} missing from the list")
+    # 목록 조회가 일부 실패하거나 페이지가 밀리면 정상 항목도 빠지므로, 명시적으로 요청하고 목록이 완전할 때만 삭제
+    listed = case_list_df['판례일련번호'].map(normalize_field).nunique()
+    if removed and not args.prune:
+        print(f"Keeping {len(removed)} cases missing from the list (use --prune to delete them)")
+        removed = []
+    elif removed and listed != total_count:
+        print(f"Not pruning {len(removed)} cases: the list has {listed} of {total_count} cases")
+        removed = []
+
+    raw_dir = os.path.join(args.data_dir, 'case_details_raw')
+    detail_dir = os.path.join(args.data_dir, 'case_details')
+    postprocessed_dir = os.path.join(args.data_dir, 'case_details_postprocessed')
+    os.makedirs(raw_dir, exist_ok=True)
+    os.makedirs(detail_dir, exist_ok=True)
+    os.makedirs(postprocessed_dir, exist_ok=True)
+
+    # fetch missing raw case details concurrently
+    jobs = []
+    for row in scheduled:
+        raw_path = os.path.join(raw_dir, f'case_text_{row["판례일련번호"]}.xml')
+        if manifest.is_stale(row) and os.path.exists(raw_path):
+            os.remove(raw_path)
+        if not os.path.exists(raw_path):
+            jobs.append((f"{args.base}{row['판례상세링크'].replace('HTML', 'XML')}", raw_path))
+    for url, _, e in download_all(jobs, desc='case details', **fetch_kwargs):
+        print(f"Failed after {args.max_retries} retries ({url}): {e}")
+
+    # parse case details from the raw cache
+    updated = []
+    for row in tqdm(scheduled):
+        case_id = manifest.item_id(row)
+        raw_path = os.path.join(raw_dir, f'case_text_{case_id}.xml')
+        postprocessed_path = os.path.join(postprocessed_dir, f'case_detail_{case_id}.json')
+        if not os.path.exists(raw_path):
+            continue
+        try:
+            with open(raw_path, 'rb') as f:
+                response = f.read()
+            digest = content_hash(response)
+            if not (manifest.has_content(case_id, digest) and os.path.exists(postprocessed_path)):
+                processed_case_detail = parse_case_detail(response, source=raw_path)
                 # save law_detail
-                os.makedirs(os.path.join(args.data_dir, 'case_details'), exist_ok=True)
-                with open(os.path.join(args.data_dir, 'case_details', f'case_detail_{row["판례일련번호"]}.json'), 'w') as f:
+                with open(os.path.join(detail_dir, f'case_detail_{case_id}.json'), 'w') as f:
                     json.dump(processed_case_detail, f, ensure_ascii=False, indent=4)
                 postprocess = postprocess_crawl_case_detail(processed_case_detail)
-                os.makedirs(os.path.join(args.data_dir, 'case_details_postprocessed'), exist_ok=True)
-                with open(os.path.join(args.data_dir, 'case_details_postprocessed', f'case_detail_{row["판례일련번호"]}.json'), 'w') as f:
+                with open(postprocessed_path, 'w') as f:
                     json.dump(postprocess, f, ensure_ascii=False, indent=4)
-                break
-            except Exception as e:
-                retry_count += 1
-                if retry_count >= max_retries:
-                    print(f"Failed after {max_retries} retries: {e}")
-                    break
-                time.sleep(5)
\ No newline at end of file
+                updated.append(case_id)
+            manifest.update(row, digest)
+        except Exception as e:
+            print(f"Error parsing {raw_path}: {e}")
+
+    for case_id in removed:
+        for path in [os.path.join(raw_dir, f'case_text_{case_id}.xml'),
+                     os.path.join(detail_dir, f'case_detail_{case_id}.json'),
+                     os.path.join(postprocessed_dir, f'case_detail_{case_id}.json')]:
+            if os.path.exists(path):
+                os.remove(path)
+        manifest.remove(case_id)
+
+    manifest.save()
+    write_changes(os.path.join(args.data_dir, 'changes.json'), 'case', updated, removed)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Retrieve case information.')
+    parser.add_argument('--id', help='API Key ID (required for crawl mode)')
+    parser.add_argument('--base', default='https://www.law.go.kr', help='Base URL')
+    parser.add_argument('--data_dir', default='data/case_xml', help='Data directory')
+    parser.add_argument('--concurrency', type=int, default=8, help='Maximum number of in-flight requests')
+    parser.add_argument('--rate_limit', type=float, default=10.0, help='Maximum requests per second per host')
+    parser.add_argument('--max_retries', type=int, default=5, help='Retries of a failed request, after the first attempt (0: no retries)')
+    parser.add_argument('--sync', action='store_true', help='Refetch the case list and only crawl new or amended cases')
+    parser.add_argument('--prune', action='store_true',
+                        help='Delete cached cases missing from a complete list fetch (with --sync)')
+    parser.add_argument('--mode', choices=['crawl', 'parse'], default='crawl',
+                        help='crawl: fetch and parse new or amended items, parse: re-parse the whole raw cache')
+    parser.add_argument('--workers', type=int, default=None, help='Parse worker processes (default: all cores)')
+    parser.add_argument('--chunksize', type=int, default=16, help='Raw files handed to a parse worker at a time')
+    parser.add_argument('--parser', choices=['iterparse', 'tree'], default='iterparse',
+                        help='iterparse: streaming single-pass extractor, tree: full ElementTree parser')
+    args = parser.parse_args()
+
+    if args.mode == 'parse':
+        parse_raw_details(args.data_dir, workers=args.workers, chunksize=args.chunksize, parser=args.parser)
+    else:
+        if not args.id:
+            parser.error('--id is required for crawl mode')
+        crawl(args)
+
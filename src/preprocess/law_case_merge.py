@@ -1,33 +1,180 @@
+import io
 import os
 import json
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 
-def merge_law_case(args):
-    # Load all law_case data
-    law_case_dir = os.path.join('data', 'case_xml', 'case_details_postprocessed')
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def iter_cases(law_case_dir, workers=8, batch_size=256):
+    """
+    Yields (case id, case) for every file in law_case_dir, in directory order.
+    Files are read by a thread pool one batch at a time, so memory stays bounded.
+    """
     law_case_list = os.listdir(law_case_dir)
+    with ThreadPoolExecutor(max_workers=workers) as executor, tqdm(total=len(law_case_list)) as pbar:
+        for start in range(0, len(law_case_list), batch_size):
+            batch = law_case_list[start:start + batch_size]
+            contents = executor.map(read_file, [os.path.join(law_case_dir, law_case) for law_case in batch])
+            for law_case, content in zip(batch, contents):
+                case = json.loads(content)
+                case["content"] = case["content"].replace("   ", " ")
+                pbar.update(1)
+                yield os.path.splitext(law_case)[0], case
+
+
+def merge_law_case_json(law_case_dir, output_path, workers=8):
+    """
+    Writes the merged cases as one JSON array, record by record.
+    The output is identical to json.dump(cases, f, indent=4, ensure_ascii=False).
+    """
+    with open(output_path, 'w') as f:
+        first = True
+        for _, case in iter_cases(law_case_dir, workers=workers):
+            f.write('[\n    ' if first else ',\n    ')
+            f.write(json.dumps(case, indent=4, ensure_ascii=False).replace('\n', '\n    '))
+            first = False
+        f.write('[]' if first else '\n]')
+
+
+def merge_law_case_jsonl(law_case_dir, output_path, workers=8, compress=False, block_size=64):
+    """
+    Writes the merged cases as JSONL, one {"id", "title", "content"} record per line,
+    plus a sidecar `<output>.idx` with one "id<TAB>offset<TAB>length<TAB>line" row per case.
+
+    Uncompressed, offset/length address the record's line. With zstd, records are grouped
+    into blocks of `block_size` lines that are each compressed as an independent frame;
+    offset/length address the frame and `line` is the record's position inside it.
+    """
+    if compress and zstandard is None:
+        raise ImportError("zstd output requires the zstandard package (pip install zstandard)")
+    compressor = zstandard.ZstdCompressor(level=10) if compress else None
+
+    with open(output_path, 'wb') as f, open(f'{output_path}.idx', 'w', encoding='utf-8') as index:
+        block, block_ids = [], []
+
+        def flush_block():
+            frame = compressor.compress(b''.join(block))
+            offset = f.tell()
+            f.write(frame)
+            for line, case_id in enumerate(block_ids):
+                index.write(f'{case_id}\t{offset}\t{len(frame)}\t{line}\n')
+            block.clear()
+            block_ids.clear()
+
+        for case_id, case in iter_cases(law_case_dir, workers=workers):
+            record = (json.dumps({'id': case_id, **case}, ensure_ascii=False) + '\n').encode('utf-8')
+            if compressor is None:
+                index.write(f'{case_id}\t{f.tell()}\t{len(record)}\t0\n')
+                f.write(record)
+                continue
+            block.append(record)
+            block_ids.append(case_id)
+            if len(block) >= block_size:
+                flush_block()
+        if block:
+            flush_block()
+
+
+def case_corpus_records(law_case_dir, detail_dir, workers=8):
+    """
+    Yields corpus records of the merged cases, partitioned by the year of 선고일자
+    read from the matching case_details file.
+    """
+    from corpus_store import parse_year
+
+    for case_id, case in iter_cases(law_case_dir, workers=workers):
+        year = 0
+        detail_path = os.path.join(detail_dir, f'{case_id}.json')
+        if os.path.exists(detail_path):
+            with open(detail_path, 'rb') as f:
+                year = parse_year(json.loads(f.read()).get('선고일자'))
+        yield {'id': case_id, 'title': case['title'], 'content': case['content'], 'filtered': True, 'year': year}
+
+
+def load_case_index(output_path):
+    """
+    Loads the sidecar index of a merged JSONL file as {id: (offset, length, line)}.
+    """
+    index = {}
+    with open(f'{output_path}.idx', 'r', encoding='utf-8') as f:
+        for row in f:
+            case_id, offset, length, line = row.rstrip('\n').split('\t')
+            index[case_id] = (int(offset), int(length), int(line))
+    return index
+
+
+def read_case(output_path, index, case_id):
+    """
+    Reads a single case from a merged JSONL (or .zst) file by seeking to it.
+    """
+    offset, length, line = index[case_id]
+    with open(output_path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(length)
+    if output_path.endswith('.zst'):
+        data = zstandard.ZstdDecompressor().decompress(data).splitlines()[line]
+    return json.loads(data)
+
+
+def iter_merged_cases(output_path):
+    """
+    Streams every case of a merged JSONL (or .zst) file without loading it whole.
+    """
+    with open(output_path, 'rb') as f:
+        if output_path.endswith('.zst'):
+            lines = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True))
+        else:
+            lines = f
+        for line in lines:
+            yield json.loads(line)
+
+
+def merge_law_case(args):
+    # Stream all law_case data into a single file
+    if args.format == 'parquet':
+        from corpus_store import write_corpus
+
+        output_path = write_corpus(args.corpus_dir, 'case',
+                                   case_corpus_records(args.input_dir, args.detail_dir, workers=args.workers))
+    elif args.format == 'json':
+        output_path = os.path.join(args.save_dir, 'law_case_processed.json')
+        merge_law_case_json(args.input_dir, output_path, workers=args.workers)
+    else:
+        output_path = os.path.join(args.save_dir, 'law_case_processed.jsonl')
+        if args.compress:
+            output_path += '.zst'
+        merge_law_case_jsonl(args.input_dir, output_path, workers=args.workers, compress=args.compress)
+
+    print('Merged law_case data saved at {}'.format(output_path))
 
-    # Merge all law_case data
-    law_case_data = []
-    for law_case in tqdm(law_case_list):
-        with open(os.path.join(law_case_dir, law_case), 'r') as f:
-            law_case_data.append(json.load(f))
-    
-    for case in law_case_data:
-        case["content"] = case["content"].replace("   ", " ")
-
-    with open(os.path.join(args.save_dir, 'law_case_processed.json'), 'w') as f:
-        json.dump(law_case_data, f, indent=4, ensure_ascii=False)
-    
-    print('Merged law_case data saved at {}'.format(os.path.join(args.save_dir, 'law_case_processed.json')))
-    
 
 def parse_args():
     parser = argparse.ArgumentParser()
+    parser.add_argument('--input_dir', type=str, default=os.path.join('data', 'case_xml', 'case_details_postprocessed'))
+    parser.add_argument('--detail_dir', type=str, default=os.path.join('data', 'case_xml', 'case_details'),
+                        help='case_details directory, read for 선고일자 with --format parquet')
     parser.add_argument('--save_dir', type=str, default='data/case_xml')
+    parser.add_argument('--corpus_dir', type=str, default=os.path.join('data', 'corpus'),
+                        help='Root of the columnar corpus (--format parquet)')
+    parser.add_argument('--format', type=str, choices=['json', 'jsonl', 'parquet'], default='json',
+                        help='json: one indented array (law_case_processed.json), '
+                             'jsonl: one record per line with a sidecar offset index, '
+                             'parquet: source=case partition of the columnar corpus')
+    parser.add_argument('--compress', action='store_true', help='zstd-compress the jsonl output')
+    parser.add_argument('--workers', type=int, default=8, help='Threads reading case files')
     return parser.parse_args()
-    
+
 if __name__ == "__main__":
     args = parse_args()
-    merge_law_case(args)
\ No newline at end of file
+    merge_law_case(args)
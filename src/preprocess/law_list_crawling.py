@@ -4,7 +4,9 @@ import re
 import time
 import json
 import pandas as pd
-from copy import deepcopy
+from functools import partial
+from multiprocessing import Pool
+from multiprocessing.util import Finalize
 
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -56,6 +58,15 @@ def crawl_law_list(url_link, page_num):
     return law_list
 
 
+ARTICLE_LABEL_PATTERN = re.compile(r'^제\s*(\d+)\s*조\s*(\(([^)]+)\))?')
+PARAGRAPH_PATTERN = re.compile(r'^([①-⑳])\s*(.*)')
+ITEM_PATTERN = re.compile(r'^(\d+)\.\s*(.*)')
+SUBITEM_PATTERN = re.compile(r'^([가-힣])\.\s*(.*)')
+SUBSUBITEM_PATTERN = re.compile(r'^(\d+)\)\s*(.*)')
+ARTICLE_NUMBER_PATTERN = re.compile(r'제(\d+)조의(\d+)')
+CONTENT_PARAGRAPH_PATTERN = re.compile(r'^([①-⑩])\s*(.*)')
+
+
 def parse_article_content(html_content, popup_text):
     """
     Parses the HTML content of articles and extracts article number, title, and content.
@@ -70,12 +81,18 @@ def parse_article_content(html_content, popup_text):
         'articles': []
     }
 
-    pty1_p4_tags = soup.find_all('p', class_='pty1_p4')
+    # Drop span.sfon from every paragraph parsed below in a single pass over the soup
+    for sfon in soup.find_all('span', class_='sfon'):
+        parent_p = sfon.find_parent('p')
+        if parent_p is not None:
+            classes = parent_p.get('class', [])
+            if 'pty1_p4' in classes or 'gtit' not in classes:
+                sfon.extract()
+
+    p_tags = soup.find_all('p')
+    pty1_p4_tags = [p for p in p_tags if 'pty1_p4' in p.get('class', [])]
 
     for title_label in pty1_p4_tags:
-        for sfon in title_label.find_all('span', class_='sfon'):
-            sfon.extract()
-        
         # 'a' 태그를 "[참조: 텍스트]" 형식으로 대체
         for a_tag in title_label.find_all('a'):
             replacement_text = f"[참조: {a_tag.get_text(strip=True)}]"
@@ -86,14 +103,14 @@ def parse_article_content(html_content, popup_text):
             label = bl_span.get_text(strip=True)
             bl_span.extract()
 
-            article_match = re.match(r'^제\s*(\d+)\s*조\s*(\(([^)]+)\))?', label)
+            article_match = ARTICLE_LABEL_PATTERN.match(label)
             if article_match:
                 article_number = article_match.group(1)
                 article_title = article_match.group(3) if article_match.group(3) else ''
                 article_full_name = label
 
                 remaining_text = title_label.get_text().replace(label, '').strip()
-                paragraph_match = re.match(r'^([①-⑳])\s*(.*)', remaining_text)
+                paragraph_match = PARAGRAPH_PATTERN.match(remaining_text)
                 paragraphs = []
                 if paragraph_match:
                     paragraph_number = paragraph_match.group(1)
@@ -165,15 +182,12 @@ def parse_article_content(html_content, popup_text):
                 # span class='bl' & input
                 continue
 
-    p_tags = [p for p in soup.find_all('p') if 'pty1_p4' not in p.get('class', []) and 'gtit' not in p.get('class', [])]
+    p_tags = [p for p in p_tags if 'pty1_p4' not in p.get('class', []) and 'gtit' not in p.get('class', [])]
 
     for p in p_tags:
-        for sfon in p.find_all('span', class_='sfon'):
-            sfon.extract()
-
         content = process_content(p, popup_text)
 
-        paragraph_match = re.match(r'^([①-⑳])\s*(.*)', content)
+        paragraph_match = PARAGRAPH_PATTERN.match(content)
         if paragraph_match:
             paragraph_number = paragraph_match.group(1)
             paragraph_text = paragraph_match.group(2)
@@ -190,10 +204,10 @@ def parse_article_content(html_content, popup_text):
             continue
 
         # 항목 매칭 시도 (예: 1. 2. ...)
-        item_match = re.match(r'^(\d+)\.\s*(.*)', content)
+        item_match = ITEM_PATTERN.match(content)
         if item_match:
             item_number = item_match.group(1)
-            item_text = remove_leading_number(content, item_number + '.')
+            item_text = content[item_match.end(1) + 1:].strip()
 
             item_entry = {
                 'item_number': item_number,
@@ -209,10 +223,10 @@ def parse_article_content(html_content, popup_text):
             continue
 
         # 목 매칭 시도 (예: 가. 나. ...)
-        subitem_match = re.match(r'^([가-힣])\.\s*(.*)', content)  # 가. 나. ...
+        subitem_match = SUBITEM_PATTERN.match(content)  # 가. 나. ...
         if subitem_match:
             subitem_number = subitem_match.group(1)
-            subitem_text = remove_leading_number(content, subitem_number + '.')
+            subitem_text = content[subitem_match.end(1) + 1:].strip()
 
             subitem_entry = {
                 'subitem_number': subitem_number,
@@ -230,10 +244,10 @@ def parse_article_content(html_content, popup_text):
             continue
 
         # 하위 항목 매칭 시도 (예: 1) 2) ...)
-        subsubitem_match = re.match(r'^(\d+)\)\s*(.*)', content)  # 1) 2) ...
+        subsubitem_match = SUBSUBITEM_PATTERN.match(content)  # 1) 2) ...
         if subsubitem_match:
             subsubitem_number = subsubitem_match.group(1)
-            subsubitem_text = remove_leading_number(content, subsubitem_number + ')')
+            subsubitem_text = content[subsubitem_match.end(1) + 1:].strip()
 
             subsubitem_entry = {
                 'subsubitem_number': subsubitem_number,
@@ -274,29 +288,24 @@ def parse_article_content(html_content, popup_text):
 
 
 def process_content(element, popup_text):
-    content_str = ''
-    for child in element.children:
-        if isinstance(child, str):
-            text = str(child).strip()
-            if text:
-                content_str += text
-        elif child.name == 'a' and not 'data-popup-id' in child.attrs:
-            content_str += ' ' + child.get_text(strip=True)
-        else:
-            child_content = process_content(child, popup_text)
-            if child_content:
-                content_str += child_content
-    return content_str
+    parts = []
+    collect_content(element, parts)
+    return ''.join(parts)
 
 
-def remove_leading_number(content_str, leading_number):
+def collect_content(element, parts):
     """
-    Removes the leading number (e.g., '①', '1.', '가)') from content_parts.
+    Appends the text pieces of process_content to `parts`, so the string is joined once.
     """
-    content_str = content_str.strip()
-    if content_str.startswith(leading_number):
-        return content_str[len(leading_number):].strip()
-    return content_str
+    for child in element.children:
+        if isinstance(child, str):
+            text = child.strip()
+            if text:
+                parts.append(text)
+        elif child.name == 'a' and 'data-popup-id' not in child.attrs:
+            parts.append(' ' + child.get_text(strip=True))
+        else:
+            collect_content(child, parts)
 
 
 def process_law_detail(html_content, popup_text):
@@ -360,13 +369,115 @@ def close_popup(driver):
         return False
 
 
-def crawl_law_detail(url_link, file_idx):
+POPUP_LINK_SELECTOR = 'a.link[title="팝업으로 이동"]'
+
+# Long-lived driver of the current worker process, see init_worker
+_driver = None
+_headless = True
+
+
+def create_driver(headless=True):
+    """
+    Creates a Chrome driver suitable for reuse across many laws.
+    """
     options = webdriver.ChromeOptions()
-    # options.add_argument('headless')
-    driver = webdriver.Chrome(options=options)
-    os.makedirs(os.path.join(args.data_dir, 'law_details_raw'), exist_ok=True)
+    if headless:
+        options.add_argument('--headless=new')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    options.add_argument('--disable-gpu')
+    # Do not wait for images and stylesheets; the crawler only reads the DOM
+    options.page_load_strategy = 'eager'
+    return webdriver.Chrome(options=options)
+
+
+def quit_driver():
+    global _driver
+    if _driver is not None:
+        try:
+            _driver.quit()
+        except Exception:
+            pass
+        _driver = None
+
+
+def init_worker(headless):
+    """
+    Pool initializer: starts one driver per worker process and quits it when the worker exits.
+    """
+    global _driver, _headless
+    _headless = headless
+    _driver = create_driver(headless)
+    Finalize(None, quit_driver, exitpriority=10)
+
+
+def reset_driver(driver):
+    """
+    Closes windows left open by a previous law and returns to the main window.
+    """
+    handles = driver.window_handles
+    for handle in handles[1:]:
+        driver.switch_to.window(handle)
+        driver.close()
+    driver.switch_to.window(handles[0])
+    driver.switch_to.default_content()
+
+
+def resolve_popup_url(href):
+    """
+    Returns the popup URL if the link points to a real page, or None for script-driven links.
+    """
+    if not href or href.startswith('javascript') or href.endswith('#'):
+        return None
+    if href.startswith('http://') or href.startswith('https://'):
+        return href
+    return None
+
+
+def fetch_popup_content(popup_url):
+    """
+    Fetches a popup page directly and returns (page html, innerHTML of its div.pgroup).
+    """
+    html = urlopen(popup_url, timeout=10).read().decode('utf-8', errors='replace')
+    pgroup = BeautifulSoup(html, 'html.parser').find('div', class_='pgroup')
+    if pgroup is None:
+        return html, None
+    return html, pgroup.decode_contents()
+
+
+def wait_for_popup(driver, wait):
+    """
+    Waits until a click either opened a popup window or an in-page layer.
+    Returns 'window' or 'layer'.
+    """
+    def opened(d):
+        if len(d.window_handles) > 1:
+            return 'window'
+        if d.find_elements(By.CSS_SELECTOR, '.btn22>a'):
+            return 'layer'
+        return False
+    return wait.until(opened)
+
+
+def return_to_law(driver, wait, original_window):
+    driver.switch_to.window(original_window)
+    driver.switch_to.default_content()
+    wait.until(EC.frame_to_be_available_and_switch_to_it((By.ID, 'lawService')))
+    wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, '#contentBody')))
+
+
+def crawl_law_detail(url_link, file_idx, data_dir, driver=None):
+    """
+    Crawls the HTML law page with its reference popups and returns the processed law.
+    A driver passed in is reused and left open; otherwise a temporary one is created.
+    """
+    owns_driver = driver is None
+    if owns_driver:
+        driver = create_driver()
+    os.makedirs(os.path.join(data_dir, 'law_details_raw'), exist_ok=True)
     
     try:
+        reset_driver(driver)
         driver.get(url_link)
         wait = WebDriverWait(driver, 8)
         
@@ -374,33 +485,45 @@ def crawl_law_detail(url_link, file_idx):
 
         wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, '#contentBody')))
 
-        html = driver.page_source
-
         popup_text = {}
         body_html = driver.execute_script("return document.body.innerHTML;")
         soup = BeautifulSoup(body_html, 'html.parser')
 
-        links = soup.select('a.link[title="팝업으로 이동"]')
+        links = soup.select(POPUP_LINK_SELECTOR)
         for idx, link in enumerate(links):
             link['data-popup-id'] = str(idx)
 
         modified_body_html = str(soup)
         driver.execute_script("document.body.innerHTML = arguments[0];", modified_body_html)
 
-        links = driver.find_elements(By.CSS_SELECTOR, 'a.link[title="팝업으로 이동"]')
+        original_window = driver.current_window_handle
+        links = driver.find_elements(By.CSS_SELECTOR, POPUP_LINK_SELECTOR)
         for idx, link in enumerate(links):
+            popup_path = os.path.join(data_dir, "law_details_raw", f'law_details_{file_idx}_popup_{idx}.html')
             try:
                 if not link.text.strip().endswith(tuple(['조', '항', '호', '목', '령'])):
                     continue
+
+                # Fetch the popup page directly when the link carries a real URL
+                popup_url = resolve_popup_url(link.get_property('href'))
+                if popup_url:
+                    try:
+                        content_html, popup_content = fetch_popup_content(popup_url)
+                        if popup_content is not None:
+                            with open(popup_path, 'w', encoding='utf-8') as f:
+                                f.write(content_html)
+                            popup_text[str(idx)] = popup_content
+                            continue
+                    except Exception:
+                        pass  # fall back to clicking
+
                 driver.execute_script("arguments[0].scrollIntoView();", link)
                 link.click()
 
-                time.sleep(0.25)
-                if close_popup(driver):
+                if wait_for_popup(driver, wait) == 'layer':
+                    close_popup(driver)
                     continue
-                
-                original_window = driver.current_window_handle
-                wait.until(EC.number_of_windows_to_be(2))
+
                 driver.switch_to.window(driver.window_handles[1])
 
                 popup_content = wait.until(EC.presence_of_element_located(
@@ -409,53 +532,76 @@ def crawl_law_detail(url_link, file_idx):
                 
                 content_html = driver.page_source
                 
-                with open(os.path.join(args.data_dir, "law_details_raw", f'law_details_{file_idx}_popup_{idx}.html'), 'w', encoding='utf-8') as f:
+                with open(popup_path, 'w', encoding='utf-8') as f:
                     f.write(content_html)
                 
                 popup_text[str(idx)] = popup_content.get_attribute('innerHTML')
 
                 driver.close()
-                driver.switch_to.window(original_window)
-                driver.switch_to.default_content()
-                wait.until(EC.frame_to_be_available_and_switch_to_it((By.ID, 'lawService')))
-                wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, '#contentBody')))
+                return_to_law(driver, wait, original_window)
 
             except Exception:
                 if len(driver.window_handles) > 1:
                     driver.close()
-                    driver.switch_to.window(original_window)
-                    driver.switch_to.default_content()
-                    wait.until(EC.frame_to_be_available_and_switch_to_it((By.ID, 'lawService')))
-                    wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, '#contentBody')))     
+                    return_to_law(driver, wait, original_window)
 
         html = driver.execute_script("return document.body.innerHTML;")
         
-        with open(os.path.join(args.data_dir, "law_details_raw", f"law_details_{file_idx}.html"), 'w', encoding='utf-8') as f:
+        with open(os.path.join(data_dir, "law_details_raw", f"law_details_{file_idx}.html"), 'w', encoding='utf-8') as f:
             f.write(html)
         
         soup = BeautifulSoup(html, 'html.parser')
         content_body_div = soup.find('div', id='contentBody')
         processed_law = process_law_detail(content_body_div, popup_text)
         
-        with open(os.path.join(args.data_dir, "law_details_raw", f'law_details_{file_idx}_body.html'), 'w', encoding='utf-8') as f:
+        with open(os.path.join(data_dir, "law_details_raw", f'law_details_{file_idx}_body.html'), 'w', encoding='utf-8') as f:
             f.write(str(content_body_div))
     
     finally:
-        driver.quit()
+        if owns_driver:
+            driver.quit()
 
     return processed_law
 
 
+def crawl_law_worker(job, max_retries=5):
+    """
+    Crawls, postprocesses and saves one law with the worker's long-lived driver.
+    Returns (law id, error message or None).
+    """
+    global _driver
+    url_link, law_id, data_dir = job
+    output_path = os.path.join(data_dir, 'law_detail', f'law_detail_{law_id}.json')
+    if os.path.exists(output_path):
+        return law_id, None
+
+    error = None
+    for retry in range(max_retries):
+        try:
+            if _driver is None:
+                _driver = create_driver(_headless)
+            processed_law = crawl_law_detail(url_link, law_id, data_dir, driver=_driver)
+            processed_law_process = postprocess_law_data(processed_law)
+            # save json
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(processed_law_process, f, ensure_ascii=False, indent=4)
+            return law_id, None
+        except Exception as e:
+            error = e
+            # The driver may have crashed or be stuck on a popup; start over with a fresh one
+            quit_driver()
+            time.sleep(min(30, 2 ** retry))
+    return law_id, f"Failed after {max_retries} retries: {error}"
+
+
 def update_article_numbers_recursively(obj):
-    pattern = re.compile(r'제(\d+)조의(\d+)')
-    
     if isinstance(obj, dict):
         for key, value in obj.items():
             if key == 'articles' and isinstance(value, list):
                 for article in value:
                     if isinstance(article, dict):
                         full_name = article.get('article_full_name', '')
-                        match = pattern.search(full_name)
+                        match = ARTICLE_NUMBER_PATTERN.search(full_name)
                         if match:
                             main_number, sub_number = match.groups()
                             article['article_number'] = f"{main_number}_{sub_number}"
@@ -467,34 +613,53 @@ def update_article_numbers_recursively(obj):
             update_article_numbers_recursively(item)
 
 
-def postprocess_law_data(data):
+def structural_key(obj):
+    """
+    Returns a hashable key that is equal for structurally equal JSON values,
+    ignoring dictionary key order (like json.dumps(..., sort_keys=True) would).
+    """
+    if isinstance(obj, dict):
+        return frozenset((key, structural_key(value)) for key, value in obj.items())
+    if isinstance(obj, list):
+        return tuple(structural_key(value) for value in obj)
+    return obj
+
+
+def postprocess_law_data(data, update_numbers=True):
     """
     Recursively inspects the data structure to find 'content' fields that start with
     numbered bullets (e.g., '①') and processes them into 'paragraphs'.
     """
-    unique_articles = []
-    seen = set()
-    
-    for item in data.get('articles', []):
-        if 'articles' in item:
-            item_copy = deepcopy(item)
-            
-            articles_serialized = json.dumps(item_copy['articles'], sort_keys=True, ensure_ascii=False)
-            
-            if articles_serialized not in seen:
-                seen.add(articles_serialized)
-                unique_articles.append(item_copy)
-        else:
-            unique_articles.append(item)
-    
-    data['articles'] = unique_articles
+    if 'articles' in data:
+        unique_articles = []
+        # process_law_detail appends the same article_data object more than once,
+        # so identity catches most duplicates before any structural comparison
+        seen_ids = set()
+        seen = set()
+
+        for item in data['articles']:
+            if 'articles' in item:
+                if id(item['articles']) in seen_ids:
+                    continue
+                seen_ids.add(id(item['articles']))
 
-    update_article_numbers_recursively(data)
+                key = structural_key(item['articles'])
+                if key not in seen:
+                    seen.add(key)
+                    unique_articles.append(item)
+            else:
+                unique_articles.append(item)
+
+        data['articles'] = unique_articles
+
+    # The whole tree is updated once from the top-level call
+    if update_numbers:
+        update_article_numbers_recursively(data)
 
     if isinstance(data, dict):
         if 'content' in data:
             content = data['content']
-            match = re.match(r'^([①-⑩])\s*(.*)', content)
+            match = CONTENT_PARAGRAPH_PATTERN.match(content)
             if match:
                 paragraph_number = match.group(1)
                 paragraph_text = match.group(2).strip()
@@ -516,11 +681,11 @@ def postprocess_law_data(data):
             if isinstance(value, list) and not value:
                 del data[key]
             elif isinstance(value, dict):
-                postprocess_law_data(value)
+                postprocess_law_data(value, update_numbers=False)
             elif isinstance(value, list):
                 for item in value:
                     if isinstance(item, dict):
-                        postprocess_law_data(item)
+                        postprocess_law_data(item, update_numbers=False)
         
         # 모든 value를 순회하며 str인 경우 앞뒤 공백 제거
         for key, value in data.items():
@@ -535,6 +700,9 @@ if __name__ == '__main__':
     parser.add_argument('--id', required=True, help='API Key ID')
     parser.add_argument('--base', default='https://www.law.go.kr', help='Base URL')
     parser.add_argument('--data_dir', default='data/jomun', help='Data directory')
+    parser.add_argument('--workers', type=int, default=4, help='Number of browser worker processes')
+    parser.add_argument('--headless', action=argparse.BooleanOptionalAction, default=True, help='Run Chrome headless')
+    parser.add_argument('--max_retries', type=int, default=5, help='Maximum retries per law')
     args = parser.parse_args()
 
     total_count = check_total_count(f"{args.base}/DRF/lawSearch.do?OC={args.id}&target=law&type=XML&display=100&page=1")
@@ -552,27 +720,20 @@ if __name__ == '__main__':
         law_list_df = pd.DataFrame(law_list)
         law_list_df.to_csv(os.path.join(args.data_dir, 'law_list.csv'), index=False)
     
-    # check if law_detail.json exists
-    for idx, row in tqdm(law_list_df.iterrows(), total=law_list_df.shape[0]):
-        # if exception occurs, retry
-        max_retries = 5
-        retry_count = 0
-        while retry_count < max_retries:
-            try:
-                url_link = args.base + row['법령상세링크']
-                os.makedirs(os.path.join(args.data_dir, 'law_detail'), exist_ok=True)
-                if os.path.exists(os.path.join(args.data_dir, 'law_detail', f'law_detail_{row["법령ID"]}.json')):
-                    break
-                processed_law = crawl_law_detail(url_link, row['법령ID'])
-                processed_law_process = postprocess_law_data(processed_law)
-                # save json
-                with open(os.path.join(args.data_dir, 'law_detail', f'law_detail_{row["법령ID"]}.json'), 'w', encoding='utf-8') as f:
-                    json.dump(processed_law_process, f, ensure_ascii=False, indent=4)
-                break
-            except Exception as e:
-                retry_count += 1
-                if retry_count >= max_retries:
-                    print(f"Failed after {max_retries} retries: {e}")
-                    break
-                time.sleep(5)
-
+    # crawl law details with a pool of long-lived drivers
+    os.makedirs(os.path.join(args.data_dir, 'law_detail'), exist_ok=True)
+    jobs = [
+        (args.base + row['법령상세링크'], row['법령ID'], args.data_dir)
+        for _, row in law_list_df.iterrows()
+        if not os.path.exists(os.path.join(args.data_dir, 'law_detail', f'law_detail_{row["법령ID"]}.json'))
+    ]
+    pool = Pool(processes=args.workers, initializer=init_worker, initargs=(args.headless,))
+    try:
+        worker = partial(crawl_law_worker, max_retries=args.max_retries)
+        for law_id, error in tqdm(pool.imap_unordered(worker, jobs), total=len(jobs)):
+            if error:
+                print(f"{law_id}: {error}")
+    finally:
+        # close/join (not terminate) so each worker's Finalize quits its driver
+        pool.close()
+        pool.join()
@@ -2,13 +2,17 @@ import argparse
 import os
 import re
 import json
-import time
 import pandas as pd
+from functools import partial
+from multiprocessing import Pool
 
-from tqdm import tqdm, trange
+from tqdm import tqdm
 from urllib.request import urlopen
 import xml.etree.ElementTree as ET
 
+from crawl_manifest import CrawlManifest, content_hash, normalize_field, write_changes
+from fetcher import download_all
+
 
 def check_total_count(url_link):
     """
@@ -29,6 +33,13 @@ def crawl_law_list(url_link, page_num):
     os.makedirs(os.path.join(args.data_dir, 'law_list_raw'), exist_ok=True)
     with open(os.path.join(args.data_dir, 'law_list_raw', f'law_list_{page_num}.xml'), 'wb') as f:
         f.write(response)
+    return parse_law_list(response)
+
+
+def parse_law_list(response):
+    """
+    Parses a raw law list page and returns a list of law information.
+    """
     xtree = ET.fromstring(response)
     
     try:
@@ -61,6 +72,13 @@ def remove_empty_arrays(data):
     else:
         return data
 
+def drop_empty(data):
+    """
+    Non-recursive remove_empty_arrays for a dictionary whose children are already clean.
+    """
+    return {k: v for k, v in data.items() if v is not None and v != []}
+
+
 def parse_jomun_number(jomun_content):
     """
     Parses 조문번호 from '제1조' to '1',
@@ -79,6 +97,9 @@ def parse_jomun_number(jomun_content):
             return main_num
     return None  # Return None if it doesn't match the pattern
 
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
 def clean_jomun_content(content):
     """
     Replaces '\\n\\t' with space and removes duplicate spaces.
@@ -88,10 +109,27 @@ def clean_jomun_content(content):
     # Replace \n\t with space
     content = content.replace('\n\t', ' ')
     # Remove duplicate spaces using regex
-    content = re.sub(r'\s+', ' ', content)
+    content = WHITESPACE_PATTERN.sub(' ', content)
     # Strip leading and trailing spaces
     return content.strip()
 
+
+def find_text(element, tag):
+    """
+    Returns the text of the first child with the given tag, or None.
+    """
+    child = element.find(tag)
+    return child.text if child is not None else None
+
+
+def strip_number(content, number):
+    """
+    Strips the leading 항/호/목 number (and spaces) from cleaned content.
+    """
+    if not content:
+        return None
+    return content.strip(number + " " if number is not None else " ")
+
 def extract_jomun_number_from_content(content):
     """
     Extracts 조문번호 from 조문내용.
@@ -128,19 +166,32 @@ def crawl_law_detail(url_link, info, args):
             response = f.read()
     else:
         response = urlopen(url_link).read()
-    xtree = ET.fromstring(response)
 
     os.makedirs(os.path.join(args.data_dir, 'law_details_raw'), exist_ok=True)
     with open(os.path.join(args.data_dir, 'law_details_raw', f'law_text_{info["법령ID"]}.xml'), 'wb') as f:
         f.write(response)
 
+    return parse_law_detail(response)
+
+
+BASIC_INFO_FIELDS = [
+    "법령ID", "공포일자", "공포번호", "언어", "법종구분", "법종구분코드",
+    "법령명_한글", "법령명_한자", "법령명약칭", "제명변경여부", "한글법령여부",
+    "편장절관", "소관부처코드", "소관부처", "전화번호", "시행일자", "제개정구분",
+    "별표편집여부", "공포법령여부", "공동부령정보"
+]
+
+
+def parse_law_detail(response):
+    """
+    Parses a raw law detail XML and returns a dictionary of law information.
+    """
+    xtree = ET.fromstring(response)
+
     law_data = {}
 
     # 기본 정보
-    for field in ["법령ID", "공포일자", "공포번호", "언어", "법종구분", "법종구분코드",
-                  "법령명_한글", "법령명_한자", "법령명약칭", "제명변경여부", "한글법령여부",
-                  "편장절관", "소관부처코드", "소관부처", "전화번호", "시행일자", "제개정구분",
-                  "별표편집여부", "공포법령여부", "공동부령정보"]:
+    for field in BASIC_INFO_FIELDS:
         try:
             element = xtree.find("기본정보").find(field)
             if element is not None:
@@ -153,60 +204,60 @@ def crawl_law_detail(url_link, info, args):
     조문단위 = xtree.find("조문").findall("조문단위")
     for jomun in 조문단위:
         # 먼저 조문내용에서 조문번호 추출
-        jomun_content_raw = jomun.find("조문내용").text if jomun.find("조문내용") is not None else None
+        jomun_content_raw = find_text(jomun, "조문내용")
         jomun_number = extract_jomun_number_from_content(jomun_content_raw)
 
         # Fallback: If extraction fails, use 조문번호 필드
         if not jomun_number:
-            jomun_number_raw = jomun.find("조문번호").text if jomun.find("조문번호") is not None else None
-            jomun_number = parse_jomun_number(jomun_number_raw)
+            jomun_number = parse_jomun_number(find_text(jomun, "조문번호"))
 
         # If still not found, set as None or handle accordingly
         if not jomun_number:
             jomun_number = "Unknown"
 
+        jomun_content = clean_jomun_content(jomun_content_raw)
         jomun_data = {
             "조문번호": jomun_number,
-            "조문여부": jomun.find("조문여부").text if jomun.find("조문여부") is not None else None,
-            "조문제목": jomun.find("조문제목").text if jomun.find("조문제목") is not None else None,
-            "조문시행일자": jomun.find("조문시행일자").text if jomun.find("조문시행일자") is not None else None,
-            "조문변경여부": jomun.find("조문변경여부").text if jomun.find("조문변경여부") is not None else None,
-            "조문내용": process_jo(clean_jomun_content(jomun_content_raw)) if clean_jomun_content(jomun_content_raw) else None
+            "조문여부": find_text(jomun, "조문여부"),
+            "조문제목": find_text(jomun, "조문제목"),
+            "조문시행일자": find_text(jomun, "조문시행일자"),
+            "조문변경여부": find_text(jomun, "조문변경여부"),
+            "조문내용": process_jo(jomun_content) if jomun_content else None
         }
 
         # 조문제개정유형, 조문이동이전, 조문이동이후 등 추가 필드 처리
         for field in ["조문제개정유형", "조문이동이전", "조문이동이후"]:
-            jomun_data[field] = jomun.find(field).text if jomun.find(field) is not None else None
+            jomun_data[field] = find_text(jomun, field)
 
         # 항 처리
         jomun_data['항'] = []
         for hang in jomun.findall("항"):
-            hang_content_raw = hang.find("항내용").text if hang.find("항내용") is not None else None
+            hang_number = find_text(hang, "항번호")
+            hang_content = clean_jomun_content(find_text(hang, "항내용"))
             hang_data = {
-                "항번호": hang.find("항번호").text if hang.find("항번호") is not None else None,
-                "항제개정유형": hang.find("항제개정유형").text if hang.find("항제개정유형") is not None else None,
-                "항내용": clean_jomun_content(hang_content_raw).strip(hang.find("항번호").text+" " if hang.find("항번호") is not None else " ")
-                    if clean_jomun_content(hang_content_raw) else None
+                "항번호": hang_number,
+                "항제개정유형": find_text(hang, "항제개정유형"),
+                "항내용": strip_number(hang_content, hang_number)
             }
 
             # 호 처리
             hang_data['호'] = []
             for ho in hang.findall("호"):
-                ho_content_raw = ho.find("호내용").text if ho.find("호내용") is not None else None
+                ho_number = find_text(ho, "호번호")
+                ho_content = clean_jomun_content(find_text(ho, "호내용"))
                 ho_data = {
-                    "호번호": ho.find("호번호").text.rstrip(".") if ho.find("호번호") is not None else None,
-                    "호내용": clean_jomun_content(ho_content_raw).strip(ho.find("호번호").text+" " if ho.find("호번호") is not None else " ")
-                        if clean_jomun_content(ho_content_raw) else None
+                    "호번호": ho_number.rstrip(".") if ho_number is not None else None,
+                    "호내용": strip_number(ho_content, ho_number)
                 }
 
                 # 목 처리
                 ho_data['목'] = []
                 for mok in ho.findall("목"):
-                    mok_content_raw = mok.find("목내용").text if mok.find("목내용") is not None else None
+                    mok_number = find_text(mok, "목번호")
+                    mok_content = clean_jomun_content(find_text(mok, "목내용"))
                     mok_data = {
-                        "목번호": mok.find("목번호").text.rstrip(".") if mok.find("목번호") is not None else None,
-                        "목내용": clean_jomun_content(mok_content_raw).strip(mok.find("목번호").text+" " if mok.find("목번호") is not None else " ")
-                            if clean_jomun_content(mok_content_raw) else None
+                        "목번호": mok_number.rstrip(".") if mok_number is not None else None,
+                        "목내용": strip_number(mok_content, mok_number)
                     }
                     ho_data['목'].append(mok_data)
 
@@ -221,7 +272,7 @@ def crawl_law_detail(url_link, info, args):
     try:
         for appendix in xtree.find("부칙").findall("부칙단위"):
             appendix_data = {
-                field: appendix.find(field).text if appendix.find(field) is not None else None
+                field: find_text(appendix, field)
                 for field in ["부칙공포일자", "부칙공포번호", "부칙내용"]
             }
             # Clean 부칙내용
@@ -249,45 +300,290 @@ def crawl_law_detail(url_link, info, args):
     return law_data
 
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description='Retrieve law information.')
-    parser.add_argument('--id', required=True, help='API Key ID')
-    parser.add_argument('--base', default='https://www.law.go.kr', help='Base URL')
-    parser.add_argument('--data_dir', default='data/jomun_xml', help='Data directory')
-    args = parser.parse_args()
+def index_children(element, repeated):
+    """
+    Walks the children of an element once.
+    Returns the text of the first child per tag (what find(tag).text would give)
+    and the list of children with the repeated tag (what findall(repeated) would give).
+    """
+    texts = {}
+    children = []
+    for child in element:
+        if child.tag == repeated:
+            children.append(child)
+        elif child.tag not in texts:
+            texts[child.tag] = child.text
+    return texts, children
+
+
+def convert_jomun_unit(jomun):
+    """
+    Converts one 조문단위 element into the 조문/항/호/목 dictionary emitted by parse_law_detail.
+    """
+    fields, hangs = index_children(jomun, "항")
+
+    # 먼저 조문내용에서 조문번호 추출
+    jomun_content_raw = fields.get("조문내용")
+    jomun_number = extract_jomun_number_from_content(jomun_content_raw)
+    if not jomun_number:
+        jomun_number = parse_jomun_number(fields.get("조문번호"))
+    if not jomun_number:
+        jomun_number = "Unknown"
+
+    jomun_content = clean_jomun_content(jomun_content_raw)
+    jomun_data = {
+        "조문번호": jomun_number,
+        "조문여부": fields.get("조문여부"),
+        "조문제목": fields.get("조문제목"),
+        "조문시행일자": fields.get("조문시행일자"),
+        "조문변경여부": fields.get("조문변경여부"),
+        "조문내용": process_jo(jomun_content) if jomun_content else None
+    }
+    for field in ["조문제개정유형", "조문이동이전", "조문이동이후"]:
+        jomun_data[field] = fields.get(field)
+
+    hang_list = []
+    for hang in hangs:
+        hang_fields, hos = index_children(hang, "호")
+        hang_number = hang_fields.get("항번호")
+        hang_data = {
+            "항번호": hang_number,
+            "항제개정유형": hang_fields.get("항제개정유형"),
+            "항내용": strip_number(clean_jomun_content(hang_fields.get("항내용")), hang_number)
+        }
+
+        ho_list = []
+        for ho in hos:
+            ho_fields, moks = index_children(ho, "목")
+            ho_number = ho_fields.get("호번호")
+            ho_data = {
+                "호번호": ho_number.rstrip(".") if ho_number is not None else None,
+                "호내용": strip_number(clean_jomun_content(ho_fields.get("호내용")), ho_number)
+            }
+
+            mok_list = []
+            for mok in moks:
+                mok_fields, _ = index_children(mok, None)
+                mok_number = mok_fields.get("목번호")
+                mok_list.append(drop_empty({
+                    "목번호": mok_number.rstrip(".") if mok_number is not None else None,
+                    "목내용": strip_number(clean_jomun_content(mok_fields.get("목내용")), mok_number)
+                }))
+            ho_data['목'] = mok_list
+
+            ho_list.append(drop_empty(ho_data))
+        hang_data['호'] = ho_list
+
+        hang_list.append(drop_empty(hang_data))
+    jomun_data['항'] = hang_list
+
+    return drop_empty(jomun_data)
+
+
+def iterparse_law_detail(source):
+    """
+    Streaming, single-pass variant of parse_law_detail.
+    `source` is a file path or a binary file object. Each 조문단위 and 부칙단위 is
+    converted as soon as it is closed and then cleared, so the full tree is never held.
+    Empty values are dropped while building, so no remove_empty_arrays pass is needed.
+    """
+    law_data = {}
+    jomun_list = []
+    appendix_list = []
+    texts = {}
+    has_jomun = False
+
+    # Section tags are unique in the law.go.kr schema, so dispatching on the tag of
+    # each closed element is enough and avoids tracking start events.
+    for _, elem in ET.iterparse(source):
+        tag = elem.tag
+        if tag == "조문단위":
+            jomun_list.append(convert_jomun_unit(elem))
+            elem.clear()
+        elif tag == "부칙단위":
+            appendix_fields, _ = index_children(elem, None)
+            appendix_list.append(drop_empty({
+                "부칙공포일자": appendix_fields.get("부칙공포일자"),
+                "부칙공포번호": appendix_fields.get("부칙공포번호"),
+                "부칙내용": clean_jomun_content(appendix_fields.get("부칙내용")),
+            }))
+            elem.clear()
+        elif tag in ("개정문내용", "제개정이유내용"):
+            texts.setdefault(tag, elem.text)
+        elif tag == "기본정보" and not law_data:
+            basic_info, _ = index_children(elem, None)
+            law_data = {field: basic_info[field] for field in BASIC_INFO_FIELDS if field in basic_info}
+            elem.clear()
+        elif tag == "조문":
+            has_jomun = True
+
+    if not has_jomun:
+        raise ValueError("No 조문 element in law detail")
+
+    law_data['조문'] = jomun_list
+    law_data['부칙'] = appendix_list
+    if "개정문내용" in texts:
+        law_data['개정문'] = clean_jomun_content(texts["개정문내용"])
+    if "제개정이유내용" in texts:
+        law_data['제개정이유'] = clean_jomun_content(texts["제개정이유내용"])
+
+    return drop_empty(law_data)
+
+
+def parse_law_file(raw_path, detail_dir, parser='iterparse'):
+    """
+    Parses one cached raw law XML into law_details. Runs inside the parse worker pool.
+    """
+    law_id = os.path.basename(raw_path)[len('law_text_'):-len('.xml')]
+    try:
+        if parser == 'iterparse':
+            processed_law_detail = iterparse_law_detail(raw_path)
+        else:
+            with open(raw_path, 'rb') as f:
+                processed_law_detail = parse_law_detail(f.read())
+        with open(os.path.join(detail_dir, f'law_detail_{law_id}.json'), 'w') as f:
+            json.dump(processed_law_detail, f, ensure_ascii=False, indent=4)
+        return law_id, None
+    except Exception as e:
+        return law_id, str(e)
+
+
+def parse_raw_details(data_dir, workers=None, chunksize=16, parser='iterparse'):
+    """
+    Re-parses every cached law_details_raw XML with a process pool.
+    """
+    raw_dir = os.path.join(data_dir, 'law_details_raw')
+    detail_dir = os.path.join(data_dir, 'law_details')
+    os.makedirs(detail_dir, exist_ok=True)
+    raw_paths = sorted(
+        os.path.join(raw_dir, f) for f in os.listdir(raw_dir)
+        if f.startswith('law_text_') and f.endswith('.xml')
+    )
+    worker = partial(parse_law_file, detail_dir=detail_dir, parser=parser)
+    with Pool(processes=workers) as pool:
+        for law_id, error in tqdm(pool.imap_unordered(worker, raw_paths, chunksize=chunksize), total=len(raw_paths)):
+            if error:
+                print(f"Error parsing law {law_id}: {error}")
+
+
+def crawl(args):
+    """
+    Fetches the law list and every new or amended law detail, then parses them.
+    """
+    fetch_kwargs = dict(concurrency=args.concurrency, rate_limit=args.rate_limit, max_retries=args.max_retries)
 
     total_count = check_total_count(f"{args.base}/DRF/lawSearch.do?OC={args.id}&target=law&type=XML&display=100&page=1")
 
     # check if law_list.csv exists
-    try:
-        law_list_df = pd.read_csv(os.path.join(args.data_dir, 'law_list.csv'))
+    list_path = os.path.join(args.data_dir, 'law_list.csv')
+    if os.path.exists(list_path) and not args.sync:
+        law_list_df = pd.read_csv(list_path, dtype=str)
         print("Loaded law_list.csv")
-    except FileNotFoundError:
+    else:
+        list_dir = os.path.join(args.data_dir, 'law_list_raw')
+        os.makedirs(list_dir, exist_ok=True)
+        pages = range(1, total_count // 100 + 2)
+        jobs = [
+            (f"{args.base}/DRF/lawSearch.do?OC={args.id}&target=law&type=XML&display=100&page={page}",
+             os.path.join(list_dir, f'law_list_{page}.xml'))
+            for page in pages
+        ]
+        failed = download_all(jobs, desc='law list', **fetch_kwargs)
+        if failed:
+            raise Exception(f"Failed to fetch {len(failed)} law list pages: {failed[0][2]}")
         law_list = []
-        for page in trange(1, total_count // 100 + 2):
-            url_link = f"{args.base}/DRF/lawSearch.do?OC={args.id}&target=law&type=XML&display=100&page={page}"
-            law_list.extend(crawl_law_list(url_link, page))
+        for page in pages:
+            with open(os.path.join(list_dir, f'law_list_{page}.xml'), 'rb') as f:
+                law_list.extend(parse_law_list(f.read()))
         # save law_list
-        law_list_df = pd.DataFrame(law_list)
-        law_list_df.to_csv(os.path.join(args.data_dir, 'law_list.csv'), index=False)
-    
-    # check if law_detail.json exists
-    for idx, row in tqdm(law_list_df.iterrows(), total=law_list_df.shape[0]):
-        max_retries = 5
-        retry_count = 0
-        while retry_count < max_retries:
-            try:
-                xml_url = f"{args.base}{row['법령상세링크'].replace('HTML', 'XML')}"
-                processed_law_detail = crawl_law_detail(xml_url, row, args)
+        law_list_df = pd.DataFrame(law_list, dtype=str)
+        law_list_df.to_csv(list_path, index=False)
+
+    # only new or amended laws are scheduled for detail fetch and parse
+    manifest = CrawlManifest.load(os.path.join(args.data_dir, 'manifest.json'),
+                                  id_field='법령ID', key_fields=['법령일련번호', '공포일자', '시행일자'])
+    scheduled, removed = manifest.diff([row for _, row in law_list_df.iterrows()])
+    print(f"{len(scheduled)} new or amended laws, {len(removed)} missing from the list")
+    # 목록 조회가 일부 실패하거나 페이지가 밀리면 정상 항목도 빠지므로, 명시적으로 요청하고 목록이 완전할 때만 삭제
+    listed = law_list_df['법령ID'].map(normalize_field).nunique()
+    if removed and not args.prune:
+        print(f"Keeping {len(removed)} laws missing from the list (use --prune to delete them)")
+        removed = []
+    elif removed and listed != total_count:
+        print(f"Not pruning {len(removed)} laws: the list has {listed} of {total_count} laws")
+        removed = []
+
+    raw_dir = os.path.join(args.data_dir, 'law_details_raw')
+    detail_dir = os.path.join(args.data_dir, 'law_details')
+    os.makedirs(raw_dir, exist_ok=True)
+    os.makedirs(detail_dir, exist_ok=True)
+
+    # fetch missing raw law details concurrently
+    jobs = []
+    for row in scheduled:
+        raw_path = os.path.join(raw_dir, f'law_text_{row["법령ID"]}.xml')
+        if manifest.is_stale(row) and os.path.exists(raw_path):
+            os.remove(raw_path)
+        if not os.path.exists(raw_path):
+            jobs.append((f"{args.base}{row['법령상세링크'].replace('HTML', 'XML')}", raw_path))
+    for url, _, e in download_all(jobs, desc='law details', **fetch_kwargs):
+        print(f"Failed after {args.max_retries} retries ({url}): {e}")
+
+    # parse law details from the raw cache
+    updated = []
+    for row in tqdm(scheduled):
+        law_id = manifest.item_id(row)
+        raw_path = os.path.join(raw_dir, f'law_text_{law_id}.xml')
+        detail_path = os.path.join(detail_dir, f'law_detail_{law_id}.json')
+        if not os.path.exists(raw_path):
+            continue
+        try:
+            with open(raw_path, 'rb') as f:
+                response = f.read()
+            digest = content_hash(response)
+            if not (manifest.has_content(law_id, digest) and os.path.exists(detail_path)):
+                processed_law_detail = parse_law_detail(response)
                 # save law_detail
-                os.makedirs(os.path.join(args.data_dir, 'law_details'), exist_ok=True)
-                with open(os.path.join(args.data_dir, 'law_details', f'law_detail_{row["법령ID"]}.json'), 'w') as f:
+                with open(detail_path, 'w') as f:
                     json.dump(processed_law_detail, f, ensure_ascii=False, indent=4)
-                break
-            except Exception as e:
-                retry_count += 1
-                if retry_count >= max_retries:
-                    print(f"Failed after {max_retries} retries: {e}")
-                    break
-                time.sleep(5)
+                updated.append(law_id)
+            manifest.update(row, digest)
+        except Exception as e:
+            print(f"Error parsing {raw_path}: {e}")
+
+    for law_id in removed:
+        for path in [os.path.join(raw_dir, f'law_text_{law_id}.xml'), os.path.join(detail_dir, f'law_detail_{law_id}.json')]:
+            if os.path.exists(path):
+                os.remove(path)
+        manifest.remove(law_id)
+
+    manifest.save()
+    write_changes(os.path.join(args.data_dir, 'changes.json'), 'law', updated, removed)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Retrieve law information.')
+    parser.add_argument('--id', help='API Key ID (required for crawl mode)')
+    parser.add_argument('--base', default='https://www.law.go.kr', help='Base URL')
+    parser.add_argument('--data_dir', default='data/jomun_xml', help='Data directory')
+    parser.add_argument('--concurrency', type=int, default=8, help='Maximum number of in-flight requests')
+    parser.add_argument('--rate_limit', type=float, default=10.0, help='Maximum requests per second per host')
+    parser.add_argument('--max_retries', type=int, default=5, help='Retries of a failed request, after the first attempt (0: no retries)')
+    parser.add_argument('--sync', action='store_true', help='Refetch the law list and only crawl new or amended laws')
+    parser.add_argument('--prune', action='store_true',
+                        help='Delete cached laws missing from a complete list fetch (with --sync)')
+    parser.add_argument('--mode', choices=['crawl', 'parse'], default='crawl',
+                        help='crawl: fetch and parse new or amended items, parse: re-parse the whole raw cache')
+    parser.add_argument('--workers', type=int, default=None, help='Parse worker processes (default: all cores)')
+    parser.add_argument('--chunksize', type=int, default=16, help='Raw files handed to a parse worker at a time')
+    parser.add_argument('--parser', choices=['iterparse', 'tree'], default='iterparse',
+                        help='iterparse: streaming single-pass extractor, tree: full ElementTree parser')
+    args = parser.parse_args()
+
+    if args.mode == 'parse':
+        parse_raw_details(args.data_dir, workers=args.workers, chunksize=args.chunksize, parser=args.parser)
+    else:
+        if not args.id:
+            parser.error('--id is required for crawl mode')
+        crawl(args)
 
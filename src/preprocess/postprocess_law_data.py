@@ -1,23 +1,66 @@
+import argparse
+import hashlib
 import os
 import json
+from functools import partial
+from multiprocessing import Pool
 from tqdm import tqdm
 
 def process_law_file(filename):
+    nodes, original_ids, filtered_ids = build_law_nodes(filename)
+    texts = materialize_texts(nodes)
+    original_result = {key: texts[node_id] for key, node_id in original_ids.items()}
+    filtered_result = {key: texts[node_id] for key, node_id in filtered_ids.items()}
+    return original_result, filtered_result
+
+def build_law_nodes(filename):
+    """
+    Flattens a law into nodes that carry only their own text and the id of their parent.
+    Returns (nodes, original, filtered): the nodes by id, and key -> node id of the
+    original and filtered entries. The full text of an entry is the concatenation of
+    its ancestors' texts and its own, see materialize_text.
+    """
     with open(filename, 'r', encoding='utf-8') as f:
         data = json.load(f)
-    law_name = data.get('법령명_한글', '')
-    articles_list = data.get('조문', [])
-    original_result = {}
-    filtered_result = {}
-    for article in articles_list:
-        orig, filt = process_article(article, law_name, [], '')
-        original_result.update(orig)
-        filtered_result.update(filt)
-    return original_result, filtered_result
+    return flatten_law(data, os.path.splitext(os.path.basename(filename))[0])
 
-def process_article(article_data, law_name, hierarchy, cumulative_text):
+def flatten_law(data, id_prefix):
+    law_name = data.get('법령명_한글', '')
+    nodes = {}
     original = {}
     filtered = {}
+    for article in data.get('조문', []):
+        process_article(article, law_name, [], nodes, original, filtered, id_prefix)
+    return nodes, original, filtered
+
+def add_node(nodes, id_prefix, key, text, parent):
+    node_id = f'{id_prefix}/{len(nodes)}'
+    nodes[node_id] = {'id': node_id, 'title': key, 'text': text, 'parent': parent}
+    return node_id
+
+def materialize_text(node_id, nodes):
+    """
+    Joins the texts from the root down to the node, i.e. the entry's full context.
+    """
+    texts = []
+    while node_id is not None:
+        node = nodes[node_id]
+        texts.append(node['text'])
+        node_id = node['parent']
+    return ''.join(reversed(texts)).strip()
+
+def materialize_texts(nodes):
+    """
+    Materializes the full text of every node at once, joining each parent's text only once.
+    Parents must come before their children in `nodes`, as build_law_nodes and the node shards order them.
+    """
+    prefixes = {}
+    for node_id, node in nodes.items():
+        parent = node['parent']
+        prefixes[node_id] = (prefixes[parent] if parent is not None else '') + node['text']
+    return {node_id: text.strip() for node_id, text in prefixes.items()}
+
+def process_article(article_data, law_name, hierarchy, nodes, original, filtered, id_prefix):
     article_number = article_data.get('조문번호', '')
     article_title = article_data.get('조문제목', '')
     article_content = article_data.get('조문내용', '')
@@ -26,7 +69,7 @@ def process_article(article_data, law_name, hierarchy, cumulative_text):
 
     # 조문번호가 'Unknown'인 경우(예: 장, 절 제목)은 건너뜀
     if article_number == 'Unknown':
-        return original, filtered
+        return
 
     article_num_str = format_article_number(article_number)
     # 계층 업데이트
@@ -36,39 +79,30 @@ def process_article(article_data, law_name, hierarchy, cumulative_text):
         new_hierarchy = hierarchy + [f'제{article_num_str}조']
     key = f'{law_name} {" ".join(new_hierarchy)}'
 
-    # 누적 텍스트 업데이트: 조문 제목과 내용 포함
+    # 조문 노드: 조문 제목과 내용 포함
     current_text = ''
     if article_title:
         current_text += f'{article_title} '
     if article_content:
         current_text += f'{article_content} '
-
-    cumulative_text_article = cumulative_text + current_text + '\t'
+    node_id = add_node(nodes, id_prefix, key, current_text + '\t', None)
+    has_text = bool(current_text.strip())
 
     # 조문의 내용만 포함
-    if current_text.strip():
-        original[key] = current_text.strip()
+    if has_text:
+        original[key] = node_id
         # 필터링: 조문이 온점으로 끝나는지 확인
         if current_text.strip().endswith('.'):
-            filtered[key] = current_text.strip()
+            filtered[key] = node_id
 
     # 항이 있는 경우 처리
     if paragraphs:
-        orig_paras, filt_paras = process_paragraphs(paragraphs, law_name, new_hierarchy, cumulative_text_article)
-        original.update(orig_paras)
-        filtered.update(filt_paras)
+        process_paragraphs(paragraphs, law_name, new_hierarchy, node_id, has_text, nodes, original, filtered, id_prefix)
     elif items:
         # 항이 없고 호만 있는 경우 처리
-        cumulative_text_items = cumulative_text_article
-        orig_items, filt_items = process_items(items, law_name, new_hierarchy, cumulative_text_items)
-        original.update(orig_items)
-        filtered.update(filt_items)
-
-    return original, filtered
+        process_items(items, law_name, new_hierarchy, node_id, has_text, nodes, original, filtered, id_prefix)
 
-def process_paragraphs(paragraphs, law_name, hierarchy, cumulative_text):
-    original = {}
-    filtered = {}
+def process_paragraphs(paragraphs, law_name, hierarchy, parent_id, parent_has_text, nodes, original, filtered, id_prefix):
     for idx, paragraph in enumerate(paragraphs):
         paragraph_number = paragraph.get('항번호')
         paragraph_content = paragraph.get('항내용', '')
@@ -87,28 +121,22 @@ def process_paragraphs(paragraphs, law_name, hierarchy, cumulative_text):
         if paragraph_content.strip().startswith('삭제'):
             continue  # 이 항을 결과에 추가하지 않음
 
-        # 누적 텍스트 업데이트: 조문 + 항 내용
+        # 항 노드: 항 내용만 포함하고 조문은 부모로 참조
         if paragraph_content:
-            current_text = cumulative_text + paragraph_content + '\t'
+            node_id = add_node(nodes, id_prefix, key, paragraph_content + '\t', parent_id)
         else:
-            current_text = cumulative_text + '\t'
+            node_id = add_node(nodes, id_prefix, key, '\t', parent_id)
+        has_text = parent_has_text or bool(paragraph_content.strip())
 
-        # 항의 내용만 포함
-        if current_text.strip():
-            original[key] = current_text.strip()
-            filtered[key] = current_text.strip()
+        if has_text:
+            original[key] = node_id
+            filtered[key] = node_id
 
         # 호가 있는 경우 호 내용 추가 및 처리
         if items:
-            orig_items, filt_items = process_items(items, law_name, new_hierarchy, current_text)
-            original.update(orig_items)
-            filtered.update(filt_items)
-
-    return original, filtered
+            process_items(items, law_name, new_hierarchy, node_id, has_text, nodes, original, filtered, id_prefix)
 
-def process_items(items, law_name, hierarchy, cumulative_text):
-    original = {}
-    filtered = {}
+def process_items(items, law_name, hierarchy, parent_id, parent_has_text, nodes, original, filtered, id_prefix):
     for item in items:
         item_number = item.get('호번호')
         item_content = item.get('호내용', '')
@@ -123,22 +151,16 @@ def process_items(items, law_name, hierarchy, cumulative_text):
         if item_content.strip().startswith('삭제'):
             continue  # 이 호를 결과에 추가하지 않음
 
-        # 누적 텍스트 업데이트: 조문 + 항 + 호 내용
-        current_text = cumulative_text + item_content + '\t'
-
-        # 항의 내용만 포함
-        if current_text.strip():
-            # If there are sub-items, append their content
+        # 호 노드: 호 내용과 목 내용만 포함
+        if parent_has_text or item_content.strip():
+            current_text = item_content + '\t'
             if sub_items:
-                sub_content = process_sub_items_text(sub_items)
-                # 필터링: sub_content에 '삭제'로 시작하는 항목이 포함되어 있는지 확인
-                # 이미 process_sub_items_text에서 '삭제'로 시작하는 항목은 제외했으므로 추가할 필요 없음
-                current_text += sub_content + '\t'
+                # '삭제'로 시작하는 목은 process_sub_items_text에서 이미 제외됨
+                current_text += process_sub_items_text(sub_items) + '\t'
 
-            original[key] = current_text.strip()
-            filtered[key] = current_text.strip()
-
-    return original, filtered
+            node_id = add_node(nodes, id_prefix, key, current_text, parent_id)
+            original[key] = node_id
+            filtered[key] = node_id
 
 def process_sub_items_text(sub_items):
     texts = []
@@ -174,13 +196,216 @@ def format_paragraph_number(paragraph_number):
 def format_item_number(item_number):
     return item_number
 
+def file_signature(path, method):
+    """
+    Returns the change signature of an input file: mtime and size, or a content hash.
+    """
+    if method == 'hash':
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    stat = os.stat(path)
+    return f'{stat.st_mtime_ns}:{stat.st_size}'
+
+def shard_of(filename, num_shards):
+    # hash() is salted per process, so use a stable digest for the shard assignment
+    return int(hashlib.md5(filename.encode('utf-8')).hexdigest(), 16) % num_shards
+
+# Shard subdirectories written per --context
+SHARD_VARIANTS = {'full': ['original', 'filtered'], 'parent': ['nodes']}
+
+def process_law_file_worker(path, context='full'):
+    try:
+        if context == 'parent':
+            return path, build_law_nodes(path), None
+        return path, process_law_file(path), None
+    except Exception as e:
+        return path, None, str(e)
+
+def law_corpus_worker(path):
+    """
+    Flattens one law into corpus records: every original entry with its full text,
+    flagged when it is also a filtered entry, and partitioned by the year of 공포일자.
+    """
+    # vector_store_law.py imports this module as preprocess.postprocess_law_data, so pyarrow is imported lazily
+    from corpus_store import parse_year
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        nodes, original, filtered = flatten_law(data, os.path.splitext(os.path.basename(path))[0])
+        texts = materialize_texts(nodes)
+        year = parse_year(data.get('공포일자'))
+        filtered_ids = set(filtered.values())
+        records = [
+            {'id': node_id, 'title': key, 'content': texts[node_id].replace('\t\t', '\t'),
+             'filtered': node_id in filtered_ids, 'year': year}
+            for key, node_id in original.items()
+        ]
+        return path, records, None
+    except Exception as e:
+        return path, None, str(e)
+
+def write_law_corpus(input_dir, corpus_dir, workers=None, chunksize=8):
+    """
+    Writes the flattened laws into the source=law partition of the columnar corpus.
+    """
+    from corpus_store import write_corpus
+
+    paths = sorted(
+        os.path.join(input_dir, f) for f in os.listdir(input_dir)
+        if f.startswith('law_detail_') and f.endswith('.json')
+    )
+
+    def records():
+        with Pool(processes=workers) as pool:
+            results = pool.imap(law_corpus_worker, paths, chunksize=chunksize)
+            for path, result, error in tqdm(results, total=len(paths), desc="Processing JSON files"):
+                if error:
+                    print(f"파일 처리 중 오류 발생 ({path}): {error}")
+                    continue
+                yield from result
+
+    target = write_corpus(corpus_dir, 'law', records())
+    print(f"처리 완료. 결과가 저장된 경로: {target}")
+
+def write_records(f, results):
+    # \t 여러 개를 하나로 대체하면서 한 줄에 하나씩 기록
+    for key, item in results.items():
+        f.write(json.dumps({'title': key, 'content': item.replace('\t\t', '\t')}, ensure_ascii=False))
+        f.write('\n')
+
+def write_node_records(f, nodes, original, filtered):
+    # 노드마다 자기 텍스트와 부모 id만 기록하고, 전체 문맥은 읽는 쪽에서 materialize_text로 복원
+    original_ids = set(original.values())
+    filtered_ids = set(filtered.values())
+    for node_id, node in nodes.items():
+        record = dict(node, original=node_id in original_ids, filtered=node_id in filtered_ids)
+        f.write(json.dumps(record, ensure_ascii=False))
+        f.write('\n')
+
+def run_sharded(input_dir, output_dir, num_shards=64, workers=None, chunksize=8, check='mtime', context='full'):
+    """
+    Processes law_detail_*.json files in a process pool and streams the results into
+    sharded JSONL files. With context='full' every entry carries its full text under
+    output_dir/original and output_dir/filtered; with context='parent' output_dir/nodes
+    holds each node's own text and its parent id.
+    Shards whose inputs did not change since the last run are skipped.
+    """
+    manifest_path = os.path.join(output_dir, 'manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    if (manifest.get('num_shards') != num_shards or manifest.get('check') != check
+            or manifest.get('context') != context):
+        manifest = {'num_shards': num_shards, 'check': check, 'context': context, 'files': {}}
+    known_files = manifest['files']
+
+    filenames = sorted(
+        f for f in os.listdir(input_dir)
+        if f.startswith('law_detail_') and f.endswith('.json')
+    )
+    signatures = {f: file_signature(os.path.join(input_dir, f), check) for f in filenames}
+
+    dirty = set()
+    for filename, signature in signatures.items():
+        if known_files.get(filename) != signature:
+            dirty.add(shard_of(filename, num_shards))
+    for filename in known_files:
+        if filename not in signatures:
+            dirty.add(shard_of(filename, num_shards))
+    variants = SHARD_VARIANTS[context]
+    for variant in variants:
+        os.makedirs(os.path.join(output_dir, variant), exist_ok=True)
+        for shard in range(num_shards):
+            if not os.path.exists(os.path.join(output_dir, variant, f'law_articles_{shard:05d}.jsonl')):
+                dirty.add(shard)
+    for filename in list(known_files):
+        if shard_of(filename, num_shards) in dirty:
+            del known_files[filename]
+
+    jobs = sorted((shard_of(f, num_shards), f) for f in filenames if shard_of(f, num_shards) in dirty)
+    print(f"{len(dirty)}/{num_shards} shards changed, processing {len(jobs)}/{len(filenames)} files")
+
+    def shard_paths(shard):
+        return [os.path.join(output_dir, variant, f'law_articles_{shard:05d}.jsonl') for variant in variants]
+
+    def open_shard(shard):
+        return [open(f'{path}.part', 'w', encoding='utf-8') for path in shard_paths(shard)]
+
+    def close_shard(shard, files):
+        for f, path in zip(files, shard_paths(shard)):
+            f.close()
+            os.replace(f'{path}.part', path)
+
+    paths = [os.path.join(input_dir, f) for _, f in jobs]
+    current_shard, current_files = None, None
+    with Pool(processes=workers) as pool:
+        # imap keeps job order, so every shard's results arrive contiguously
+        results = pool.imap(partial(process_law_file_worker, context=context), paths, chunksize=chunksize)
+        for (shard, filename), (path, result, error) in tqdm(zip(jobs, results), total=len(jobs), desc="Processing JSON files"):
+            if shard != current_shard:
+                if current_files is not None:
+                    close_shard(current_shard, current_files)
+                current_shard, current_files = shard, open_shard(shard)
+                dirty.discard(shard)
+            if error:
+                print(f"파일 처리 중 오류 발생 ({path}): {error}")
+                continue
+            if context == 'parent':
+                write_node_records(current_files[0], *result)
+            else:
+                write_records(current_files[0], result[0])
+                write_records(current_files[1], result[1])
+            known_files[filename] = signatures[filename]
+    if current_files is not None:
+        close_shard(current_shard, current_files)
+
+    # 입력 파일이 모두 사라진 shard는 빈 파일로 남김
+    for shard in dirty:
+        close_shard(shard, open_shard(shard))
+
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    print(f"처리 완료. 결과가 저장된 경로: {output_dir}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Flatten law details into per-article texts')
+    parser.add_argument('--input_dir', default=os.path.join('data', 'jomun_xml', 'law_details'),
+                        help='Directory of law_detail_*.json files')
+    parser.add_argument('--format', choices=['json', 'jsonl', 'parquet'], default='json',
+                        help='json: two merged JSON files, jsonl: parallel sharded JSONL output, '
+                             'parquet: source=law partition of the columnar corpus')
+    parser.add_argument('--output_dir', default=os.path.join('data', 'law_articles'),
+                        help='Output directory of the sharded JSONL files')
+    parser.add_argument('--corpus_dir', default=os.path.join('data', 'corpus'),
+                        help='Root of the columnar corpus (--format parquet)')
+    parser.add_argument('--num_shards', type=int, default=64, help='Number of JSONL shards')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: all cores)')
+    parser.add_argument('--chunksize', type=int, default=8, help='Files handed to a worker at a time')
+    parser.add_argument('--check', choices=['mtime', 'hash'], default='mtime',
+                        help='How unchanged input files are detected')
+    parser.add_argument('--context', choices=['full', 'parent'], default='full',
+                        help='full: entries carry their cumulative text, parent: nodes carry their own text and parent id')
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+
     # 'law_detail_'로 시작하는 모든 json 파일 가져오기
-    law_details_path = os.path.join('data', 'jomun_xml', 'law_details')
+    law_details_path = args.input_dir
     if not os.path.exists(law_details_path):
         print(f"경로가 존재하지 않습니다: {law_details_path}")
         return
 
+    if args.format == 'parquet':
+        write_law_corpus(law_details_path, args.corpus_dir, workers=args.workers, chunksize=args.chunksize)
+        return
+
+    if args.format == 'jsonl':
+        run_sharded(law_details_path, args.output_dir, num_shards=args.num_shards,
+                    workers=args.workers, chunksize=args.chunksize, check=args.check, context=args.context)
+        return
+
     json_files = [
         os.path.join(law_details_path, f)
         for f in os.listdir(law_details_path)
@@ -0,0 +1,50 @@
+from llama_index.core.base.llms.types import ChatMessage, MessageRole
+from llama_index.core.chat_engine.utils import get_response_synthesizer
+
+from src.telemetry import InstrumentedChatEngine
+
+
+# 참고 문서가 한 번에 들어가지 않을 때 (refine) 사용, 문서와 질문은 항상 마지막 user 메시지에
+PREFIX_STABLE_REFINE_PROMPT = (
+    "참고 문서:\n{context_msg}\n\n"
+    "기존 답변:\n{existing_answer}\n\n"
+    "위 참고 문서로 기존 답변을 보완하시오. 보완할 내용이 없으면 기존 답변을 그대로 반복하시오.\n"
+    "질문: {query_str}"
+)
+
+
+class PrefixStableChatEngine(InstrumentedChatEngine):
+    """
+    Lays out the answer prompt as [system instructions] [prior turns] [documents + question].
+
+    CondensePlusContextChatEngine puts the retrieved documents into the system message,
+    so no two requests share a prefix. Here everything before the last message is the
+    same bytes for every request of a conversation (and the system message for every
+    request), which vLLM's prefix cache can reuse instead of prefilling it again.
+    The context prompt must contain {context_str} and {query_str}.
+    """
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("context_refine_prompt", PREFIX_STABLE_REFINE_PROMPT)
+        super().__init__(*args, **kwargs)
+
+    def _get_response_synthesizer(self, chat_history, streaming=False):
+        system_message = ChatMessage(content=self._system_prompt or "", role=self._llm.metadata.system_role)
+        qa_messages = [
+            system_message,
+            *chat_history,
+            ChatMessage(content=self._context_prompt_template.template, role=MessageRole.USER),
+        ]
+        refine_messages = [
+            system_message,
+            *chat_history,
+            ChatMessage(content=self._context_refine_prompt_template.template, role=MessageRole.USER),
+        ]
+        return get_response_synthesizer(
+            self._llm,
+            self.callback_manager,
+            qa_messages,
+            refine_messages,
+            streaming,
+            qa_function_mappings=self._context_prompt_template.function_mappings,
+            refine_function_mappings=self._context_refine_prompt_template.function_mappings,
+        )
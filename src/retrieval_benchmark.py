@@ -0,0 +1,221 @@
+import argparse
+import gc
+import json
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import faiss
+from llama_index.core import Settings, StorageContext, load_index_from_storage
+from llama_index.core.schema import QueryBundle
+from llama_index.vector_stores.faiss import FaissVectorStore
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from src.sharded_retriever import list_shards, load_sharded_retriever
+from src.vector_quantization import index_vector_dtype
+
+
+EMBEDDERS = ["stub", "hf", "rbln"]
+
+
+def load_labeled_set(path):
+    """
+    Reads a JSONL file of {"question": ..., "gold": ["민법 제750조", ...]} lines.
+    """
+    labeled = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            gold = record.get("gold")
+            if isinstance(gold, str):
+                gold = [gold]
+            if not record.get("question") or not gold:
+                raise ValueError(f"{path}:{line_number} needs a 'question' and a non-empty 'gold'")
+            labeled.append((record["question"], gold))
+    return labeled
+
+
+def matches(node, citation):
+    """
+    A retrieved node cites `citation` if it is its document id or file name, or appears
+    in its title or text (e.g. "민법 제750조").
+    """
+    metadata = node.metadata or {}
+    if citation in (node.ref_doc_id, metadata.get("file_name")):
+        return True
+    return citation in metadata.get("title", "") or citation in node.get_content()
+
+
+def create_embedder(name, model_name, embed_dim):
+    if name == "stub":
+        from src.stubs import StubEmbedding
+        return StubEmbedding(embed_dim=embed_dim)
+    if name == "hf":
+        # Same dense vector as the compiled model: CLS pooling, not normalized
+        from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+        return HuggingFaceEmbedding(model_name=model_name, pooling="cls", normalize=False, device="cpu")
+    from src.utils import RBLNBGEM3Embeddings
+    return RBLNBGEM3Embeddings(rbln_compiled_model_name=model_name)
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Peak rather than current RSS, in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def load_retriever(vector_store_dir, top_k):
+    """
+    Returns (retriever, FAISS indexes) for a persisted store, sharded or not.
+    """
+    if list_shards(vector_store_dir):
+        retriever = load_sharded_retriever(vector_store_dir, similarity_top_k=top_k)
+        faiss_indexes = [shard.index.vector_store.client for shard in retriever.shards.values()]
+        return retriever, faiss_indexes
+    vector_store = FaissVectorStore.from_persist_dir(vector_store_dir)
+    storage_context = StorageContext.from_defaults(vector_store=vector_store, persist_dir=vector_store_dir)
+    index = load_index_from_storage(storage_context=storage_context)
+    return index.as_retriever(similarity_top_k=top_k), [vector_store.client]
+
+
+def set_ef_search(faiss_indexes, ef_search):
+    for faiss_index in faiss_indexes:
+        faiss_index = faiss.downcast_index(faiss_index)
+        if hasattr(faiss_index, "hnsw"):
+            faiss_index.hnsw.efSearch = ef_search
+
+
+def evaluate(retriever, labeled, embeddings, ks, threads):
+    """
+    Runs every question with its precomputed embedding and scores the ranked nodes.
+    """
+    def search(i):
+        question, _ = labeled[i]
+        return retriever.retrieve(QueryBundle(query_str=question, embedding=embeddings[i]))
+
+    start = time.perf_counter()
+    if threads > 1:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            ranked = list(executor.map(search, range(len(labeled))))
+    else:
+        ranked = [search(i) for i in range(len(labeled))]
+    elapsed = time.perf_counter() - start
+
+    recall = {k: 0.0 for k in ks}
+    reciprocal_rank = 0.0
+    for (_, gold), nodes in zip(labeled, ranked):
+        # Rank of the first node citing each gold citation
+        first_hit = {}
+        for rank, node in enumerate(nodes, 1):
+            for citation in gold:
+                if citation not in first_hit and matches(node.node, citation):
+                    first_hit[citation] = rank
+        for k in ks:
+            recall[k] += sum(1 for rank in first_hit.values() if rank <= k) / len(gold)
+        if first_hit:
+            reciprocal_rank += 1.0 / min(first_hit.values())
+
+    return {
+        **{f"recall@{k}": recall[k] / len(labeled) for k in ks},
+        f"mrr@{max(ks)}": reciprocal_rank / len(labeled),
+        "search_qps": len(labeled) / elapsed,
+        "search_ms": elapsed / len(labeled) * 1000,
+    }
+
+
+def benchmark_store(vector_store_dir, labeled, embed_model, args):
+    gc.collect()
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    retriever, faiss_indexes = load_retriever(vector_store_dir, max(args.ks))
+    load_seconds = time.perf_counter() - start
+    rss_after = rss_bytes()
+
+    start = time.perf_counter()
+    embeddings = [embed_model.get_query_embedding(question) for question, _ in labeled]
+    embed_seconds = time.perf_counter() - start
+
+    base = {
+        "vector_store_dir": vector_store_dir,
+        "vectors": sum(faiss_index.ntotal for faiss_index in faiss_indexes),
+        "vector_dtype": index_vector_dtype(faiss_indexes[0]) if faiss_indexes else None,
+        "index_bytes": sum(len(faiss.serialize_index(faiss_index)) for faiss_index in faiss_indexes),
+        "rss_delta_bytes": rss_after - rss_before,
+        "load_seconds": load_seconds,
+        "embed_qps": len(labeled) / embed_seconds,
+    }
+    rows = []
+    for ef_search in args.ef_search or [None]:
+        if ef_search is not None:
+            set_ef_search(faiss_indexes, ef_search)
+        rows.append({**base, "ef_search": ef_search, **evaluate(retriever, labeled, embeddings, args.ks, args.threads)})
+    return rows
+
+
+def format_cell(value):
+    if value is None:
+        return f"{'-':>10}"
+    if isinstance(value, float):
+        return f"{value:>10.4f}"
+    return f"{value:>10}"
+
+
+def print_rows(rows, ks):
+    columns = ["ef_search", *[f"recall@{k}" for k in ks], f"mrr@{max(ks)}", "search_qps", "search_ms"]
+    for vector_store_dir in dict.fromkeys(row["vector_store_dir"] for row in rows):
+        store_rows = [row for row in rows if row["vector_store_dir"] == vector_store_dir]
+        first = store_rows[0]
+        print(f"{vector_store_dir}: {first['vectors']} vectors ({first['vector_dtype']}), "
+              f"index {first['index_bytes'] / 2**20:.1f} MiB, RSS +{first['rss_delta_bytes'] / 2**20:.1f} MiB, "
+              f"loaded in {first['load_seconds']:.1f}s, embedding {first['embed_qps']:.1f} q/s")
+        print("  " + "  ".join(f"{column:>10}" for column in columns))
+        for row in store_rows:
+            print("  " + "  ".join(format_cell(row[column]) for column in columns))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline retrieval benchmark: recall@k, MRR, QPS and memory of persisted stores")
+    parser.add_argument("--labeled_set", type=str, required=True,
+                        help="JSONL of {\"question\": ..., \"gold\": [citation, ...]} lines")
+    parser.add_argument("--vector_store_dir", type=str, nargs="+", default=["data/rag"],
+                        help="Persisted stores to compare, e.g. one per index configuration")
+    parser.add_argument("--embedder", type=str, choices=EMBEDDERS, default="hf",
+                        help="Query embedder: stub (hashing), hf (HuggingFace on CPU) or rbln (NPU)")
+    parser.add_argument("--embedding_model", type=str, default="BAAI/bge-m3",
+                        help="Model of the hf embedder, or the compiled model directory of rbln")
+    parser.add_argument("--embed_dim", type=int, default=1024, help="Dimension of the stub embedder (BGE-M3's by default)")
+    parser.add_argument("--ks", type=int, nargs="+", default=[1, 3, 5, 10], help="Cutoffs of recall@k")
+    parser.add_argument("--ef_search", type=int, nargs="*", default=[],
+                        help="HNSW efSearch values to sweep (default: as persisted)")
+    parser.add_argument("--threads", type=int, default=1, help="Concurrent searches when measuring QPS")
+    parser.add_argument("--output", type=str, default="", help="Write the results to this JSON file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    args.ks = sorted(set(args.ks))
+    labeled = load_labeled_set(args.labeled_set)
+
+    embed_model = create_embedder(args.embedder, args.embedding_model, args.embed_dim)
+    # Loaded indexes (and the shard retriever) resolve their embed model from Settings
+    Settings.embed_model = embed_model
+    rows = []
+    for vector_store_dir in args.vector_store_dir:
+        rows.extend(benchmark_store(vector_store_dir, labeled, embed_model, args))
+
+    print_rows(rows, args.ks)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"args": vars(args), "results": rows}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+class Overloaded(Exception):
+    """
+    Raised by Scheduler.submit when the queue is full or a request would wait longer
+    than the deadline; retry_after is the estimated wait in seconds.
+    """
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """
+    One request's place in the Scheduler: queued, then running until released.
+    """
+    def __init__(self, scheduler, conversation_id, priority, turn, seq):
+        self._scheduler = scheduler
+        self.conversation_id = conversation_id
+        self.priority = priority
+        self.key = (priority, turn, seq)
+        self.enqueued = time.perf_counter()
+        self.admitted = None
+        self.released = False
+
+    def wait(self, timeout=None):
+        """
+        Waits up to timeout seconds for a slot. Returns True once admitted.
+        """
+        return self._scheduler._wait(self, timeout)
+
+    def waited(self):
+        return (self.admitted or time.perf_counter()) - self.enqueued
+
+    def position(self):
+        """
+        1 for the next request to be admitted, 0 once admitted.
+        """
+        return self._scheduler._position(self)
+
+    def estimated_wait(self):
+        return self._scheduler._estimated_wait(self)
+
+    def release(self):
+        """
+        Frees the slot (or leaves the queue). Safe to call more than once.
+        """
+        self._scheduler._release(self)
+
+
+class Scheduler:
+    """
+    Admission control in front of the LLM backend, which runs `capacity` sequences at
+    once (vLLM's --max-num-seqs). Requests beyond that wait in a bounded priority queue
+    instead of piling up as connections on vLLM, and a request whose estimated wait
+    exceeds the deadline is rejected at once rather than timing out later.
+
+    Lower priority values go first. Within a priority, conversations take turns: a
+    conversation's n-th outstanding request goes behind every other conversation's
+    (n-1)-th, so one client sending a burst cannot starve the others.
+    """
+    def __init__(self, capacity=1, max_queue=32, deadline=120.0, service_time=20.0, smoothing=0.2):
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.deadline = deadline
+        # How long a request holds a slot, moving average of the finished ones
+        self.service_time = service_time
+        self.smoothing = smoothing
+        self.completed = 0
+        self.rejected = 0
+        self._queue = []
+        self._running = set()
+        self._outstanding = {}
+        self._seq = itertools.count()
+        self._condition = threading.Condition()
+
+    def submit(self, conversation_id, priority=0):
+        """
+        Queues a request and returns its Ticket, admitted at once if a slot is free.
+        Raises Overloaded instead of queueing when it would wait past the deadline.
+        """
+        with self._condition:
+            turn = self._outstanding.get(conversation_id, 0)
+            ticket = Ticket(self, conversation_id, priority, turn, next(self._seq))
+            if len(self._queue) >= self.max_queue:
+                self.rejected += 1
+                raise Overloaded(f"Queue is full ({self.max_queue} requests waiting)", self._estimate(len(self._queue)))
+            estimated = self._estimate(sum(1 for key, _ in self._queue if key < ticket.key))
+            if estimated > self.deadline:
+                self.rejected += 1
+                raise Overloaded(f"Estimated wait {estimated:.0f}s exceeds the {self.deadline:.0f}s deadline", estimated)
+            heapq.heappush(self._queue, (ticket.key, ticket))
+            self._outstanding[conversation_id] = turn + 1
+            self._dispatch()
+            return ticket
+
+    def status(self):
+        with self._condition:
+            return {
+                "capacity": self.capacity,
+                "running": len(self._running),
+                "queued": len(self._queue),
+                "max_queue": self.max_queue,
+                "deadline": self.deadline,
+                "service_time": self.service_time,
+                "estimated_wait": self._estimate(len(self._queue)),
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def _estimate(self, ahead):
+        """
+        Seconds until a request with `ahead` queued requests in front of it is admitted:
+        the slots free up as the running requests finish, then every service_time.
+        """
+        now = time.perf_counter()
+        remaining = sorted(
+            [0.0] * (self.capacity - len(self._running))
+            + [max(0.0, self.service_time - (now - ticket.admitted)) for ticket in self._running]
+        )
+        rounds, slot = divmod(ahead, self.capacity)
+        return remaining[slot] + rounds * self.service_time
+
+    def _dispatch(self):
+        while self._queue and len(self._running) < self.capacity:
+            _, ticket = heapq.heappop(self._queue)
+            ticket.admitted = time.perf_counter()
+            self._running.add(ticket)
+        self._condition.notify_all()
+
+    def _wait(self, ticket, timeout):
+        with self._condition:
+            return self._condition.wait_for(lambda: ticket.admitted is not None or ticket.released, timeout)
+
+    def _position(self, ticket):
+        with self._condition:
+            if ticket.admitted is not None or ticket.released:
+                return 0
+            return 1 + sum(1 for key, _ in self._queue if key < ticket.key)
+
+    def _estimated_wait(self, ticket):
+        with self._condition:
+            if ticket.admitted is not None or ticket.released:
+                return 0.0
+            return self._estimate(sum(1 for key, _ in self._queue if key < ticket.key))
+
+    def _release(self, ticket):
+        with self._condition:
+            if ticket.released:
+                return
+            ticket.released = True
+            if ticket.admitted is not None:
+                self._running.discard(ticket)
+                held = time.perf_counter() - ticket.admitted
+                self.service_time += self.smoothing * (held - self.service_time)
+                self.completed += 1
+            else:
+                # 대기 중에 연결이 끊긴 요청
+                self._queue = [entry for entry in self._queue if entry[1] is not ticket]
+                heapq.heapify(self._queue)
+            remaining = self._outstanding[ticket.conversation_id] - 1
+            if remaining:
+                self._outstanding[ticket.conversation_id] = remaining
+            else:
+                del self._outstanding[ticket.conversation_id]
+            self._dispatch()
@@ -0,0 +1,159 @@
+import argparse
+import json
+import os
+import shlex
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from src.compile_eeve import load_manifest, save_manifest
+
+
+def record_measurement(output_dir, model_dir, load_test_output):
+    """
+    Stores the throughput load_test.py measured against vLLM serving model_dir in its manifest entry.
+    """
+    with open(load_test_output, 'r', encoding='utf-8') as f:
+        result = json.load(f)
+    measurement = {
+        "concurrency": result["args"]["concurrency"],
+        "output_tokens_per_second": result["summary"]["output_tokens_per_second"],
+        "requests_per_second": result["summary"]["requests_per_second"],
+        "ttft_p95": result["summary"]["ttft"]["p95"],
+        "error_rate": result["summary"]["error_rate"],
+    }
+    manifest = load_manifest(output_dir)
+    for artifact in manifest["artifacts"]:
+        if os.path.normpath(artifact["model_dir"]) == os.path.normpath(model_dir):
+            artifact["measurements"] = [
+                m for m in artifact.get("measurements", []) if m["concurrency"] != measurement["concurrency"]
+            ] + [measurement]
+            save_manifest(output_dir, manifest)
+            return measurement
+    raise ValueError(f"{model_dir} is not in the manifest of {output_dir}")
+
+
+def per_sequence_rate(artifact):
+    """
+    Measured output tokens/s of one sequence, from the measurement with the most parallel sequences.
+    """
+    measurements = [m for m in artifact.get("measurements", []) if m["output_tokens_per_second"]]
+    if not measurements:
+        return None
+    best = max(measurements, key=lambda m: min(m["concurrency"], artifact["batch_size"]))
+    return best["output_tokens_per_second"] / min(best["concurrency"], artifact["batch_size"])
+
+
+def throughput(artifact, concurrency, fallback_rate):
+    """
+    Output tokens/s at `concurrency` users: measured at that concurrency if recorded,
+    otherwise min(concurrency, batch size) sequences decoding at the per-sequence rate
+    (the artifact's own measurements, or those of the other artifacts).
+    Returns (tokens/s, source).
+    """
+    for measurement in artifact.get("measurements", []):
+        if measurement["concurrency"] == concurrency:
+            return measurement["output_tokens_per_second"], "measured"
+    rate = per_sequence_rate(artifact)
+    source = "scaled"
+    if rate is None:
+        rate, source = fallback_rate, "estimated"
+    return rate * min(concurrency, artifact["batch_size"]), source
+
+
+def rank_artifacts(manifest, concurrency, min_context, tensor_parallel_size=None):
+    artifacts = [
+        artifact for artifact in manifest["artifacts"]
+        if artifact.get("status") == "ok" and artifact["max_seq_len"] >= min_context
+        and (tensor_parallel_size is None or artifact["tensor_parallel_size"] == tensor_parallel_size)
+        and os.path.isdir(artifact["model_dir"])
+    ]
+    # 측정값이 없는 artifact는 다른 artifact의 sequence당 속도로 추정 (없으면 상대값 1)
+    rates = [rate for rate in map(per_sequence_rate, artifacts) if rate is not None]
+    fallback_rate = sum(rates) / len(rates) if rates else 1.0
+    rows = []
+    for artifact in artifacts:
+        tokens_per_second, source = throughput(artifact, concurrency, fallback_rate)
+        if not rates:
+            # 아무 측정값도 없으면 동시에 decode하는 sequence 수만 비교
+            source = "relative, no measurements"
+        rows.append({**artifact, "throughput": tokens_per_second, "source": source})
+    # 같은 처리량이면 batch가 작은 것 (token당 지연, 메모리), 그다음 KV block이 작은 것
+    # (prefix caching은 꽉 찬 block만 재사용), 그다음 context가 짧은 것
+    rows.sort(key=lambda row: (-row["throughput"], row["batch_size"], row["block_size"], row["max_seq_len"]))
+    return rows
+
+
+def launch_env(artifact, prefix_caching):
+    """
+    Variables run_vllm.sh reads to start vLLM (and main.py) for this artifact.
+    """
+    return {
+        "VLLM_MODEL_DIR": artifact["model_dir"],
+        "VLLM_MAX_NUM_SEQS": artifact["batch_size"],
+        "VLLM_MAX_MODEL_LEN": artifact["max_seq_len"],
+        "VLLM_MAX_NUM_BATCHED_TOKENS": artifact["max_seq_len"],
+        "VLLM_BLOCK_SIZE": artifact["block_size"],
+        "VLLM_PREFIX_CACHING": int(prefix_caching),
+    }
+
+
+def vllm_args(env):
+    args = [
+        "--model", env["VLLM_MODEL_DIR"],
+        "--compiled-model-dir", env["VLLM_MODEL_DIR"],
+        "--dtype", "auto",
+        "--device", "rbln",
+        "--max-num-seqs", env["VLLM_MAX_NUM_SEQS"],
+        "--max-num-batched-tokens", env["VLLM_MAX_NUM_BATCHED_TOKENS"],
+        "--max-model-len", env["VLLM_MAX_MODEL_LEN"],
+        "--block-size", env["VLLM_BLOCK_SIZE"],
+    ]
+    if env["VLLM_PREFIX_CACHING"]:
+        args.append("--enable-prefix-caching")
+    return " ".join(shlex.quote(str(arg)) for arg in args)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Pick the compiled EEVE artifact with the highest throughput for a target concurrency")
+    parser.add_argument("--output_dir", type=str, default="models", help="--output_dir of compile_eeve.py (with the manifest)")
+    parser.add_argument("--concurrency", type=int, default=1, help="Concurrent requests to serve")
+    parser.add_argument("--min_context", type=int, default=4096,
+                        help="Smallest max_seq_len that fits the prompt, documents, history and answer")
+    parser.add_argument("--tensor_parallel_size", type=int, default=None, help="Only consider artifacts of this split")
+    parser.add_argument("--no_prefix_caching", action="store_true", help="Launch vLLM without --enable-prefix-caching")
+    parser.add_argument("--launch_env", type=str, default="models/vllm_launch.env",
+                        help="Write the chosen artifact's launch variables here, read by run_vllm.sh")
+    parser.add_argument("--record", type=str, nargs=2, metavar=("MODEL_DIR", "LOAD_TEST_OUTPUT"),
+                        help="Record a load_test.py --output result measured against vLLM serving MODEL_DIR, then exit")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.record:
+        measurement = record_measurement(args.output_dir, *args.record)
+        print(f"Recorded {measurement} for {args.record[0]}")
+        return
+
+    rows = rank_artifacts(load_manifest(args.output_dir), args.concurrency, args.min_context, args.tensor_parallel_size)
+    if not rows:
+        raise SystemExit(f"No compiled artifact in {args.output_dir} with max_seq_len >= {args.min_context}, "
+                         f"run compile_eeve.py first")
+    for row in rows:
+        print(f"batch {row['batch_size']:>3} max {row['max_seq_len']:>5} block {row['block_size']:>5} "
+              f"npu{row['tensor_parallel_size']}: "
+              f"{row['throughput']:10.2f} tokens/s ({row['source']})  {row['model_dir']}")
+
+    best = rows[0]
+    env = launch_env(best, not args.no_prefix_caching)
+    with open(args.launch_env, 'w', encoding='utf-8') as f:
+        f.write(f"# select_eeve.py --concurrency {args.concurrency}: {best['throughput']:.2f} tokens/s ({best['source']})\n")
+        for name, value in env.items():
+            f.write(f"{name}={shlex.quote(str(value))}\n")
+    print(f"\nSelected {best['model_dir']}, wrote {args.launch_env}")
+    print(f"vLLM arguments: {vllm_args(env)}")
+
+
+if __name__ == "__main__":
+    main()
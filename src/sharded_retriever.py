@@ -0,0 +1,233 @@
+import contextvars
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import faiss
+from llama_index.core import Settings, StorageContext, load_index_from_storage
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.core.storage.docstore.simple_docstore import SimpleDocumentStore
+from llama_index.vector_stores.faiss import FaissVectorStore
+
+
+logger = logging.getLogger(__name__)
+
+# <vector_store_dir>/shards/<name>/ 마다 하나의 독립된 storage context (faiss + docstore + index store)
+SHARDS_DIR = "shards"
+VECTOR_STORE_FNAME = "default__vector_store.json"
+
+
+def shard_dir(vector_store_dir, name):
+    return os.path.join(vector_store_dir, SHARDS_DIR, name)
+
+
+def list_shards(vector_store_dir):
+    root = os.path.join(vector_store_dir, SHARDS_DIR)
+    if not os.path.isdir(root):
+        return []
+    # '_' 로 시작하는 디렉토리는 빌드 중이거나 교체 직후의 이전 버전
+    return sorted(
+        name for name in os.listdir(root)
+        if not name.startswith("_") and os.path.exists(os.path.join(root, name, VECTOR_STORE_FNAME))
+    )
+
+
+def building_dir(vector_store_dir, name):
+    return os.path.join(vector_store_dir, SHARDS_DIR, f"_{name}.part")
+
+
+def publish_shard(vector_store_dir, name):
+    """
+    Moves a finished shard from its building directory into place. The old version is
+    renamed away first, so a running server polling the shards never sees a partial shard.
+    """
+    target = shard_dir(vector_store_dir, name)
+    old_target = os.path.join(vector_store_dir, SHARDS_DIR, f"_{name}.old")
+    shutil.rmtree(old_target, ignore_errors=True)
+    if os.path.exists(target):
+        os.replace(target, old_target)
+    os.replace(building_dir(vector_store_dir, name), target)
+    shutil.rmtree(old_target, ignore_errors=True)
+    return target
+
+
+def shard_version(path):
+    # publish_shard는 디렉토리를 통째로 교체하므로 디렉토리 inode도 비교
+    return os.stat(path).st_ino, os.stat(os.path.join(path, VECTOR_STORE_FNAME)).st_mtime_ns
+
+
+class Shard:
+    def __init__(self, name, path, similarity_top_k, vector_store_cls=FaissVectorStore,
+                 docstore_cls=SimpleDocumentStore, attempts=3):
+        self.name = name
+        self.path = path
+        # The files are read one by one; if the shard is republished meanwhile, the FAISS
+        # index and the docstore may come from different builds, so load it again
+        for _ in range(attempts):
+            self.version = shard_version(path)
+            vector_store = vector_store_cls.from_persist_dir(path)
+            storage_context = StorageContext.from_defaults(
+                vector_store=vector_store, docstore=docstore_cls.from_persist_dir(path), persist_dir=path,
+            )
+            self.index = load_index_from_storage(storage_context=storage_context)
+            if shard_version(path) == self.version:
+                break
+        else:
+            raise RuntimeError(f"Shard {name} was republished during each of {attempts} loads")
+        self.retriever = self.index.as_retriever(similarity_top_k=similarity_top_k)
+        # FaissVectorStore reports raw FAISS distances: smaller is closer for L2
+        self.higher_is_better = vector_store.client.metric_type == faiss.METRIC_INNER_PRODUCT
+
+
+class ShardedRetriever(BaseRetriever):
+    """
+    Fans a query out to one FAISS shard per source (e.g. law, case, case-2010-2019)
+    on a thread pool and merges the hits by score. FAISS releases the GIL while
+    searching, so shards are searched in parallel. The query is embedded once.
+
+    Shards can be reloaded while serving: a reloaded shard replaces the old one in a
+    new mapping, and queries already running keep the mapping they started with.
+    """
+    def __init__(self, vector_store_dir, similarity_top_k=2, shards=None, embed_model=None,
+                 max_workers=None, parent=None, vector_store_cls=FaissVectorStore,
+                 docstore_cls=SimpleDocumentStore, **kwargs):
+        super().__init__(**kwargs)
+        self.vector_store_dir = vector_store_dir
+        self.similarity_top_k = similarity_top_k
+        self._embed_model = embed_model
+        self._only = set(shards) if shards else None
+        self._shards: Dict[str, Shard] = {}
+        # 마지막으로 로드에 실패한 shard 버전과 오류, 해당 shard는 이전 버전으로 계속 검색
+        self.errors: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._parent = parent
+        self._store_classes = (vector_store_cls, docstore_cls)
+        if parent is not None:
+            self._executor = parent._executor
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shard-search")
+
+    @property
+    def embed_model(self):
+        return self._embed_model or Settings.embed_model
+
+    @property
+    def shards(self):
+        return self._parent.shards if self._parent is not None else self._shards
+
+    def shard_names(self, shards=None):
+        shards = self.shards if shards is None else shards
+        return sorted(name for name in shards if self._only is None or name in self._only)
+
+    def restrict(self, shards):
+        """
+        Returns a view of this retriever limited to the given shards. The view shares the
+        loaded shards and the thread pool, and sees reloads made on this retriever.
+        """
+        return ShardedRetriever(self.vector_store_dir, self.similarity_top_k, shards=shards,
+                                embed_model=self._embed_model, parent=self)
+
+    def reload(self):
+        """
+        Loads shards that are new or rebuilt on disk and drops deleted ones.
+        A shard that fails to load keeps serving its previous version (if any) and is
+        retried once it is rebuilt again; the error is kept in `errors`.
+        Returns the names of the shards that changed.
+        """
+        # 검색은 lock 없이 self._shards를 읽고, reload끼리만 직렬화됨
+        with self._lock:
+            changed = []
+            current = self._shards
+            loaded = {}
+            names = list_shards(self.vector_store_dir)
+            for name in names:
+                path = shard_dir(self.vector_store_dir, name)
+                version = None
+                try:
+                    version = shard_version(path)
+                    if name in current and current[name].version == version:
+                        loaded[name] = current[name]
+                        continue
+                    if self.errors.get(name, {}).get("version") == version:
+                        # 로드에 실패한 버전은 다시 빌드될 때까지 재시도하지 않음
+                        if name in current:
+                            loaded[name] = current[name]
+                        continue
+                    loaded[name] = Shard(name, path, self.similarity_top_k, *self._store_classes)
+                    self.errors.pop(name, None)
+                    changed.append(name)
+                except FileNotFoundError:
+                    # 교체 중인 shard는 다음 reload에서 다시 읽음
+                    if name in current:
+                        loaded[name] = current[name]
+                except Exception as e:
+                    kept = "keeping the loaded version" if name in current else "not serving it"
+                    logger.exception(f"Failed to load shard {name} from {path}, {kept}")
+                    self.errors[name] = {"version": version, "error": f"{type(e).__name__}: {e}", "at": time.time()}
+                    if name in current:
+                        loaded[name] = current[name]
+            changed.extend(name for name in current if name not in loaded)
+            self.errors = {name: error for name, error in self.errors.items() if name in names}
+            self._shards = loaded
+            return changed
+
+    def status(self):
+        shards = self.shards
+        return {
+            "shards": {name: {"path": shard.path, "version": shard.version} for name, shard in shards.items()},
+            "errors": dict(self._parent.errors if self._parent is not None else self.errors),
+        }
+
+    def start_watcher(self, interval):
+        """
+        Polls the shards directory every `interval` seconds and reloads rebuilt shards.
+        """
+        def watch():
+            while not stop.wait(interval):
+                try:
+                    self.reload()
+                except Exception:
+                    logger.exception(f"Reloading shards from {self.vector_store_dir} failed, retrying in {interval}s")
+
+        stop = threading.Event()
+        thread = threading.Thread(target=watch, name="shard-watcher", daemon=True)
+        thread.start()
+        return stop
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        shards = self.shards
+        selected = [shards[name] for name in self.shard_names(shards)]
+        if not selected:
+            return []
+        if query_bundle.embedding is None:
+            query_bundle.embedding = self.embed_model.get_agg_embedding_from_queries(query_bundle.embedding_strs)
+
+        # 각 검색 스레드가 요청의 context (예: telemetry trace)를 그대로 보도록 복사해서 실행
+        futures = [
+            self._executor.submit(contextvars.copy_context().run, shard.retriever.retrieve, query_bundle)
+            for shard in selected
+        ]
+        results: List[NodeWithScore] = []
+        for future in futures:
+            results.extend(future.result())
+
+        higher_is_better = selected[0].higher_is_better
+        results.sort(key=lambda node: node.score if node.score is not None else 0.0, reverse=higher_is_better)
+        return results[:self.similarity_top_k]
+
+
+def load_sharded_retriever(vector_store_dir, similarity_top_k=2, shards=None, poll_interval=0, **kwargs):
+    """
+    Loads every shard under vector_store_dir/shards. With poll_interval > 0,
+    rebuilt shards are picked up in the background without restarting the server.
+    """
+    retriever = ShardedRetriever(vector_store_dir, similarity_top_k=similarity_top_k, shards=shards, **kwargs)
+    retriever.reload()
+    if poll_interval > 0:
+        retriever.start_watcher(poll_interval)
+    return retriever
@@ -0,0 +1,154 @@
+import json
+import os
+from collections import defaultdict
+
+import numpy as np
+from llama_index.core import VectorStoreIndex
+from llama_index.core.schema import MetadataMode
+
+
+SPARSE_INDEX_FILE = "sparse_index.npz"
+SPARSE_NODE_IDS_FILE = "sparse_node_ids.json"
+
+
+class SparseInvertedIndex:
+    """
+    Inverted index of BGE-M3 lexical weights, persisted next to the FAISS index.
+
+    On disk every token id owns a contiguous posting list (CSR layout):
+    token_ids[i]'s postings are rows[indptr[i]:indptr[i + 1]] with float16 weights,
+    and a row is the position of its node id in sparse_node_ids.json.
+    """
+    def __init__(self):
+        self.node_ids = []
+        self._rows = {}
+        self._postings = defaultdict(list)
+        self._arrays = None
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def __contains__(self, node_id):
+        return node_id in self._rows
+
+    def add(self, node_id, sparse):
+        if node_id in self._rows:
+            return
+        self._unpack()
+        row = len(self.node_ids)
+        self._rows[node_id] = row
+        self.node_ids.append(node_id)
+        for token_id, weight in sparse.items():
+            self._postings[int(token_id)].append((row, weight))
+
+    def _pack(self):
+        if self._arrays is None:
+            token_ids = np.array(sorted(self._postings), dtype=np.int32)
+            indptr = np.zeros(len(token_ids) + 1, dtype=np.int64)
+            rows, weights = [], []
+            for i, token_id in enumerate(token_ids):
+                postings = self._postings[int(token_id)]
+                indptr[i + 1] = indptr[i] + len(postings)
+                rows.extend(row for row, _ in postings)
+                weights.extend(weight for _, weight in postings)
+            self._arrays = (token_ids, indptr, np.array(rows, dtype=np.int32), np.array(weights, dtype=np.float16))
+        return self._arrays
+
+    def _unpack(self):
+        # Back to per-token lists so that more nodes can be added to a loaded index
+        if self._arrays is not None and not self._postings:
+            token_ids, indptr, rows, weights = self._arrays
+            for i, token_id in enumerate(token_ids.tolist()):
+                start, end = indptr[i], indptr[i + 1]
+                self._postings[token_id] = list(zip(rows[start:end].tolist(), weights[start:end].tolist()))
+        self._arrays = None
+
+    def select(self, node_ids):
+        """
+        Returns a new index with only the postings of node_ids (that are in this one).
+        """
+        token_ids, indptr, rows, weights = self._pack()
+        keep = set(node_ids)
+        selected = SparseInvertedIndex()
+        selected.node_ids = [node_id for node_id in self.node_ids if node_id in keep]
+        selected._rows = {node_id: row for row, node_id in enumerate(selected.node_ids)}
+        # 남는 node의 새 row 번호, 빠지는 node는 -1
+        row_map = np.full(len(self.node_ids), -1, dtype=np.int32)
+        row_map[[self._rows[node_id] for node_id in selected.node_ids]] = np.arange(len(selected.node_ids), dtype=np.int32)
+        posting_tokens = np.repeat(np.arange(len(token_ids)), np.diff(indptr))
+        new_rows = row_map[rows]
+        mask = new_rows >= 0
+        counts = np.bincount(posting_tokens[mask], minlength=len(token_ids))
+        new_indptr = np.zeros(len(token_ids) + 1, dtype=np.int64)
+        np.cumsum(counts, out=new_indptr[1:])
+        present = counts > 0
+        selected._arrays = (
+            token_ids[present],
+            np.concatenate([[0], new_indptr[1:][present]]).astype(np.int64),
+            new_rows[mask],
+            weights[mask],
+        )
+        return selected
+
+    def save(self, persist_dir):
+        token_ids, indptr, rows, weights = self._pack()
+        np.savez(os.path.join(persist_dir, SPARSE_INDEX_FILE),
+                 token_ids=token_ids, indptr=indptr, rows=rows, weights=weights)
+        with open(os.path.join(persist_dir, SPARSE_NODE_IDS_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.node_ids, f, ensure_ascii=False)
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir):
+        index = cls()
+        with np.load(os.path.join(persist_dir, SPARSE_INDEX_FILE)) as data:
+            index._arrays = (data["token_ids"], data["indptr"], data["rows"], data["weights"])
+        with open(os.path.join(persist_dir, SPARSE_NODE_IDS_FILE), "r", encoding="utf-8") as f:
+            index.node_ids = json.load(f)
+        index._rows = {node_id: row for row, node_id in enumerate(index.node_ids)}
+        return index
+
+    @classmethod
+    def exists(cls, persist_dir):
+        return os.path.exists(os.path.join(persist_dir, SPARSE_INDEX_FILE))
+
+    def search(self, query_sparse, top_k=10):
+        """
+        Scores nodes by the dot product of lexical weights with the query's.
+        Returns up to top_k (node id, score) pairs, best first.
+        """
+        token_ids, indptr, rows, weights = self._pack()
+        scores = np.zeros(len(self.node_ids), dtype=np.float32)
+        for token_id, query_weight in query_sparse.items():
+            i = np.searchsorted(token_ids, token_id)
+            if i < len(token_ids) and token_ids[i] == token_id:
+                start, end = indptr[i], indptr[i + 1]
+                scores[rows[start:end]] += query_weight * weights[start:end].astype(np.float32)
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [(self.node_ids[row], float(scores[row])) for row in candidates]
+
+
+class SparseVectorStoreIndex(VectorStoreIndex):
+    """
+    VectorStoreIndex that also adds the BGE-M3 lexical weights of every inserted node to
+    sparse_index, under its node id, from the same forward pass as its dense vector.
+    Each insert batch goes into the inverted index as soon as it is embedded.
+    """
+    def __init__(self, *args, sparse_index=None, **kwargs):
+        self._sparse_index = sparse_index
+        super().__init__(*args, **kwargs)
+
+    def _get_node_with_embedding(self, nodes, show_progress=False):
+        if self._sparse_index is None:
+            return super()._get_node_with_embedding(nodes, show_progress)
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+        results = []
+        for start, dense, sparse in self._embed_model.iter_dense_sparse_batches(texts):
+            for node, vector, weights in zip(nodes[start:start + len(dense)], dense, sparse):
+                result = node.model_copy()
+                result.embedding = vector.tolist()
+                results.append(result)
+                self._sparse_index.add(node.node_id, weights)
+        return results
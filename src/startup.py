@@ -0,0 +1,105 @@
+import concurrent.futures
+import logging
+import threading
+import time
+
+
+class Startup:
+    """
+    Loads the server's components (models, index, ...) concurrently, one background
+    thread each. Requests wait on a component's future instead of the server waiting
+    for all of them, so start-up takes as long as the slowest component, not the sum.
+    """
+    def __init__(self, logger=None):
+        self.logger = logger or logging.getLogger(__name__)
+        self.started = time.perf_counter()
+        self.finished = None
+        self._sealed = False
+        self._futures = {}
+        self._timings = {}
+        self._lock = threading.Lock()
+
+    def submit(self, name, fn, *requires):
+        """
+        Starts loading component `name` with fn(), once the components it requires are loaded.
+        """
+        future = concurrent.futures.Future()
+        dependencies = [self._futures[required] for required in requires]
+        self._futures[name] = future
+
+        def run():
+            try:
+                for dependency in dependencies:
+                    dependency.result()
+                start = time.perf_counter()
+                try:
+                    result = fn()
+                finally:
+                    self._timings[name] = (start - self.started, time.perf_counter() - start)
+                future.set_result(result)
+            except BaseException as e:
+                future.set_exception(e)
+                self.logger.error(f"Failed to load {name}: {type(e).__name__}: {e}")
+            self._on_done()
+
+        threading.Thread(target=run, name=f"startup-{name}", daemon=True).start()
+        return future
+
+    def seal(self):
+        """
+        Marks every component as submitted; the breakdown is logged once they are all done.
+        """
+        self._sealed = True
+        self._on_done()
+
+    def get(self, name, timeout=None):
+        return self._futures[name].result(timeout)
+
+    def wait(self, timeout=None):
+        """
+        Waits until every component is loaded or failed. Returns False on timeout.
+        """
+        _, pending = concurrent.futures.wait(self._futures.values(), timeout=timeout)
+        return not pending
+
+    def errors(self):
+        return {
+            name: f"{type(future.exception()).__name__}: {future.exception()}"
+            for name, future in self._futures.items() if future.done() and future.exception() is not None
+        }
+
+    def ready(self):
+        return all(future.done() for future in self._futures.values()) and not self.errors()
+
+    def status(self):
+        errors = self.errors()
+        components = {}
+        for name, future in self._futures.items():
+            state = "failed" if name in errors else "ready" if future.done() else "loading"
+            components[name] = {"state": state}
+            if name in self._timings:
+                components[name]["started_at"], components[name]["seconds"] = self._timings[name]
+            if name in errors:
+                components[name]["error"] = errors[name]
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        return {"ready": self.ready(), "elapsed": elapsed, "components": components}
+
+    def report(self):
+        """
+        Start-up time breakdown: when each component started and how long it took.
+        """
+        status = self.status()
+        lines = [f"Start-up {'finished' if status['ready'] else 'ended'} in {status['elapsed']:.2f}s "
+                 f"(components sum to {sum(seconds for _, seconds in self._timings.values()):.2f}s)"]
+        for name, component in sorted(status["components"].items(), key=lambda item: item[1].get("started_at", 0)):
+            if "seconds" in component:
+                lines.append(f"  {name:<12} {component['state']:<7} +{component['started_at']:.2f}s  {component['seconds']:.2f}s")
+            else:
+                lines.append(f"  {name:<12} {component['state']}")
+        return "\n".join(lines)
+
+    def _on_done(self):
+        with self._lock:
+            if self._sealed and self.finished is None and all(future.done() for future in self._futures.values()):
+                self.finished = time.perf_counter()
+                self.logger.info(self.report())
@@ -0,0 +1,150 @@
+import argparse
+import hashlib
+import json
+import time
+import uuid
+from typing import Any, List
+
+import numpy as np
+from flask import Flask, Response, jsonify, request
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.embeddings import BaseEmbedding
+
+
+class StubEmbedding(BaseEmbedding):
+    """
+    Feature-hashed bag of character bigrams, L2-normalized. Similar texts get similar
+    vectors, so retrieval still returns plausible nodes; `delay` simulates model time.
+    """
+    _dim: int = PrivateAttr()
+    _delay: float = PrivateAttr()
+
+    def __init__(self, embed_dim: int = 1024, delay: float = 0.0, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._dim = embed_dim
+        self._delay = delay
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "stub_embedding"
+
+    def embed(self, text: str) -> np.ndarray:
+        if self._delay:
+            time.sleep(self._delay)
+        vector = np.zeros(self._dim, dtype=np.float32)
+        text = " ".join(text.split())
+        for i in range(max(len(text) - 1, 1)):
+            digest = hashlib.blake2b(text[i:i + 2].encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest, "little")
+            vector[bucket % self._dim] += 1.0 if bucket >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get_text_embedding_array(self, texts: List[str], dtype=np.float32) -> np.ndarray:
+        if not texts:
+            return np.empty((0, self._dim), dtype=dtype)
+        return np.stack([self.embed(text) for text in texts]).astype(dtype, copy=False)
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self.embed(query).tolist()
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self.embed(text).tolist()
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embedding(text)
+
+
+STUB_ANSWER = (
+    "관련 법령과 판례를 종합하면, 질문하신 사안은 계약의 내용과 당사자의 귀책사유에 따라 "
+    "판단이 달라질 수 있습니다. 구체적인 사실관계를 확인한 뒤 전문가와 상담하시기 바랍니다."
+)
+
+
+def create_stub_llm_app(ttft=0.2, tokens_per_second=30.0, max_tokens=256):
+    """
+    OpenAI-compatible /v1/chat/completions and /v1/completions that answer with
+    STUB_ANSWER, one character per token, after `ttft` seconds.
+    """
+    stub_app = Flask(__name__)
+
+    def answer_tokens(data):
+        limit = min(data.get("max_tokens") or max_tokens, max_tokens)
+        return list(STUB_ANSWER * (limit // len(STUB_ANSWER) + 1))[:limit]
+
+    def chunk(completion_id, model, chat, text=None, finish_reason=None):
+        if chat:
+            choice = {"index": 0, "delta": {} if text is None else {"role": "assistant", "content": text}}
+        else:
+            choice = {"index": 0, "text": text or ""}
+        choice["finish_reason"] = finish_reason
+        kind = "chat.completion.chunk" if chat else "text_completion"
+        return json.dumps({"id": completion_id, "object": kind, "created": int(time.time()), "model": model, "choices": [choice]})
+
+    def complete(chat):
+        data = request.get_json(force=True)
+        model = data.get("model", "stub")
+        tokens = answer_tokens(data)
+        completion_id = f"stub-{uuid.uuid4().hex}"
+        prompt_tokens = len(json.dumps(data.get("messages") or data.get("prompt") or "", ensure_ascii=False))
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens), "total_tokens": prompt_tokens + len(tokens)}
+
+        if not data.get("stream"):
+            time.sleep(ttft + len(tokens) / tokens_per_second)
+            text = "".join(tokens)
+            choice = {"index": 0, "finish_reason": "stop"}
+            if chat:
+                choice["message"] = {"role": "assistant", "content": text}
+            else:
+                choice["text"] = text
+            return jsonify({
+                "id": completion_id, "object": "chat.completion" if chat else "text_completion",
+                "created": int(time.time()), "model": model, "choices": [choice], "usage": usage,
+            })
+
+        def generate():
+            time.sleep(ttft)
+            for token in tokens:
+                yield f"data: {chunk(completion_id, model, chat, token)}\n\n"
+                time.sleep(1.0 / tokens_per_second)
+            yield f"data: {chunk(completion_id, model, chat, finish_reason='stop')}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return Response(generate(), content_type="text/event-stream")
+
+    @stub_app.route("/v1/chat/completions", methods=["POST"])
+    def chat_completions():
+        return complete(chat=True)
+
+    @stub_app.route("/v1/completions", methods=["POST"])
+    def completions():
+        return complete(chat=False)
+
+    @stub_app.route("/v1/models", methods=["GET"])
+    def models():
+        return jsonify({"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "stub"}]})
+
+    return stub_app
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Stub OpenAI-compatible LLM server")
+    parser.add_argument("--host", type=str, default="0.0.0.0", help="Host to run the stub server")
+    parser.add_argument("--port", type=int, default=8000, help="Port to run the stub server (vLLM's by default)")
+    parser.add_argument("--ttft", type=float, default=0.2, help="Seconds before the first token")
+    parser.add_argument("--tokens_per_second", type=float, default=30.0, help="Decode speed of each stream")
+    parser.add_argument("--max_tokens", type=int, default=256, help="Upper bound of tokens per answer")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    stub_app = create_stub_llm_app(ttft=args.ttft, tokens_per_second=args.tokens_per_second, max_tokens=args.max_tokens)
+    stub_app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
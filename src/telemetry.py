@@ -0,0 +1,199 @@
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from llama_index.core.chat_engine import CondensePlusContextChatEngine
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.instrumentation.events.embedding import EmbeddingEndEvent, EmbeddingStartEvent
+from llama_index.core.storage.docstore.simple_docstore import SimpleDocumentStore
+from llama_index.vector_stores.faiss import FaissVectorStore
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+
+
+# /query 한 번의 단계: queue_wait -> condense -> retrieve (query_embedding, faiss_search, docstore_fetch)
+# -> prompt_build -> time_to_first_token -> stream, 전체는 total
+STAGES = (
+    "queue_wait", "condense", "query_embedding", "faiss_search", "docstore_fetch", "retrieve",
+    "prompt_build", "time_to_first_token", "stream", "total",
+)
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+STAGE_SECONDS = Histogram(
+    "rag_query_stage_seconds", "Time spent in each stage of a /query request", ["stage"], buckets=STAGE_BUCKETS,
+)
+QUERY_REQUESTS = Counter("rag_query_requests_total", "Finished /query requests", ["status"])
+
+METRICS_CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+_current_trace = contextvars.ContextVar("rag_query_trace", default=None)
+
+
+class RequestTrace:
+    """
+    The stages timed during one /query request, relative to its start.
+    """
+    def __init__(self, request_id, **attributes):
+        self.request_id = request_id
+        self.attributes = attributes
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.spans = []
+        self.status = "ok"
+        self._lock = threading.Lock()
+
+    def record(self, stage, start, duration):
+        with self._lock:
+            self.spans.append((stage, start - self.start, duration))
+
+    def to_dict(self):
+        with self._lock:
+            spans = [
+                {"stage": stage, "offset_ms": round(offset * 1000, 3), "duration_ms": round(duration * 1000, 3)}
+                for stage, offset, duration in self.spans
+            ]
+        return {
+            "request_id": self.request_id,
+            "started_at": self.started_at,
+            "status": self.status,
+            **self.attributes,
+            "spans": spans,
+        }
+
+
+def observe(stage, duration, start=None, trace=None):
+    STAGE_SECONDS.labels(stage).observe(duration)
+    trace = trace or _current_trace.get()
+    if trace is not None:
+        trace.record(stage, time.perf_counter() - duration if start is None else start, duration)
+
+
+@contextmanager
+def stage(name, trace=None):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, start, trace)
+
+
+@contextmanager
+def activate(trace):
+    """
+    Makes `trace` the one stages are recorded to in this thread (and in contexts copied from it).
+    """
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def finish(trace, status="ok"):
+    trace.status = status
+    QUERY_REQUESTS.labels(status).inc()
+
+
+def render_metrics():
+    return generate_latest()
+
+
+class TraceExporter:
+    """
+    Appends finished request traces to a JSONL file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, trace):
+        line = json.dumps(trace.to_dict(), ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class EmbeddingTimer(BaseEventHandler):
+    """
+    Times embed model calls from llama-index's instrumentation events. The server only
+    embeds queries, so every call is recorded as query_embedding.
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._started = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls):
+        return "EmbeddingTimer"
+
+    def handle(self, event, **kwargs):
+        if isinstance(event, EmbeddingStartEvent):
+            with self._lock:
+                self._started[event.span_id] = time.perf_counter()
+        elif isinstance(event, EmbeddingEndEvent):
+            with self._lock:
+                start = self._started.pop(event.span_id, None)
+            if start is not None:
+                observe("query_embedding", time.perf_counter() - start, start)
+
+
+_embedding_timer = None
+
+
+def install_embedding_timer():
+    global _embedding_timer
+    if _embedding_timer is None:
+        _embedding_timer = EmbeddingTimer()
+        get_dispatcher().add_event_handler(_embedding_timer)
+
+
+class TimedFaissVectorStore(FaissVectorStore):
+    def query(self, query, **kwargs):
+        with stage("faiss_search"):
+            return super().query(query, **kwargs)
+
+
+class TimedDocumentStore(SimpleDocumentStore):
+    def get_nodes(self, node_ids, raise_error=True):
+        with stage("docstore_fetch"):
+            return super().get_nodes(node_ids, raise_error=raise_error)
+
+
+class InstrumentedChatEngine(CondensePlusContextChatEngine):
+    """
+    CondensePlusContextChatEngine that times the condense LLM call and the retrieval.
+    Whatever else stream_chat spends before returning (memory, packing the context
+    into the prompt) is recorded as prompt_build; the answer is only requested from
+    the LLM once its stream is read.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._timed = 0.0
+
+    def _condense_question(self, chat_history, latest_message):
+        start = time.perf_counter()
+        try:
+            return super()._condense_question(chat_history, latest_message)
+        finally:
+            self._record("condense", start)
+
+    def _get_nodes(self, message):
+        start = time.perf_counter()
+        try:
+            return super()._get_nodes(message)
+        finally:
+            self._record("retrieve", start)
+
+    def _record(self, name, start):
+        duration = time.perf_counter() - start
+        self._timed += duration
+        observe(name, duration, start)
+
+    def stream_chat(self, message, chat_history=None):
+        self._timed = 0.0
+        start = time.perf_counter()
+        response = super().stream_chat(message, chat_history)
+        observe("prompt_build", max(time.perf_counter() - start - self._timed, 0.0))
+        return response
@@ -1,31 +1,111 @@
 import os
-from typing import Any, List
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
+import numpy as np
+import torch
 from llama_index.core.bridge.pydantic import PrivateAttr
 from llama_index.core.embeddings import BaseEmbedding
 
-from transformers import AutoTokenizer 
-from optimum.rbln import RBLNXLMRobertaModel
+from transformers import AutoModel, AutoTokenizer
+
+try:
+    from optimum.rbln import RBLNXLMRobertaModel
+except ImportError:
+    RBLNXLMRobertaModel = None
+
+
+class CPUXLMRobertaModel:
+    """
+    XLM-RoBERTa on CPU with transformers, called like RBLNXLMRobertaModel, for machines
+    without an NPU (benchmarks, development). Any batch size and length is accepted.
+    """
+    def __init__(self, model):
+        self._model = model
+
+    @classmethod
+    def from_pretrained(cls, model_id, **kwargs):
+        return cls(AutoModel.from_pretrained(model_id).eval())
+
+    def __call__(self, input_ids, attention_mask):
+        with torch.no_grad():
+            return self._model(input_ids=input_ids, attention_mask=attention_mask)
+
+
+def load_sparse_linear(path):
+    """
+    Loads BGE-M3's sparse head (sparse_linear.pt, a Linear(hidden_size, 1) state dict).
+    """
+    state_dict = torch.load(path, map_location="cpu")
+    sparse_linear = torch.nn.Linear(state_dict["weight"].shape[1], 1)
+    sparse_linear.load_state_dict(state_dict)
+    sparse_linear.eval()
+    return sparse_linear
 
 
 class RBLNBGEM3Embeddings(BaseEmbedding):
-    _model: RBLNXLMRobertaModel = PrivateAttr()
+    _model: Any = PrivateAttr()
+    _batch_size: int = PrivateAttr(default=1)
+    _max_seq_len: int = PrivateAttr(default=8192)
+    _tokenizer_pool: Optional[ThreadPoolExecutor] = PrivateAttr(default=None)
+    _input_buffers: List[Tuple[np.ndarray, np.ndarray]] = PrivateAttr(default_factory=list)
+    _pipeline_lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _sparse_linear: Optional[torch.nn.Linear] = PrivateAttr(default=None)
+    _unused_tokens: set = PrivateAttr(default_factory=set)
 
     def __init__(
         self,
         rbln_compiled_model_name: str = "bge-m3",
+        return_sparse: bool = False,
+        device: str = "rbln",
+        batch_size: int = 1,
+        max_seq_len: int = 8192,
+        tokenizer_workers: int = 1,
+        pipeline_batches: int = 16,
         **kwargs: Any,
         ) -> None:
         super().__init__(**kwargs)
-        # TODO: implement batch size > 1
-        self.embed_batch_size = 1
-        
-        self._model = RBLNXLMRobertaModel.from_pretrained(
-            model_id=os.path.join("models", os.path.basename(rbln_compiled_model_name)),
-            export=False,
-        )
+        # The compiled model takes exactly batch_size x max_seq_len inputs (see compile_bge.py).
+        # llama-index hands over pipeline_batches device batches at once, so that the next
+        # batch is tokenized while the device runs the current one
+        self.embed_batch_size = batch_size * pipeline_batches
+        self._batch_size = batch_size
+        self._max_seq_len = max_seq_len
+        if tokenizer_workers > 0:
+            self._tokenizer_pool = ThreadPoolExecutor(max_workers=tokenizer_workers, thread_name_prefix="tokenizer")
+            # One buffer per batch being tokenized, plus the one on the device
+            self._input_buffers = [self._new_input_buffers() for _ in range(tokenizer_workers + 1)]
+
+        if device == "cpu":
+            # rbln_compiled_model_name is then a HuggingFace model id or directory
+            model_dir = rbln_compiled_model_name
+            self._model = CPUXLMRobertaModel.from_pretrained(model_dir)
+        else:
+            if RBLNXLMRobertaModel is None:
+                raise ImportError("optimum-rbln is not installed, use device='cpu' on machines without an NPU")
+            model_dir = os.path.join("models", os.path.basename(rbln_compiled_model_name))
+            self._model = RBLNXLMRobertaModel.from_pretrained(
+                model_id=model_dir,
+                export=False,
+            )
         self._tokenizer = AutoTokenizer.from_pretrained(rbln_compiled_model_name)
 
+        if return_sparse:
+            # Lexical weights come from the same last hidden state as the dense CLS vector,
+            # so they cost a small CPU projection instead of a second NPU call
+            sparse_linear_path = os.path.join(model_dir, "sparse_linear.pt")
+            if device == "cpu" and not os.path.exists(sparse_linear_path):
+                from huggingface_hub import hf_hub_download
+                sparse_linear_path = hf_hub_download(repo_id=model_dir, filename="sparse_linear.pt")
+            self._sparse_linear = load_sparse_linear(sparse_linear_path)
+            self._unused_tokens = {
+                self._tokenizer.cls_token_id,
+                self._tokenizer.eos_token_id,
+                self._tokenizer.pad_token_id,
+                self._tokenizer.unk_token_id,
+            }
+
     @classmethod
     def class_name(cls) -> str:
         return "rbln_bge_m3"
@@ -36,19 +116,155 @@ class RBLNBGEM3Embeddings(BaseEmbedding):
     async def _aget_text_embedding(self, text: str) -> List[float]:
         return self._get_text_embedding(text)
 
+    # _encode_batch is split into these steps so that benchmarks can time each of them
+    def _tokenize(self, texts: List[str]):
+        # One fast-tokenizer call per batch, padded to the longest text only;
+        # _stage_inputs pads up to the compiled shape
+        return self._tokenizer(
+            texts, padding="longest", truncation=True, max_length=self._max_seq_len, return_tensors="np",
+        )
+
+    def _new_input_buffers(self) -> Tuple[np.ndarray, np.ndarray]:
+        shape = (self._batch_size, self._max_seq_len)
+        return np.empty(shape, dtype=np.int64), np.empty(shape, dtype=np.int64)
+
+    def _stage_inputs(self, encoded, buffers=None) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Copies tokenized inputs into contiguous int64 tensors of the compiled shape,
+        padded with empty rows up to the batch size. `buffers` are reused if given.
+        """
+        input_ids, attention_mask = buffers if buffers is not None else self._new_input_buffers()
+        rows, length = encoded["input_ids"].shape
+        input_ids[:rows, :length] = encoded["input_ids"]
+        input_ids[:rows, length:] = self._tokenizer.pad_token_id
+        input_ids[rows:] = self._tokenizer.pad_token_id
+        attention_mask[:rows, :length] = encoded["attention_mask"]
+        attention_mask[:rows, length:] = 0
+        attention_mask[rows:] = 0
+        # Zero-copy views of the buffers
+        return torch.from_numpy(input_ids), torch.from_numpy(attention_mask)
+
+    def _prepare(self, texts: List[str], buffers) -> Tuple[torch.Tensor, torch.Tensor]:
+        return self._stage_inputs(self._tokenize(texts), buffers)
+
+    def _forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        return self._model(input_ids, attention_mask)[0]
+
+    @staticmethod
+    def _dense_to_host(hidden_states: torch.Tensor, rows: int) -> np.ndarray:
+        # CLS vectors; stay in NumPy, Python floats are only made at the llama-index boundary below
+        return hidden_states[:rows, 0].detach().cpu().numpy().astype(np.float32, copy=False)
+
+    def _encode_batch(self, texts: List[str]) -> Tuple[np.ndarray, Optional[List[Dict[int, float]]]]:
+        """
+        Encodes up to batch_size texts; returns (len(texts), dim) dense vectors and the
+        sparse weights of each text, or None unless the model returns sparse weights.
+        """
+        return self._run_batch(texts, *self._prepare(texts, None))
+
+    def _run_batch(self, texts, input_ids, attention_mask) -> Tuple[np.ndarray, Optional[List[Dict[int, float]]]]:
+        hidden_states = self._forward(input_ids, attention_mask)
+        dense = self._dense_to_host(hidden_states, len(texts))
+        if self._sparse_linear is None:
+            return dense, None
+        return dense, [
+            self._sparse_weights(hidden_states[i], input_ids[i], attention_mask[i]) for i in range(len(texts))
+        ]
+
+    def _encode_batches(self, texts: List[str]) -> Iterator[Tuple[int, np.ndarray, Optional[List[Dict[int, float]]]]]:
+        """
+        Yields (start, dense, sparse) for every device batch of texts. With a tokenizer
+        pool, the next batches are tokenized into the other preallocated buffers while
+        the device runs the current one (double buffering).
+        """
+        starts = range(0, len(texts), self._batch_size)
+        if self._tokenizer_pool is None or len(starts) < 2:
+            for start in starts:
+                yield (start, *self._encode_batch(texts[start:start + self._batch_size]))
+            return
+
+        # The buffers are shared, so one pipeline at a time (e.g. not two builders' threads)
+        with self._pipeline_lock:
+            buffers = self._input_buffers
+            depth = len(buffers) - 1
+            futures = {}
+
+            def submit(i):
+                if i < len(starts):
+                    batch = texts[starts[i]:starts[i] + self._batch_size]
+                    futures[i] = self._tokenizer_pool.submit(self._prepare, batch, buffers[i % len(buffers)])
+
+            try:
+                for i in range(depth):
+                    submit(i)
+                for i, start in enumerate(starts):
+                    input_ids, attention_mask = futures.pop(i).result()
+                    # Buffer (i + depth) % len(buffers) was used by batch i - 1, which is done
+                    submit(i + depth)
+                    yield (start, *self._run_batch(texts[start:start + self._batch_size], input_ids, attention_mask))
+            finally:
+                # Stopped early: let running tokenizations finish before the buffers are reused
+                for future in futures.values():
+                    future.cancel()
+                wait(futures.values())
+
+    def _encode(self, text: str) -> Tuple[np.ndarray, Optional[Dict[int, float]]]:
+        dense, sparse = self._encode_batch([text])
+        return dense[0], None if sparse is None else sparse[0]
+
+    def _sparse_weights(self, hidden_states, input_ids, attention_mask) -> Dict[int, float]:
+        """
+        BGE-M3 lexical weights: relu(sparse_linear(h)) per token, max-pooled over repeated tokens.
+        """
+        mask = attention_mask.bool()
+        with torch.no_grad():
+            weights = torch.relu(self._sparse_linear(hidden_states[mask].float())).squeeze(-1)
+        sparse = {}
+        for token_id, weight in zip(input_ids[mask].tolist(), weights.tolist()):
+            if token_id in self._unused_tokens or weight <= 0:
+                continue
+            if weight > sparse.get(token_id, 0.0):
+                sparse[token_id] = weight
+        return sparse
+
+    def get_dense_sparse_embedding(self, text: str) -> Tuple[np.ndarray, Optional[Dict[int, float]]]:
+        """
+        Returns (dense, sparse) from one forward pass; dense is a float32 array and sparse
+        is {token id: weight}, or None unless the model was created with return_sparse=True.
+        """
+        return self._encode(text)
+
+    def get_text_embedding_array(self, texts: List[str], dtype=np.float32) -> np.ndarray:
+        """
+        Embeds texts into one contiguous (len(texts), dim) array, e.g. for faiss.Index.add.
+        """
+        embeddings = None
+        for start, dense, _ in self._encode_batches(texts):
+            if embeddings is None:
+                embeddings = np.empty((len(texts), dense.shape[1]), dtype=dtype)
+            embeddings[start:start + len(dense)] = dense
+        return embeddings if embeddings is not None else np.empty((0, 0), dtype=dtype)
+
+    def iter_dense_sparse_batches(
+        self, texts: List[str],
+    ) -> Iterator[Tuple[int, np.ndarray, Optional[List[Dict[int, float]]]]]:
+        """
+        Yields (start, dense, sparse) per device batch of texts, from one forward pass each;
+        sparse is None unless the model was created with return_sparse=True.
+        """
+        return self._encode_batches(texts)
+
     def _get_query_embedding(self, query: str) -> List[float]:
-        input = self._tokenizer(query, padding="max_length", return_tensors="pt", max_length=8192)
-        result = self._model(input.input_ids, input.attention_mask)[0][:,0]
-        return result.tolist()[0]
+        dense, _ = self._encode(query)
+        return dense.tolist()
 
     def _get_text_embedding(self, text: str) -> List[float]:
-        input = self._tokenizer(text, padding="max_length", return_tensors="pt", max_length=8192)
-        result = self._model(input.input_ids, input.attention_mask)[0][:,0]
-        return result.tolist()[0]
+        dense, _ = self._encode(text)
+        return dense.tolist()
 
     def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
-        # TODO: Hard coded to assume that batch size is 1!
-        # This has to be fixed at some point...
-        input = self._tokenizer(texts[0], padding="max_length", return_tensors="pt", max_length=8192)
-        result = self._model(input.input_ids, input.attention_mask)[0][:,0]
-        return result.tolist()
+        # llama-index calls this with up to embed_batch_size (pipeline_batches device batches) texts
+        embeddings = []
+        for _, dense, _ in self._encode_batches(texts):
+            embeddings.extend(dense.tolist())
+        return embeddings
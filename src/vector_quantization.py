@@ -0,0 +1,65 @@
+import os
+
+import faiss
+import numpy as np
+
+
+VECTOR_DTYPES = ["float32", "float16", "int8"]
+
+QTYPES = {
+    "float16": faiss.ScalarQuantizer.QT_fp16,
+    "int8": faiss.ScalarQuantizer.QT_8bit,
+}
+
+# FaissVectorStore's persist file name inside a storage context directory
+VECTOR_STORE_FNAME = "default__vector_store.json"
+
+
+def create_faiss_index(d, M, vector_dtype="float32"):
+    """
+    Creates the HNSW index the builders add to. float16 codes need no training and are
+    stored from the start; int8 needs the vectors to train on, see quantize_index.
+    """
+    if vector_dtype == "float16":
+        return faiss.IndexHNSWSQ(d, QTYPES["float16"], M)
+    return faiss.IndexHNSWFlat(d, M)
+
+
+def index_vector_dtype(faiss_index):
+    faiss_index = faiss.downcast_index(faiss_index)
+    if isinstance(faiss_index, faiss.IndexHNSWSQ):
+        qtype = faiss.downcast_index(faiss_index.storage).sq.qtype
+        for vector_dtype, candidate in QTYPES.items():
+            if qtype == candidate:
+                return vector_dtype
+    return "float32"
+
+
+def quantize_index(faiss_index, vector_dtype, M, batch_size=65536):
+    """
+    Rebuilds an HNSW index over scalar-quantized codes that FAISS searches directly.
+    Rows keep their order, since FaissVectorStore ids are row positions.
+    """
+    faiss_index = faiss.downcast_index(faiss_index)
+    if vector_dtype == "float32" or index_vector_dtype(faiss_index) == vector_dtype:
+        return faiss_index
+
+    vectors = faiss_index.reconstruct_n(0, faiss_index.ntotal)
+    quantized = faiss.IndexHNSWSQ(faiss_index.d, QTYPES[vector_dtype], M)
+    quantized.hnsw.efConstruction = faiss_index.hnsw.efConstruction
+    quantized.train(vectors)
+    for start in range(0, len(vectors), batch_size):
+        quantized.add(np.ascontiguousarray(vectors[start:start + batch_size]))
+    return quantized
+
+
+def persist_quantized(faiss_index, persist_dir, vector_dtype, M):
+    """
+    Overwrites the persisted vector store of a storage context with its quantized index.
+    Returns the index that was written.
+    """
+    quantized = quantize_index(faiss_index, vector_dtype, M)
+    persist_path = os.path.join(persist_dir, VECTOR_STORE_FNAME)
+    faiss.write_index(quantized, f"{persist_path}.part")
+    os.replace(f"{persist_path}.part", persist_path)
+    return quantized
@@ -1,6 +1,5 @@
 from llama_index.core import (
     SimpleDirectoryReader,
-    VectorStoreIndex,
     StorageContext
 )
 
@@ -8,9 +7,16 @@ from llama_index.vector_stores.faiss import FaissVectorStore
 from llama_index.core.storage.index_store.simple_index_store import SimpleIndexStore
 from llama_index.core.storage.docstore.simple_docstore import SimpleDocumentStore
 from utils import RBLNBGEM3Embeddings
+from legal_chunker import LegalStructureSplitter
+from sparse_index import SparseInvertedIndex, SparseVectorStoreIndex
+from vector_quantization import VECTOR_DTYPES, create_faiss_index, persist_quantized
+from incremental_index import IncrementalVectorStoreIndex, PreviousIndex, new_storage_context
+from preprocess.corpus_store import load_documents
+from preprocess.crawl_manifest import load_applied_changes, read_changes, save_applied_changes
+from preprocess.postprocess_law_data import materialize_texts
 
 from absl import app, flags, logging
-import faiss
+from transformers import AutoTokenizer
 import os
 import json
 
@@ -23,8 +29,14 @@ flags.DEFINE_string("vector_store_dir", "law_data", "Directory to the vector sto
 flags.DEFINE_string("compiled_embedding_model", "bge-m3", "Directory to compiled HuggingFace embedding model")
 flags.DEFINE_bool("debug", True, "Enable debug level logging")
 flags.DEFINE_bool("load_from_storage", False, "Load storage context from the storage")
-flags.DEFINE_integer("chunk_size", 1024, "Text chunk size")
-flags.DEFINE_integer("chunk_overlap_size", 100, "Text chunk overlap size")
+flags.DEFINE_integer("chunk_size", 1024, "Token budget of a chunk; statutes and cases are split on their structure and packed up to it")
+flags.DEFINE_integer("chunk_overlap_size", 100, "Token overlap, only used when a single sentence exceeds chunk_size")
+flags.DEFINE_string("corpus_dir", "", "Root of the columnar corpus; when set, documents are read from it instead of json_merge")
+flags.DEFINE_list("corpus_sources", ["law"], "Corpus sources to index")
+flags.DEFINE_bool("sparse", False, "Also persist BGE-M3 lexical (sparse) weights as an inverted index, from the same forward pass")
+flags.DEFINE_list("changes", [], "changes.json logs of the crawlers; with --corpus_dir and --load_from_storage, only the laws/cases changed since the runs this index has applied are re-embedded and every other node keeps its stored vector")
+flags.DEFINE_enum("vector_dtype", "float32", VECTOR_DTYPES, "Persisted vector precision; float16/int8 are scalar-quantized codes that FAISS searches directly")
+flags.DEFINE_enum("node_entries", "filtered", ["original", "filtered"], "Entry set to index from law node shards")
 
 
 from llama_index.core.schema import Document
@@ -34,11 +46,38 @@ from llama_index.core.schema import Document
 def load_json_files(folder_path):
     """
     Load and process JSON files in the given folder.
-    Assumes each JSON contains a list of {"title": ..., "content": ...}.
+    Assumes each JSON contains a list of {"title": ..., "content": ...},
+    and each JSONL line (e.g. postprocess_law_data.py --format jsonl shards) one such item.
     """
     documents = []
     for filename in os.listdir(folder_path):
-        if filename.endswith(".json"):
+        if filename.endswith(".jsonl"):
+            file_path = os.path.join(folder_path, filename)
+            nodes = {}
+            with open(file_path, "r", encoding="utf-8") as f:
+                for line_number, line in enumerate(f, 1):
+                    try:
+                        item = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        logging.error(f"JSON 디코딩 오류 발생: {filename}:{line_number} - {e}")
+                        continue
+                    if "parent" in item:
+                        nodes[item["id"]] = item
+                    elif "content" in item and "title" in item:
+                        documents.append(Document(
+                            text=item["content"],
+                            metadata={"title": item["title"]}
+                        ))
+            # Node shards (--context parent) only store each node's own text;
+            # the full context is joined from the parent chain here
+            texts = materialize_texts(nodes)
+            for node_id, node in nodes.items():
+                if node.get(FLAGS.node_entries):
+                    documents.append(Document(
+                        text=texts[node_id].replace('\t\t', '\t'),
+                        metadata={"title": node["title"]}
+                    ))
+        elif filename.endswith(".json"):
             file_path = os.path.join(folder_path, filename)
             try:
                 with open(file_path, "r", encoding="utf-8") as f:
@@ -55,12 +94,32 @@ def load_json_files(folder_path):
     return documents
 
 
-def process_subfolder(subfolder_path, storage_context, embedding_model):
+def process_subfolder(subfolder_path, storage_context, embedding_model, text_splitter, sparse_index=None):
     documents = load_json_files(subfolder_path)
-    index = VectorStoreIndex.from_documents(documents, storage_context=storage_context, embed_model=embedding_model, show_progress=True, insert_batch_size=65536)
+    index = SparseVectorStoreIndex.from_documents(documents, storage_context=storage_context, embed_model=embedding_model, transformations=[text_splitter], show_progress=True, insert_batch_size=65536, sparse_index=sparse_index)
     index.storage_context.persist(persist_dir=FLAGS.vector_store_dir)
     return storage_context
 
+def load_sparse_index():
+    # Sparse weights are added under each node's id while its insert batch is embedded
+    if not FLAGS.sparse:
+        return None
+    if FLAGS.load_from_storage and SparseInvertedIndex.exists(FLAGS.vector_store_dir):
+        return SparseInvertedIndex.from_persist_dir(FLAGS.vector_store_dir)
+    return SparseInvertedIndex()
+
+def persist_sparse_index(sparse_index):
+    if sparse_index is None:
+        return
+    sparse_index.save(FLAGS.vector_store_dir)
+    logging.info(f"Saved sparse weights of {len(sparse_index)} nodes")
+
+def persist_vector_dtype(storage_context, M):
+    # float16 is stored as such from the start; int8 codes are trained on the finished index
+    if FLAGS.vector_dtype != "float32":
+        persist_quantized(storage_context.vector_store.client, FLAGS.vector_store_dir, FLAGS.vector_dtype, M)
+        logging.info(f"Persisted {FLAGS.vector_dtype} vectors")
+
 def main(argv):
     del argv
 
@@ -70,10 +129,10 @@ def main(argv):
         logging.set_verbosity(logging.INFO)
     
 
-    embedding_model = RBLNBGEM3Embeddings(rbln_compiled_model_name=FLAGS.compiled_embedding_model)
+    embedding_model = RBLNBGEM3Embeddings(rbln_compiled_model_name=FLAGS.compiled_embedding_model, return_sparse=FLAGS.sparse)
     d = 1024
     M = 32
-    faiss_index = faiss.IndexHNSWFlat(d, M)
+    faiss_index = create_faiss_index(d, M, FLAGS.vector_dtype)
 
     if FLAGS.load_from_storage:
         logging.debug('Loading from existing storage context...')
@@ -88,6 +147,49 @@ def main(argv):
         vector_store = FaissVectorStore(faiss_index=faiss_index)
         storage_context = StorageContext.from_defaults(vector_store=vector_store)
 
+    # FAISS HNSW는 삭제가 안 되므로, 바뀌지 않은 node의 vector로 새 index를 만들고 바뀐 항목만 다시 임베딩
+    # 변경 로그는 여러 index/shard가 같이 읽으므로, 각 index가 반영한 마지막 run을 자기 디렉토리에 기록
+    previous = None
+    applied = None
+    if FLAGS.changes:
+        if not FLAGS.corpus_dir:
+            raise app.UsageError("--changes follows the crawlers' change logs for an index built from --corpus_dir")
+        # 전체 빌드는 현재 corpus를 모두 담으므로 로그의 마지막 run까지 반영한 것으로 기록
+        updated, removed, applied = read_changes(FLAGS.changes, load_applied_changes(FLAGS.vector_store_dir) if FLAGS.load_from_storage else None)
+        if FLAGS.load_from_storage:
+            if not updated and not removed:
+                logging.info(f"{FLAGS.vector_store_dir} already includes every change in {', '.join(FLAGS.changes)}")
+                return
+            logging.info(f"{len(updated)} laws/cases updated, {len(removed)} removed since the last applied run")
+            previous = PreviousIndex.from_storage_context(storage_context, updated | removed)
+            storage_context = new_storage_context(faiss_index)
+
+    # 조/항/호, 판례 섹션 단위로 나눈 뒤 임베딩 모델 토큰 기준으로 chunk_size까지 묶음
+    text_splitter = LegalStructureSplitter(
+        chunk_size=FLAGS.chunk_size,
+        chunk_overlap=FLAGS.chunk_overlap_size,
+        tokenizer=AutoTokenizer.from_pretrained(FLAGS.compiled_embedding_model).tokenize,
+    )
+
+    sparse_index = load_sparse_index()
+    if previous is not None and sparse_index is not None:
+        sparse_index = sparse_index.select(previous.rows)
+
+    if FLAGS.corpus_dir:
+        logging.info(f"Loading corpus {FLAGS.corpus_dir} ({', '.join(FLAGS.corpus_sources)})")
+        if previous is not None:
+            documents = load_documents(FLAGS.corpus_dir, sources=FLAGS.corpus_sources, filtered_only=FLAGS.node_entries == "filtered", items=updated)
+            index = IncrementalVectorStoreIndex.from_changes(documents, previous, [text_splitter], storage_context=storage_context, embed_model=embedding_model, show_progress=True, insert_batch_size=65536, sparse_index=sparse_index)
+        else:
+            documents = load_documents(FLAGS.corpus_dir, sources=FLAGS.corpus_sources, filtered_only=FLAGS.node_entries == "filtered")
+            index = SparseVectorStoreIndex.from_documents(documents, storage_context=storage_context, embed_model=embedding_model, transformations=[text_splitter], show_progress=True, insert_batch_size=65536, sparse_index=sparse_index)
+        index.storage_context.persist(persist_dir=FLAGS.vector_store_dir)
+        persist_sparse_index(sparse_index)
+        persist_vector_dtype(storage_context, M)
+        if applied is not None:
+            save_applied_changes(FLAGS.vector_store_dir, applied)
+        return
+
     # Process each subfolder
     data_dir = os.path.join(FLAGS.vector_store_dir, "json_merge")
     logging.debug(f'Opening directory {data_dir}')
@@ -95,7 +197,9 @@ def main(argv):
         subfolder_path = os.path.join(data_dir, subfolder)
         if os.path.isdir(subfolder_path):
             logging.info(f"Processing subfolder {subfolder}")
-            vector_store = process_subfolder(subfolder_path, storage_context, embedding_model)
+            vector_store = process_subfolder(subfolder_path, storage_context, embedding_model, text_splitter, sparse_index)
+    persist_sparse_index(sparse_index)
+    persist_vector_dtype(storage_context, M)
 
 if __name__ == "__main__":
     app.run(main)
\ No newline at end of file